@@ -0,0 +1,58 @@
+"""
+Runs one command end to end in the current directory, answering its prompts
+from a script, and prints {"seconds": ..., "git_commands": ...} as JSON.
+The benchmark runner starts a fresh interpreter per run, so no cache,
+persistent git process or import survives from one run to the next.
+
+usage: python -m benchmarks.driver merge|cherry-pick|pull OPTIONS_JSON ANSWERS_JSON
+"""
+
+import contextlib
+import io
+import json
+import sys
+import time
+from unittest.mock import patch
+
+from cli import git_batch_cherry_picker, git_batch_merger, git_batch_puller
+from cli_utils import trace
+
+COMMANDS = {
+    "merge": git_batch_merger.git_batch_merger,
+    "cherry-pick": git_batch_cherry_picker.git_batch_cherry_picker,
+    "pull": git_batch_puller.git_batch_puller,
+}
+
+
+def scripted_input(answers: dict[str, list[str]]):
+    """
+    An input() replacement. Each prompt gets the next answer listed under
+    the first key it contains, or ENTER once those run out.
+    """
+    queues = {key: list(values) for key, values in answers.items()}
+
+    def answer(prompt: str = "") -> str:
+        for key, queue in queues.items():
+            if key in prompt:
+                return queue.pop(0) if queue else ""
+        return ""
+
+    return answer
+
+
+def main():
+    command, options, answers = sys.argv[1], *map(json.loads, sys.argv[2:4])
+    tracer = trace.start_tracing()
+    with patch("builtins.input", scripted_input(answers)), contextlib.redirect_stdout(
+        io.StringIO()
+    ):
+        started = time.perf_counter()
+        COMMANDS[command](**options)
+        seconds = time.perf_counter() - started
+    trace.stop_tracing()
+    git_commands = len(tracer.events)
+    print(json.dumps({"seconds": seconds, "git_commands": git_commands}))
+
+
+if __name__ == "__main__":
+    main()
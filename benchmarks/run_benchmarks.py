@@ -0,0 +1,268 @@
+"""
+End-to-end performance benchmarks for gitutils-merge, gitutils-cherry-pick
+and gitutils-batch-pull against synthetic repositories and a local bare origin.
+
+Every run gets freshly built repositories (not timed) and its own interpreter.
+Each scale times every command variant end to end (small: 5 branches / 10
+repositories, medium: 50 / 100, large: 500 / 1000). Results are written as
+JSON, which --compare checks against an earlier file so slowdowns are caught
+before upgrading: it exits with an error when a median is more than
+--threshold (default 20%) slower.
+
+usage (from the repository root):
+    python -m benchmarks.run_benchmarks --scale small medium --output results.json
+    python -m benchmarks.run_benchmarks --compare baseline.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+
+from benchmarks import synthetic
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_VERSION = 1
+
+
+@dataclass
+class Scale:
+    branches: int
+    repos: int
+
+
+SCALES = {
+    "small": Scale(branches=5, repos=10),
+    "medium": Scale(branches=50, repos=100),
+    "large": Scale(branches=500, repos=1000),
+}
+
+# benchmark -> variant -> keyword arguments of the command function
+VARIANTS = {
+    "merge": {
+        "checkout": {},
+        "in-memory": {"in_memory": True},
+        "preflight": {"preflight_check": True},
+    },
+    "cherry-pick": {
+        "checkout": {},
+        "worktrees": {"use_worktrees": True},
+        "in-memory": {"in_memory": True},
+    },
+    "pull": {
+        "serial": {"jobs": 1},
+        "parallel": {},
+    },
+}
+
+
+def isolate_environment(root: str) -> None:
+    """Keep the user's git config, hooks and caches out of the measurements"""
+    gitconfig = os.path.join(root, "gitconfig")
+    with open(gitconfig, "w", encoding="utf-8") as config_file:
+        config_file.write(
+            "[user]\n\tname = Benchmark\n\temail = benchmark@example.com\n"
+            "[advice]\n\tdetachedHead = false\n"
+        )
+    os.environ.update(
+        GIT_CONFIG_GLOBAL=gitconfig,
+        GIT_CONFIG_NOSYSTEM="1",
+        XDG_CACHE_HOME=os.path.join(root, "cache"),
+        PYTHONPATH=REPOSITORY_ROOT,
+    )
+
+
+def _answers(benchmark: str, fixture: synthetic.BranchFixture | None) -> dict:
+    """Prompt answers: the whole bench/* chain, reset to remote, skip conflicts"""
+    pattern = f"{synthetic.BRANCH_PREFIX}/*"
+    if benchmark == "merge":
+        return {
+            "first branch": ["master"],
+            "next branch": [pattern],
+            "Choose how": ["2"],
+        }
+    if benchmark == "cherry-pick":
+        return {
+            "commit id": [fixture.feature_commit],
+            "first branch": [pattern],
+            "Choose how": ["2"],
+        }
+    return {}
+
+
+def run_once(
+    benchmark: str, options: dict, size: int, arguments: argparse.Namespace
+) -> dict:
+    """Build fresh repositories, then time one run of the command in them"""
+    root = tempfile.mkdtemp(prefix="gitutils-bench-")
+    try:
+        if benchmark == "pull":
+            fixture = None
+            cwd = synthetic.build_pull_fixture(
+                root, size, arguments.commits, arguments.files
+            )
+        else:
+            fixture = synthetic.build_branch_fixture(
+                root, size, arguments.commits, arguments.files, arguments.conflict_every
+            )
+            cwd = fixture.work
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.driver",
+                benchmark,
+                json.dumps(options),
+                json.dumps(_answers(benchmark, fixture)),
+            ],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"{benchmark} failed:\n{process.stderr}")
+        return json.loads(process.stdout.splitlines()[-1])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def environment_info() -> dict:
+    def output(command: list[str]) -> str:
+        process = subprocess.run(
+            command, cwd=REPOSITORY_ROOT, capture_output=True, text=True
+        )
+        return process.stdout.strip() if process.returncode == 0 else "unknown"
+
+    return {
+        "gitutils": output(["git", "describe", "--always", "--dirty"]),
+        "git": output(["git", "--version"]),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(arguments: argparse.Namespace) -> dict:
+    results = []
+    for scale_name in arguments.scale:
+        scale = SCALES[scale_name]
+        for benchmark in arguments.benchmark:
+            size = scale.repos if benchmark == "pull" else scale.branches
+            for variant, options in VARIANTS[benchmark].items():
+                runs = [
+                    run_once(benchmark, options, size, arguments)
+                    for _ in range(arguments.repeat)
+                ]
+                seconds = [run["seconds"] for run in runs]
+                result = {
+                    "benchmark": benchmark,
+                    "variant": variant,
+                    "scale": scale_name,
+                    "size": size,
+                    "seconds": seconds,
+                    "min": min(seconds),
+                    "median": statistics.median(seconds),
+                    "git_commands": runs[0]["git_commands"],
+                }
+                results.append(result)
+                print(
+                    f"{benchmark:<12} {variant:<10} {scale_name:<7} {size:>6}  "
+                    f"median {result['median']:8.3f}s  min {result['min']:8.3f}s",
+                    flush=True,
+                )
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "environment": environment_info(),
+        "parameters": {
+            "commits": arguments.commits,
+            "files": arguments.files,
+            "conflict_every": arguments.conflict_every,
+            "repeat": arguments.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """
+    Print the change of every median against the baseline.
+    Returns False if any is slower by more than threshold (0.2 = 20%).
+    """
+    baseline_results = {
+        (result["benchmark"], result["variant"], result["scale"]): result
+        for result in baseline["results"]
+    }
+    print(f"\nCompared to {baseline['environment']['gitutils']}:")
+    passed = True
+    for result in current["results"]:
+        key = (result["benchmark"], result["variant"], result["scale"])
+        if key not in baseline_results:
+            continue
+        before = baseline_results[key]["median"]
+        change = result["median"] / before - 1 if before else 0.0
+        regressed = change > threshold
+        passed = passed and not regressed
+        print(
+            f"{' '.join(key):<32} {before:8.3f}s -> {result['median']:8.3f}s "
+            f"{change:+7.1%}{'  REGRESSION' if regressed else ''}"
+        )
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark gitutils commands against synthetic repositories."
+    )
+    parser.add_argument(
+        "--scale", nargs="+", choices=SCALES, default=["small", "medium"]
+    )
+    parser.add_argument(
+        "--benchmark", nargs="+", choices=VARIANTS, default=list(VARIANTS)
+    )
+    parser.add_argument("--commits", type=int, default=100, help="Commits on master")
+    parser.add_argument("--files", type=int, default=200, help="Files in the tree")
+    parser.add_argument(
+        "--conflict-every",
+        type=int,
+        default=10,
+        help="Every Nth branch conflicts (0 for none).",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument(
+        "--compare", metavar="BASELINE", help="Results file to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Slowdown of a median that counts as a regression (default: 0.2).",
+    )
+    arguments = parser.parse_args()
+    if arguments.repeat < 1 or arguments.commits < 1 or arguments.files < 1:
+        parser.error("--repeat, --commits and --files must be at least 1")
+
+    with tempfile.TemporaryDirectory(prefix="gitutils-bench-") as session:
+        isolate_environment(session)
+        results = run_benchmarks(arguments)
+    with open(arguments.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {arguments.output}")
+
+    if arguments.compare:
+        with open(arguments.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if not compare(baseline, results, arguments.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
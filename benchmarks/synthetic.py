@@ -0,0 +1,167 @@
+"""
+Synthetic repositories for the benchmarks.
+History is written with git fast-import and fixed timestamps, so the same
+parameters always give the same commit ids.
+"""
+
+import os
+import subprocess
+from dataclasses import dataclass
+
+AUTHOR = "Benchmark <benchmark@example.com>"
+EPOCH = 1700000000
+BRANCH_PREFIX = "bench"
+
+
+@dataclass
+class BranchFixture:
+    """A bare origin and a clone of it with master checked out"""
+
+    origin: str
+    work: str
+    branches: list[str]
+    feature_commit: str
+
+
+class FastImportStream:
+    """Builds a git fast-import stream"""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.marks = 0
+
+    def _data(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.chunks.append(b"data %d\n" % len(data) + data + b"\n")
+
+    def commit(
+        self,
+        ref: str,
+        message: str,
+        files: dict[str, str],
+        parent: str | None = None,
+    ) -> str:
+        """Add a commit writing files on top of parent. Returns its mark."""
+        self.marks += 1
+        mark = f":{self.marks}"
+        self.chunks.append(
+            f"commit {ref}\nmark {mark}\n"
+            f"committer {AUTHOR} {EPOCH + self.marks * 60} +0000\n".encode("utf-8")
+        )
+        self._data(message)
+        if parent:
+            self.chunks.append(f"from {parent}\n".encode("utf-8"))
+        for path, content in files.items():
+            self.chunks.append(f"M 100644 inline {path}\n".encode("utf-8"))
+            self._data(content)
+        self.chunks.append(b"\n")
+        return mark
+
+    def run(self, git_dir: str) -> None:
+        subprocess.run(
+            ["git", "fast-import", "--quiet"],
+            cwd=git_dir,
+            input=b"".join(self.chunks),
+            check=True,
+        )
+
+
+def git(*args: str, cwd: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _file_content(index: int, revision: int) -> str:
+    return "".join(
+        f"file {index} revision {revision} line {line}\n" for line in range(20)
+    )
+
+
+def _write_base_history(stream: FastImportStream, commits: int, files: int) -> str:
+    """master with a tree of `files` files and `commits` commits. Returns the tip mark."""
+    tree = {f"files/{index:05}.txt": _file_content(index, 0) for index in range(files)}
+    tree["shared.txt"] = "base\n"
+    tip = stream.commit("refs/heads/master", "Initial commit", tree)
+    for revision in range(1, commits):
+        index = revision % files
+        tip = stream.commit(
+            "refs/heads/master",
+            f"Change file {index}",
+            {f"files/{index:05}.txt": _file_content(index, revision)},
+            parent=tip,
+        )
+    return tip
+
+
+def build_branch_fixture(
+    root: str, branches: int, commits: int, files: int, conflict_every: int
+) -> BranchFixture:
+    """
+    Build root/origin.git and root/work for the merge and cherry-pick benchmarks:
+    - master with `commits` commits over `files` files, plus one commit made
+      after the branches were cut, so the first merge has work to do
+    - bench/00000... one commit each on top of the old master tip
+    - feature, one commit changing shared.txt, to cherry-pick
+    Every `conflict_every`-th branch (0 = never) also changes shared.txt,
+    which conflicts with feature and along the merge chain.
+    """
+    origin = os.path.join(root, "origin.git")
+    work = os.path.join(root, "work")
+    git("init", "--quiet", "--bare", "-b", "master", origin, cwd=root)
+
+    stream = FastImportStream()
+    base = _write_base_history(stream, commits, files)
+    branch_names = []
+    for index in range(branches):
+        name = f"{BRANCH_PREFIX}/{index:05}"
+        changes = {f"branches/{index:05}.txt": f"{name}\n"}
+        if conflict_every and index % conflict_every == conflict_every - 1:
+            changes["shared.txt"] = f"changed on {name}\n"
+        stream.commit(f"refs/heads/{name}", f"Work on {name}", changes, parent=base)
+        branch_names.append(name)
+    stream.commit(
+        "refs/heads/feature", "Fix shared", {"shared.txt": "fixed\n"}, parent=base
+    )
+    stream.commit(
+        "refs/heads/master",
+        "Change after branching",
+        {"files/00000.txt": _file_content(0, commits)},
+        parent=base,
+    )
+    stream.run(origin)
+
+    git("clone", "--quiet", origin, work, cwd=root)
+    return BranchFixture(
+        origin=origin,
+        work=work,
+        branches=branch_names,
+        feature_commit=git("rev-parse", "origin/feature", cwd=work),
+    )
+
+
+def build_pull_fixture(root: str, repos: int, commits: int, files: int) -> str:
+    """
+    Build root/repos with `repos` clones of one bare origin, which then gets
+    one more commit, so every pull fast-forwards. Returns root/repos.
+    """
+    origin = os.path.join(root, "pull-origin.git")
+    clones = os.path.join(root, "repos")
+    os.makedirs(clones)
+    git("init", "--quiet", "--bare", "-b", "master", origin, cwd=root)
+
+    stream = FastImportStream()
+    _write_base_history(stream, commits, files)
+    stream.run(origin)
+    for index in range(repos):
+        git("clone", "--quiet", origin, f"repo-{index:05}", cwd=clones)
+
+    stream = FastImportStream()
+    stream.commit(
+        "refs/heads/master",
+        "Change after cloning",
+        {"files/00000.txt": _file_content(0, commits)},
+        parent="refs/heads/master^0",
+    )
+    stream.run(origin)
+    return clones
@@ -0,0 +1,35 @@
+"""
+Console script entry points (see setup.py).
+Each one imports only the command it runs, when it runs it: starting one
+command never pays for loading the others.
+"""
+
+
+def merge() -> None:
+    from cli.git_batch_merger import main
+
+    main()
+
+
+def cherry_pick() -> None:
+    from cli.git_batch_cherry_picker import main
+
+    main()
+
+
+def batch_pull() -> None:
+    from cli.git_batch_puller import main
+
+    main()
+
+
+def plan() -> None:
+    from cli.git_batch_plan import main
+
+    main()
+
+
+def daemon() -> None:
+    from cli.git_daemon import main
+
+    main()
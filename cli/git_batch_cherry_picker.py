@@ -1,63 +1,551 @@
 """Safely batch cherry-pick commits to different branches and push to remote."""
 
-from cli_utils import utils
+import argparse
+import os
+
+from cli_utils import (
+    fetching,
+    git_process,
+    journal,
+    patch_index,
+    plumbing,
+    ref_index,
+    trace,
+    utils,
+    worktrees,
+)
 
 INTRO_TEXT__GIT_BATCH_CHERRY_PICK = """
 This command cherry picks a commit to a batch of branches and pushes that change to each branches remote.
+Several commits, or a range A..B, are applied together with one checkout, pull and push per branch.
 
 It is helpful when:
 - you have a commit on your branch and you want to apply it to some shared branches.
+- you want to backport a fix made of several commits to all release branches.
 """
 
 
-def git_batch_cherry_picker():
-    """Entrypoint Cherry Picker"""
-    print(INTRO_TEXT__GIT_BATCH_CHERRY_PICK + "\n")
+def _commit_count(commits: list[str]) -> str:
+    return "commit" if len(commits) == 1 else f"{len(commits)} commits"
 
-    # Setup
-    current_branch = utils.get_current_branch()
-    conflict_branches = []
-    branches = []
-    remote_branches = utils.get_all_remote_branches_set()
 
-    # Accept Input
-    commit = utils.get_input_commit_from_user()
-    if not commit:
-        return
-    branches = utils.get_input_branches_from_user(
-        remote_branches=remote_branches,
-        allow_only_one_input_branch=True,
+def _describe_commits(commits: list[str]) -> str:
+    return commits[0] if len(commits) == 1 else f"{len(commits)} commits"
+
+
+def _conflicting_commit(commits: list[str], **run_options) -> str:
+    """The commit of the sequence that `git cherry-pick` stopped at"""
+    if len(commits) == 1:
+        return commits[0]
+    _, stdout, _ = utils.run_git_command(
+        ["git", "rev-parse", "--verify", "-q", "CHERRY_PICK_HEAD"], **run_options
     )
-    if not branches:
-        return
+    return stdout.strip() or "an unknown commit"
 
-    if ("master" in branches) or ("main" in branches):
-        print("You cannot cherry-pick into `master` or `main` branches. Exiting.")
-        return
 
-    pull_choice = utils.get_input_pull_config_from_user()
+def _conflict_message(branch: str, commits: list[str], conflicting: str) -> str:
+    if len(commits) == 1:
+        return f"Conflict detected, skipping {branch}"
+    return f"Conflict detected at commit {conflicting}, skipping {branch}"
+
+
+def cherry_pick_in_worktree(
+    branch: str,
+    commits: list[str],
+    pull_choice: utils.PullConfigChoice,
+    current_branch: str,
+    worktree_root: str,
+    push: bool = True,
+) -> tuple[str | None, str, str | None]:
+    """
+    Cherry-pick commits onto a branch inside its own temporary worktree
+    and push the result (unless push is False). Expects the branch to be prefetched.
+    Returns the new branch head (None if it failed), the buffered report
+    for that branch and the commit that conflicted, if any.
+    """
+    report = [
+        f"Cherry-picking {_commit_count(commits)} into branch: {branch} (worktree)"
+    ]
+
+    has_local_branch = utils.object_exists(f"refs/heads/{branch}")
+    # A branch that only exists locally has nothing to pull
+    has_remote_branch = utils.has_remote_branch(branch)
+    rebase_local = (
+        pull_choice == utils.PullConfigChoice.RebaseLocalToRemote
+        and has_local_branch
+        and has_remote_branch
+    )
+    start_point = (
+        f"origin/{branch}" if has_remote_branch and not rebase_local else branch
+    )
+
+    with trace.phase("cherry-pick", branch):
+        try:
+            with worktrees.temporary_worktree(start_point, worktree_root) as path:
+                if rebase_local:
+                    with trace.phase("pull"):
+                        return_code, _, _ = utils.run_git_command(
+                            ["git", "rebase", f"origin/{branch}"], cwd=path
+                        )
+                        if return_code != 0:
+                            utils.run_git_command(
+                                ["git", "rebase", "--abort"], cwd=path
+                            )
+                    if return_code != 0:
+                        report.append(f"Could not rebase {branch} onto origin/{branch}")
+                        return None, "\n".join(report) + "\n", None
+
+                return_code, _, _ = utils.run_git_command(
+                    ["git", "cherry-pick", *commits], cwd=path
+                )
+                if return_code != 0:
+                    conflicting = _conflicting_commit(commits, cwd=path)
+                    report.append(_conflict_message(branch, commits, conflicting))
+                    utils.run_git_command(["git", "cherry-pick", "--abort"], cwd=path)
+                    return None, "\n".join(report) + "\n", conflicting
+                report.append(
+                    f"...Cherry-picked {_describe_commits(commits)} to {branch}"
+                )
+
+                _, new_head, _ = utils.run_git_command(
+                    ["git", "rev-parse", "HEAD"], cwd=path
+                )
+                new_head = new_head.strip()
+                if push:
+                    with trace.phase("push"):
+                        return_code, _, _ = utils.run_git_command(
+                            ["git", "push", "origin", f"HEAD:refs/heads/{branch}"],
+                            cwd=path,
+                        )
+                    if return_code != 0:
+                        report.append(f"Failed to push {branch} to remote")
+                        return None, "\n".join(report) + "\n", None
+                    report.append(f"...Pushed to remote: {branch}")
+        except worktrees.WorktreeError as e:
+            report.append(f"{e}, skipping {branch}")
+            return None, "\n".join(report) + "\n", None
+
+        # The user's checked out branch is left alone, as its files would go stale
+        if branch != current_branch:
+            utils.run_git_command(
+                ["git", "update-ref", f"refs/heads/{branch}", new_head]
+            )
+    return new_head, "\n".join(report) + "\n", None
+
+
+def cherry_pick_in_checkout(
+    branch: str,
+    commits: list[str],
+    pull_choice: utils.PullConfigChoice,
+    prefetched: bool,
+) -> str | None:
+    """
+    Check out and pull branch, then cherry-pick all commits onto it with a
+    single `git cherry-pick`.
+    Returns the commit that conflicted, after aborting the whole sequence,
+    or None if every commit applied.
+    """
+    utils.checkout_and_pull_branch(branch, pull_choice, prefetched)
+
+    print(f"Cherry-picking {_commit_count(commits)} into branch: {branch}")
+    with trace.phase("cherry-pick", branch):
+        return_code, _, _ = utils.run_git_command(["git", "cherry-pick", *commits])
+        if return_code != 0:
+            conflicting = _conflicting_commit(commits)
+            print(_conflict_message(branch, commits, conflicting))
+            utils.run_git_command(["git", "cherry-pick", "--abort"])
+            return conflicting
+    print(f"...Cherry-picked {_describe_commits(commits)} to {branch}")
+    return None
+
+
+def cherry_pick_in_memory(
+    branch: str, commits: list[str], pull_choice: utils.PullConfigChoice
+) -> tuple[bool, str | None] | None:
+    """
+    Cherry-pick commits onto a prefetched branch without checking it out,
+    using merge-tree with each commit's parent as merge base. The branch only
+    moves once every commit applied.
+    Returns whether they applied and the commit that conflicted,
+    or None if this needs the checkout flow instead.
+    """
+    target, local = plumbing.resolve_target_tip(branch, pull_choice)
+    if target is None:
+        return None
+
+    print(f"Cherry-picking {_commit_count(commits)} into branch: {branch} (in memory)")
+    head = target
+    for commit in commits:
+        result = plumbing.cherry_pick_commit(head, commit)
+        if result.already_applied:
+            # Stop like `git cherry-pick` does on an empty pick
+            print(
+                f"Commit {commit} is already applied to {branch}, "
+                f"nothing to commit, skipping {branch}"
+            )
+            return False, commit
+        if not result.clean:
+            if result.tree is None:
+                # git couldn't even attempt it, e.g. a root commit
+                return None
+            at_commit = f" at commit {commit}" if len(commits) > 1 else ""
+            print(
+                f"Conflict detected{at_commit} in: "
+                f"{', '.join(result.conflicted_files)}, skipping {branch}"
+            )
+            return False, commit
+        head = result.commit
+    if head != local and not plumbing.update_ref(branch, head, local):
+        return None
+    print(f"...Cherry-picked {_describe_commits(commits)} to {branch}")
+    return True, None
+
+
+def skip_contained_branches(
+    commits: list[str], branches: list[str]
+) -> tuple[list[str], dict[str, list[str]]]:
+    """
+    Look the commits up in the patch-id index of every prefetched branch.
+    Branches that already contain all of them are left out, the others only
+    get the commits they are missing.
+    Returns the branches to cherry-pick into and the commits for each of them.
+    """
+    with trace.phase("patch-ids"):
+        containment = patch_index.classify_branches(commits, branches)
+    groups = {}
+    for branch in branches:
+        groups.setdefault(containment[branch].status, []).append(branch)
+    for status in (
+        patch_index.Containment.Contains,
+        patch_index.Containment.NeedsPick,
+        patch_index.Containment.Unknown,
+    ):
+        if groups.get(status):
+            print(f"{status.capitalize()}: {', '.join(groups[status])}")
+
+    remaining = []
+    branch_commits = {}
+    for branch in branches:
+        missing = containment[branch].missing
+        if containment[branch].status == patch_index.Containment.Contains:
+            continue
+        if len(missing) < len(commits):
+            print(
+                f"{branch} already contains {len(commits) - len(missing)} of "
+                f"{len(commits)} commits, only the other {len(missing)} are picked"
+            )
+        remaining.append(branch)
+        branch_commits[branch] = missing
+    return remaining, branch_commits
+
+
+def cherry_pick_branches(
+    commits: list[str],
+    branches: list[str],
+    pull_choice: utils.PullConfigChoice,
+    current_branch: str,
+    prefetched: bool,
+    conflict_branches: list[str],
+    use_worktrees: bool = False,
+    jobs: int | None = None,
+    in_memory: bool = False,
+    push: bool = True,
+    stop_on_conflict: bool = False,
+    conflicting_commits: dict[str, str] | None = None,
+    run_journal: journal.Journal | None = None,
+) -> list[tuple[str, str]]:
+    """
+    Cherry-pick commits onto every branch, in one checkout, pull and push
+    per branch, pushing each one unless push is False.
+    Prefetched branches that already contain the commits are skipped without
+    being checked out (see skip_contained_branches).
+    Conflicting branches are added to conflict_branches, and to
+    conflicting_commits with the commit that failed on them. With
+    stop_on_conflict, the remaining branches are left alone (not with worktrees,
+    where the branches run concurrently).
+    Every finished branch is recorded in run_journal, if given, and the
+    branches an interrupted run already recorded there are not done again.
+    Returns (branch, refspec to push it) for every branch the commits were applied to.
+    """
+    if conflicting_commits is None:
+        conflicting_commits = {}
+    picked = []
+    branch_commits = {branch: commits for branch in branches}
+    if prefetched:
+        branches, branch_commits = skip_contained_branches(commits, branches)
+
+    def replayed(branch: str) -> journal.Step | None:
+        """Takes over the outcome of a step the interrupted run recorded"""
+        step = run_journal.replay(branch) if run_journal else None
+        if step is None:
+            return None
+        print(f"...{branch} was already done by the interrupted run")
+        if step.status == journal.StepStatus.Conflict:
+            conflict_branches.append(branch)
+            if step.conflicting:
+                conflicting_commits[branch] = step.conflicting
+            return step
+        refspec = f"{step.new_head}:refs/heads/{branch}" if step.new_head else branch
+        picked.append((branch, refspec))
+        if push and not step.pushed:
+            step.pushed = utils.push_branch_to_remote(branch, refspec)
+            run_journal.record(step)
+        return step
+
+    def record(branch: str, status: str, **details) -> None:
+        if run_journal:
+            run_journal.record(
+                journal.Step(
+                    branch,
+                    status,
+                    utils.resolve_object(f"refs/heads/{branch}"),
+                    **details,
+                )
+            )
+
+    if use_worktrees and prefetched:
+        branches = [branch for branch in branches if not replayed(branch)]
+        # Each branch gets its own worktree, so the branches are processed
+        # concurrently and the user's checkout is never touched.
+        git_process.set_max_concurrency(jobs or os.cpu_count() or 1)
+        with worktrees.worktree_root() as root, git_process.thread_pool() as executor:
+            results = executor.map(
+                lambda branch: cherry_pick_in_worktree(
+                    branch,
+                    branch_commits[branch],
+                    pull_choice,
+                    current_branch,
+                    root,
+                    push=push,
+                ),
+                branches,
+            )
+            for branch, (new_head, report, conflicting) in zip(branches, results):
+                print(report, end="")
+                if new_head is None:
+                    conflict_branches.append(branch)
+                    if conflicting:
+                        conflicting_commits[branch] = conflicting
+                        record(
+                            branch, journal.StepStatus.Conflict, conflicting=conflicting
+                        )
+                else:
+                    picked.append((branch, f"{new_head}:refs/heads/{branch}"))
+                    record(
+                        branch, journal.StepStatus.Done, pushed=push, new_head=new_head
+                    )
+        return picked
+
+    if use_worktrees:
+        print("Worktrees need all branches fetched up front. Using the checkout.")
+    if in_memory and not (prefetched and plumbing.supports_merge_tree_merge_base()):
+        print("In-memory cherry-picks need git >= 2.40 and a fetch of all branches.")
+        in_memory = False
 
-    # Do the work:
     for branch in branches:
+        commits = branch_commits[branch]
         branch = branch.strip()
-        utils.checkout_and_pull_branch(branch, pull_choice)
+        step = replayed(branch)
+        if step:
+            if step.status == journal.StepStatus.Conflict and stop_on_conflict:
+                print(f"Stopping at {branch}.")
+                break
+            continue
 
-        print(f"Cherry-picking commit into branch: {branch}")
-        return_code, _ = utils.run_git_command(f"git cherry-pick {commit}")
-        if return_code != 0:
-            print(f"Conflict detected, skipping {branch}")
+        # The checked out branch always goes through the checkout flow,
+        # moving its ref alone would leave the user's files out of sync.
+        result = None
+        if in_memory and branch != current_branch:
+            with trace.phase("cherry-pick", branch):
+                result = cherry_pick_in_memory(branch, commits, pull_choice)
+        if result is None:
+            conflicting = cherry_pick_in_checkout(
+                branch, commits, pull_choice, prefetched
+            )
+        else:
+            _, conflicting = result
+
+        if conflicting:
             conflict_branches.append(branch)
-            utils.run_git_command("git cherry-pick --abort")
+            conflicting_commits[branch] = conflicting
+            record(branch, journal.StepStatus.Conflict, conflicting=conflicting)
+            if stop_on_conflict:
+                print(f"Stopping at {branch}.")
+                break
             continue
-        print(f"...Cherry-picked {commit:} to {branch:}")
+        picked.append((branch, branch))
+        pushed = push and utils.push_branch_to_remote(branch)
+        record(branch, journal.StepStatus.Done, pushed=pushed)
+    return picked
+
+
+def report_conflicting_commits(conflicting_commits: dict[str, str]) -> None:
+    """Prints which commit of a sequence stopped each conflicting branch"""
+    if not conflicting_commits:
+        return
+    print("The cherry-pick stopped at these commits:")
+    for branch, commit in conflicting_commits.items():
+        print(f"{commit} on {branch}")
+
+
+def git_batch_cherry_picker(
+    use_worktrees: bool = False,
+    jobs: int | None = None,
+    in_memory: bool = False,
+    atomic_push: bool = False,
+    resume: bool = False,
+):
+    """
+    Entrypoint Cherry Picker
+    resume continues the last interrupted run from its journal instead of
+    asking for the commits and branches.
+    """
+    print(INTRO_TEXT__GIT_BATCH_CHERRY_PICK + "\n")
+
+    # Setup
+    conflict_branches = []
+    conflicting_commits = {}
+    branches = []
+    if resume:
+        run_journal = journal.Journal.resume("cherry-pick")
+        if run_journal is None:
+            print("There is no interrupted run of gitutils-cherry-pick to resume.")
+            return
+        journal.abort_interrupted_operation()
+        current_branch = utils.get_current_branch()
+        original_branch = run_journal.inputs["original_branch"]
+        commits = run_journal.inputs["commits"]
+        branches = run_journal.inputs["branches"]
+        pull_choice = run_journal.inputs["pull_choice"]
+        print(
+            f"Resuming the cherry-pick of {_describe_commits(commits)} "
+            f"into: {', '.join(branches)}"
+        )
+    else:
+        current_branch = utils.get_current_branch()
+        original_branch = current_branch
+        remote_branches = ref_index.load_ref_index()
+
+        # Accept Input
+        commits = utils.get_input_commits_from_user()
+        if not commits:
+            return
+        branches = utils.get_input_branches_from_user(
+            remote_branches=remote_branches,
+            allow_only_one_input_branch=True,
+        )
+        if not branches:
+            return
 
-        utils.push_branch_to_remote(branch)
+        if ("master" in branches) or ("main" in branches):
+            print("You cannot cherry-pick into `master` or `main` branches. Exiting.")
+            return
+
+        pull_choice = utils.get_input_pull_config_from_user()
+        run_journal = journal.Journal.start(
+            "cherry-pick",
+            {
+                "original_branch": original_branch,
+                "commits": commits,
+                "branches": branches,
+                "pull_choice": pull_choice,
+            },
+        )
+
+    # Do the work:
+    prefetched = utils.prefetch_branches(branches)
+    picked = cherry_pick_branches(
+        commits,
+        branches,
+        pull_choice,
+        current_branch,
+        prefetched,
+        conflict_branches,
+        use_worktrees=use_worktrees,
+        jobs=jobs,
+        in_memory=in_memory,
+        push=not atomic_push,
+        conflicting_commits=conflicting_commits,
+        run_journal=run_journal,
+    )
+    pushed_branches = [branch for branch, _ in picked]
+    push_refspecs = [refspec for _, refspec in picked]
+
+    atomic_push_succeeded = False
+    if atomic_push and push_refspecs:
+        atomic_push_succeeded = utils.push_branches_atomically(push_refspecs)
 
     # Clean up
     utils.perform_clean_up(
-        original_branch=current_branch, conflict_branches=conflict_branches
+        original_branch=original_branch, conflict_branches=conflict_branches
+    )
+    if len(commits) > 1:
+        report_conflicting_commits(conflicting_commits)
+    if atomic_push:
+        utils.report_atomic_push(pushed_branches, atomic_push_succeeded)
+    run_journal.finish()
+
+
+def main():
+    """Console entrypoint: parses command line options"""
+    parser = argparse.ArgumentParser(
+        prog="gitutils-cherry-pick",
+        description="Cherry-pick a commit, several commits or a range A..B to a "
+        "batch of branches and push them.",
+    )
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument(
+        "--worktrees",
+        action="store_true",
+        help="Apply the commit to each branch in its own temporary worktree, "
+        "concurrently, leaving your checkout untouched.",
+    )
+    engine.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Compute cherry-picks with git merge-tree without checking branches "
+        "out (git >= 2.40).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of branches to process concurrently with --worktrees "
+        "(default: CPU count).",
+    )
+    parser.add_argument(
+        "--atomic-push",
+        action="store_true",
+        help="Push all updated branches together at the end with a single "
+        "git push --atomic, instead of one push per branch.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Time every git command and write a Chrome trace-event JSON file "
+        "to PATH, plus a summary table per phase and per branch.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted run from its journal in .git/gitutils, "
+        "skipping the branches it finished that haven't moved since.",
     )
+    fetching.add_arguments(parser)
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    fetching.configure(fetching.options_from_args(args))
+    with trace.tracing(args.trace):
+        git_batch_cherry_picker(
+            use_worktrees=args.worktrees,
+            jobs=args.jobs,
+            in_memory=args.in_memory,
+            atomic_push=args.atomic_push,
+            resume=args.resume,
+        )
 
 
 if __name__ == "__main__":
-    git_batch_cherry_picker()
+    main()
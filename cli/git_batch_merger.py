@@ -1,6 +1,20 @@
 """Safely batch merge branches together and push them to remote"""
 
-from cli_utils import utils
+import argparse
+import os
+
+from cli_utils import (
+    dag_scheduler,
+    fetching,
+    git_process,
+    journal,
+    plumbing,
+    preflight,
+    ref_index,
+    trace,
+    utils,
+    worktrees,
+)
 
 INTRO_TEXT__GIT_BATCH_MERGER = """
 This command safely batch merges changes from one branch to the next in order of input.
@@ -15,60 +29,521 @@ e.g. `master -> my-working-branch -> deployment-qa`
 """
 
 
-def git_batch_merger():
+def update_branch_in_checkout(
+    branch: str,
+    prior_branch: str | None,
+    pull_choice: utils.PullConfigChoice,
+    prefetched: bool,
+    conflict_branches: list[str],
+    conflict_decision: str | None = None,
+) -> bool:
     """
-    Main entrypoint for this function.
+    Check out and pull branch, then merge prior_branch into it (if given).
+    Returns False if the merge was aborted because of a conflict.
+    conflict_decision answers the conflict prompt up front (see handle_conflicts).
     """
-    print(INTRO_TEXT__GIT_BATCH_MERGER + "\n")
+    utils.checkout_and_pull_branch(branch, pull_choice, prefetched)
+    if prior_branch is None:
+        return True
 
-    # Setup
-    current_branch = utils.get_current_branch()
-    conflict_branches = []
-    branches = []
-    remote_branches = utils.get_all_remote_branches_set()
+    print(f"Merging branch: {prior_branch} into branch: {branch}")
+    with trace.phase("merge", branch):
+        return_code, _, _ = utils.run_git_command(["git", "merge", prior_branch])
+        if return_code != 0:
+            decision = utils.handle_conflicts(
+                prior_branch=prior_branch,
+                current_branch=branch,
+                conflict_branches=conflict_branches,
+                decision=conflict_decision,
+            )
+            if decision == utils.ConflictHandleScenario.Abort:
+                return False
+    print(f"...Merged branch: {prior_branch} into branch: {branch}")
+    return True
 
-    # Accept Input
-    branches = utils.get_input_branches_from_user(remote_branches)
-    if not branches:
-        return
 
-    if ("main" in branches[1:]) or ("master" in branches[1:]):
-        print(
-            "You cannot merge any branches into main or master. Main or Master can only be merged into other branches."
+def update_branch_in_memory(
+    branch: str,
+    prior_branch: str | None,
+    pull_choice: utils.PullConfigChoice,
+) -> bool:
+    """
+    Pull a prefetched branch and merge prior_branch into it (if given) without
+    checking it out, using merge-tree, commit-tree and update-ref.
+    Returns False if this needs the checkout flow instead (conflicts or local
+    commits to rebase); the branch ref is left untouched in that case.
+    """
+    target, local = plumbing.resolve_target_tip(branch, pull_choice)
+    if target is None:
+        return False
+
+    new_tip = target
+    if prior_branch is not None:
+        source = plumbing.rev_parse(f"refs/heads/{prior_branch}")
+        if source is None:
+            return False
+        print(f"Merging branch: {prior_branch} into branch: {branch} (in memory)")
+        result = plumbing.merge_commits(
+            target, source, f"Merge branch '{prior_branch}' into {branch}"
         )
-        return
+        if not result.clean:
+            print(
+                f"...Conflict in: {', '.join(result.conflicted_files) or 'unknown'}. "
+                "Falling back to a checkout to handle it."
+            )
+            return False
+        new_tip = result.commit
 
-    pull_choice = utils.get_input_pull_config_from_user()
+    if new_tip != local and not plumbing.update_ref(branch, new_tip, local):
+        return False
+    if prior_branch is None:
+        print(f"...Pulled {branch} (in memory)")
+    else:
+        print(f"...Merged branch: {prior_branch} into branch: {branch}")
+    return True
+
+
+def merge_in_worktree(
+    branch: str,
+    parent_heads: dict[str, str],
+    pull_choice: utils.PullConfigChoice,
+    current_branch: str,
+    worktree_root: str,
+    push: bool = True,
+) -> dag_scheduler.NodeResult:
+    """
+    Merge the given parent commits into a prefetched branch inside its own
+    temporary worktree and push the result (unless push is False).
+    A branch without parents is only resolved to its pulled tip.
+    Conflicts are aborted, there is no prompt as other branches run alongside.
+    """
+    if not parent_heads:
+        tip, local = plumbing.resolve_target_tip(branch, pull_choice)
+        head = tip or local
+        if head is None:
+            return dag_scheduler.NodeResult(
+                dag_scheduler.NodeStatus.Failed, report=f"Could not find {branch}\n"
+            )
+        return dag_scheduler.NodeResult(
+            dag_scheduler.NodeStatus.Source, head, f"Using {branch} at {head}\n"
+        )
+
+    report = [f"Merging {', '.join(parent_heads)} into branch: {branch} (worktree)"]
+
+    def failed() -> dag_scheduler.NodeResult:
+        return dag_scheduler.NodeResult(
+            dag_scheduler.NodeStatus.Failed, report="\n".join(report) + "\n"
+        )
+
+    has_local_branch = utils.object_exists(f"refs/heads/{branch}")
+    # A branch that only exists locally has nothing to pull
+    has_remote_branch = utils.has_remote_branch(branch)
+    rebase_local = (
+        pull_choice == utils.PullConfigChoice.RebaseLocalToRemote
+        and has_local_branch
+        and has_remote_branch
+    )
+    start_point = (
+        f"origin/{branch}" if has_remote_branch and not rebase_local else branch
+    )
+
+    with trace.phase("merge", branch):
+        try:
+            with worktrees.temporary_worktree(start_point, worktree_root) as path:
+                if rebase_local:
+                    with trace.phase("pull"):
+                        return_code, _, _ = utils.run_git_command(
+                            ["git", "rebase", f"origin/{branch}"], cwd=path
+                        )
+                        if return_code != 0:
+                            utils.run_git_command(
+                                ["git", "rebase", "--abort"], cwd=path
+                            )
+                    if return_code != 0:
+                        report.append(f"Could not rebase {branch} onto origin/{branch}")
+                        return failed()
+
+                for parent, head in parent_heads.items():
+                    return_code, _, _ = utils.run_git_command(
+                        [
+                            "git",
+                            "merge",
+                            "--no-edit",
+                            "-m",
+                            f"Merge branch '{parent}' into {branch}",
+                            head,
+                        ],
+                        cwd=path,
+                    )
+                    if return_code != 0:
+                        report.append(
+                            f"Conflict merging {parent}, skipping {branch} "
+                            "and the branches below it"
+                        )
+                        utils.run_git_command(["git", "merge", "--abort"], cwd=path)
+                        return failed()
+                    report.append(f"...Merged branch: {parent} into branch: {branch}")
+
+                _, new_head, _ = utils.run_git_command(
+                    ["git", "rev-parse", "HEAD"], cwd=path
+                )
+                new_head = new_head.strip()
+                if push:
+                    with trace.phase("push"):
+                        return_code, _, _ = utils.run_git_command(
+                            ["git", "push", "origin", f"HEAD:refs/heads/{branch}"],
+                            cwd=path,
+                        )
+                    if return_code != 0:
+                        report.append(f"Failed to push {branch} to remote")
+                        return failed()
+                    report.append(f"...Pushed to remote: {branch}")
+        except worktrees.WorktreeError as e:
+            report.append(f"{e}, skipping {branch}")
+            return failed()
+
+        # The user's checked out branch is left alone, as its files would go stale
+        if branch != current_branch:
+            utils.run_git_command(
+                ["git", "update-ref", f"refs/heads/{branch}", new_head]
+            )
+    return dag_scheduler.NodeResult(
+        dag_scheduler.NodeStatus.Merged, new_head, "\n".join(report) + "\n"
+    )
+
+
+def merge_graph(
+    graph: dag_scheduler.MergeGraph,
+    pull_choice: utils.PullConfigChoice,
+    current_branch: str,
+    jobs: int | None = None,
+    push: bool = True,
+) -> dict[str, dag_scheduler.NodeResult]:
+    """
+    Merge every branch of the graph once all its parents are merged, each in
+    its own worktree, up to `jobs` at a time. Expects all branches prefetched.
+    A conflict skips the descendants of that branch only.
+    """
+    git_process.set_max_concurrency(jobs or os.cpu_count() or 1)
+    with worktrees.worktree_root() as root:
+        return dag_scheduler.run_graph(
+            graph,
+            lambda branch, parent_heads: merge_in_worktree(
+                branch, parent_heads, pull_choice, current_branch, root, push=push
+            ),
+            on_result=lambda branch, result: print(result.report, end=""),
+        )
+
+
+def run_preflight(
+    branches: list[str], pull_choice: utils.PullConfigChoice
+) -> list[str] | None:
+    """
+    Simulates the whole chain before any checkout and lets the user
+    drop the branches that would conflict.
+    Returns the branches to merge, or None to stop the program.
+    """
+    while True:
+        predictions = preflight.simulate_merge_chain(branches, pull_choice)
+        preflight.print_preflight_report(predictions)
+        conflicting_branches = [
+            prediction.branch
+            for prediction in predictions
+            if prediction.status == preflight.HopStatus.Conflict
+        ]
+        if not conflicting_branches:
+            return branches
+
+        decision = (
+            input(
+                "Press ENTER to continue anyway, type 'drop' to remove the conflicting branches from the chain, or anything else to exit: "
+            )
+            .strip()
+            .lower()
+        )
+        if decision == "":
+            return branches
+        if decision != "drop":
+            print("Exiting. No branch was changed.")
+            return None
+
+        branches = [branch for branch in branches if branch not in conflicting_branches]
+        print(f"Dropped: {', '.join(conflicting_branches)}")
+        if len(branches) < 2:
+            print("Less than 2 branches left to merge. Exiting.")
+            return None
+
+
+def merge_chain(
+    branches: list[str],
+    pull_choice: utils.PullConfigChoice,
+    current_branch: str,
+    prefetched: bool,
+    conflict_branches: list[str],
+    in_memory: bool = False,
+    push: bool = True,
+    conflict_decision: str | None = None,
+    stop_on_conflict: bool = False,
+    up_to_date_branches: list[str] | None = None,
+    run_journal: journal.Journal | None = None,
+) -> list[str]:
+    """
+    Merge each branch into the next one, pushing every merged branch unless
+    push is False. Conflicting branches are added to conflict_branches and,
+    with stop_on_conflict, end the chain there.
+    With the branches prefetched, the leading hops that need no work are found
+    by ancestry and skipped entirely, their branches are added to
+    up_to_date_branches.
+    Every finished branch is recorded in run_journal, if given, and the steps
+    an interrupted run already recorded there are not done again.
+    Returns the merged branches.
+    """
+    merged_branches = []
+    skipped_hops = 0
+    if prefetched:
+        with trace.phase("ancestry"):
+            skipped_hops = preflight.find_up_to_date_hops(branches, current_branch)
+        if skipped_hops:
+            print(
+                "Already up to date, skipping: "
+                + ", ".join(
+                    f"{prior} -> {branch}"
+                    for prior, branch in zip(
+                        branches[:skipped_hops], branches[1 : skipped_hops + 1]
+                    )
+                )
+            )
+            if up_to_date_branches is not None:
+                up_to_date_branches.extend(branches[1 : skipped_hops + 1])
 
-    # Do the work:
     for i, branch in enumerate(branches):
+        if skipped_hops and i <= skipped_hops:
+            # Nothing to merge, and its local ref already matches remote
+            continue
         branch = branch.strip()
-        utils.checkout_and_pull_branch(branch, pull_choice)
+        prior_branch = branches[i - 1] if i > 0 else None
+
+        step = run_journal.replay(branch) if run_journal else None
+        if step:
+            print(f"...{branch} was already done by the interrupted run")
+            if i == 0:
+                continue
+            if step.status == journal.StepStatus.Conflict:
+                conflict_branches.append(branch)
+                if stop_on_conflict:
+                    print(f"Stopping the chain at {branch}.")
+                    break
+                continue
+            merged_branches.append(branch)
+            if push and not step.pushed:
+                step.pushed = utils.push_branch_to_remote(branch)
+                run_journal.record(step)
+            continue
+
+        # The checked out branch always goes through the checkout flow,
+        # moving its ref alone would leave the user's files out of sync.
+        updated_in_memory = False
+        if in_memory and branch != current_branch:
+            with trace.phase("merge", branch):
+                updated_in_memory = update_branch_in_memory(
+                    branch, prior_branch, pull_choice
+                )
+        merged = updated_in_memory or update_branch_in_checkout(
+            branch,
+            prior_branch,
+            pull_choice,
+            prefetched,
+            conflict_branches,
+            conflict_decision,
+        )
 
         if i == 0:
             # There is nothing to merge into the first branch
+            _record_step(run_journal, branch, journal.StepStatus.Done)
             continue
+        if not merged:
+            _record_step(run_journal, branch, journal.StepStatus.Conflict)
+            if stop_on_conflict:
+                print(f"Stopping the chain at {branch}.")
+                break
+            continue
+        merged_branches.append(branch)
+        pushed = push and utils.push_branch_to_remote(branch)
+        _record_step(run_journal, branch, journal.StepStatus.Done, pushed)
+    return merged_branches
 
-        prior_branch = branches[i - 1]
-        print(f"Merging branch: {prior_branch} into branch: {branch}")
-        return_code, _ = utils.run_git_command(f"git merge {prior_branch}")
-        if return_code != 0:
-            decision = utils.handle_conflicts(
-                prior_branch=prior_branch,
-                current_branch=branch,
-                conflict_branches=conflict_branches,
+
+def _record_step(
+    run_journal: journal.Journal | None, branch: str, status: str, pushed=False
+) -> None:
+    if run_journal:
+        run_journal.record(
+            journal.Step(
+                branch, status, utils.resolve_object(f"refs/heads/{branch}"), pushed
             )
-            if decision == utils.ConflictHandleScenario.Abort:
-                continue
-        print(f"...Merged branch: {prior_branch} into branch: {branch}")
+        )
+
+
+def report_up_to_date(up_to_date_branches: list[str]) -> None:
+    """Prints the hops merge_chain skipped, for the end of run summary"""
+    if up_to_date_branches:
+        print(
+            f"{len(up_to_date_branches)} branches already up to date: "
+            f"{', '.join(up_to_date_branches)}"
+        )
+
+
+def git_batch_merger(
+    in_memory: bool = False,
+    atomic_push: bool = False,
+    preflight_check: bool = False,
+    resume: bool = False,
+):
+    """
+    Main entrypoint for this function.
+    resume continues the last interrupted run from its journal instead of
+    asking for the branches.
+    """
+    print(INTRO_TEXT__GIT_BATCH_MERGER + "\n")
+
+    # Setup
+    conflict_branches = []
+    up_to_date_branches = []
+    branches = []
+    if resume:
+        run_journal = journal.Journal.resume("merge", ordered=True)
+        if run_journal is None:
+            print("There is no interrupted run of gitutils-merge to resume.")
+            return
+        journal.abort_interrupted_operation()
+        current_branch = utils.get_current_branch()
+        original_branch = run_journal.inputs["original_branch"]
+        branches = run_journal.inputs["branches"]
+        pull_choice = run_journal.inputs["pull_choice"]
+        print(f"Resuming the merge of: {' -> '.join(branches)}")
+    else:
+        current_branch = utils.get_current_branch()
+        original_branch = current_branch
+        remote_branches = ref_index.load_ref_index()
 
-        utils.push_branch_to_remote(branch)
+        # Accept Input
+        branches = utils.get_input_branches_from_user(remote_branches)
+        if not branches:
+            return
+
+        if ("main" in branches[1:]) or ("master" in branches[1:]):
+            print(
+                "You cannot merge any branches into main or master. Main or Master can only be merged into other branches."
+            )
+            return
+
+        pull_choice = utils.get_input_pull_config_from_user()
+        run_journal = None
+
+    # Do the work:
+    prefetched = utils.prefetch_branches(branches)
+    if in_memory and not (prefetched and plumbing.supports_merge_tree()):
+        print("In-memory merges need git >= 2.38 and a fetch of all branches.")
+        in_memory = False
+
+    if preflight_check:
+        if prefetched and plumbing.supports_merge_tree():
+            with trace.phase("preflight"):
+                branches = run_preflight(branches, pull_choice)
+            if not branches:
+                # The user cancelled: there is nothing left to resume
+                if run_journal:
+                    run_journal.finish()
+                return
+        else:
+            print("The pre-flight check needs git >= 2.38 and a fetch of all branches.")
+
+    # Started once the chain is final, so it never records a cancelled run
+    # or branches the pre-flight check dropped
+    if run_journal is None:
+        run_journal = journal.Journal.start(
+            "merge",
+            {
+                "original_branch": original_branch,
+                "branches": branches,
+                "pull_choice": pull_choice,
+            },
+            ordered=True,
+        )
+
+    pushed_branches = merge_chain(
+        branches,
+        pull_choice,
+        current_branch,
+        prefetched,
+        conflict_branches,
+        in_memory=in_memory,
+        push=not atomic_push,
+        up_to_date_branches=up_to_date_branches,
+        run_journal=run_journal,
+    )
+
+    atomic_push_succeeded = False
+    if atomic_push and pushed_branches:
+        atomic_push_succeeded = utils.push_branches_atomically(pushed_branches)
 
     # Clean up
     utils.perform_clean_up(
-        original_branch=current_branch, conflict_branches=conflict_branches
+        original_branch=original_branch, conflict_branches=conflict_branches
+    )
+    report_up_to_date(up_to_date_branches)
+    if atomic_push:
+        utils.report_atomic_push(pushed_branches, atomic_push_succeeded)
+    run_journal.finish()
+
+
+def main():
+    """Console entrypoint: parses command line options"""
+    parser = argparse.ArgumentParser(
+        prog="gitutils-merge",
+        description="Merge a chain of branches one into the next and push them.",
     )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Compute merges with git merge-tree without checking branches out. "
+        "Only conflicts fall back to a checkout.",
+    )
+    parser.add_argument(
+        "--atomic-push",
+        action="store_true",
+        help="Push all updated branches together at the end with a single "
+        "git push --atomic, instead of one push per branch.",
+    )
+    parser.add_argument(
+        "--preflight",
+        action="store_true",
+        help="Simulate the whole chain with git merge-tree before touching any "
+        "branch and report which hops will conflict.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Time every git command and write a Chrome trace-event JSON file "
+        "to PATH, plus a summary table per phase and per branch.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted run from its journal in .git/gitutils, "
+        "skipping the branches it finished that haven't moved since.",
+    )
+    fetching.add_arguments(parser)
+    args = parser.parse_args()
+    fetching.configure(fetching.options_from_args(args))
+    with trace.tracing(args.trace):
+        git_batch_merger(
+            in_memory=args.in_memory,
+            atomic_push=args.atomic_push,
+            preflight_check=args.preflight,
+            resume=args.resume,
+        )
 
 
 if __name__ == "__main__":
-    git_batch_merger()
+    main()
@@ -0,0 +1,200 @@
+"""Run the merge chains and cherry-picks of a plan file, without any prompt"""
+
+import argparse
+import sys
+
+from cli import git_batch_cherry_picker, git_batch_merger
+from cli_utils import dag_scheduler, fetching, plan, plumbing, ref_index, trace, utils
+
+INTRO_TEXT__GIT_BATCH_PLAN = """
+This command runs every merge chain and cherry-pick declared in a plan file, in order.
+Branches are looked up and fetched once for the whole plan, and conflicts are handled
+by each job's on_conflict policy instead of a prompt, so it can run unattended.
+"""
+
+
+def print_plan(jobs: list[plan.PlanJob]) -> None:
+    for index, job in enumerate(jobs, start=1):
+        if job.kind == "merge":
+            print(f"{index}. {job.name}: merge {' -> '.join(job.branches)}")
+        elif job.kind == "merge-graph":
+            print(f"{index}. {job.name}: merge graph")
+            for parent, children in job.graph.items():
+                print(f"   {parent} -> {', '.join(children)}")
+        else:
+            print(
+                f"{index}. {job.name}: cherry-pick {' '.join(job.commits)} into "
+                f"{', '.join(job.branches)}"
+            )
+        print(f"   pull: {job.pull_choice}, on conflict: {job.on_conflict}")
+
+
+def run_job(
+    job: plan.PlanJob,
+    current_branch: str,
+    prefetched: bool,
+    conflict_branches: list[str],
+) -> bool:
+    """
+    Run one job of the plan. Returns False if its atomic push was rejected.
+    """
+    stop_on_conflict = job.on_conflict == plan.ConflictPolicy.Stop
+    if job.kind == "merge":
+        in_memory = job.in_memory
+        if in_memory and not (prefetched and plumbing.supports_merge_tree()):
+            print("In-memory merges need git >= 2.38 and a fetch of all branches.")
+            in_memory = False
+        up_to_date_branches = []
+        updated = git_batch_merger.merge_chain(
+            job.branches,
+            job.pull_choice,
+            current_branch,
+            prefetched,
+            conflict_branches,
+            in_memory=in_memory,
+            push=not job.atomic_push,
+            conflict_decision=(
+                "yes" if job.on_conflict == plan.ConflictPolicy.Theirs else ""
+            ),
+            stop_on_conflict=stop_on_conflict,
+            up_to_date_branches=up_to_date_branches,
+        )
+        git_batch_merger.report_up_to_date(up_to_date_branches)
+        refspecs = updated
+    elif job.kind == "merge-graph":
+        if not prefetched:
+            print("Graph merges need all branches fetched up front. Skipping.")
+            conflict_branches.extend(job.branches)
+            return True
+        results = git_batch_merger.merge_graph(
+            dag_scheduler.MergeGraph(
+                (parent, child)
+                for parent, children in job.graph.items()
+                for child in children
+            ),
+            job.pull_choice,
+            current_branch,
+            jobs=job.jobs,
+            push=not job.atomic_push,
+        )
+        updated = []
+        refspecs = []
+        skipped = []
+        for branch, result in results.items():
+            if result.status == dag_scheduler.NodeStatus.Merged:
+                updated.append(branch)
+                refspecs.append(f"{result.head}:refs/heads/{branch}")
+            elif result.status == dag_scheduler.NodeStatus.Failed:
+                conflict_branches.append(branch)
+            elif result.status == dag_scheduler.NodeStatus.Skipped:
+                skipped.append(branch)
+        if skipped:
+            print(
+                f"Not merged because a branch above them failed: {', '.join(skipped)}"
+            )
+    else:
+        conflicting_commits = {}
+        picked = git_batch_cherry_picker.cherry_pick_branches(
+            job.commits,
+            job.branches,
+            job.pull_choice,
+            current_branch,
+            prefetched,
+            conflict_branches,
+            use_worktrees=job.worktrees,
+            jobs=job.jobs,
+            in_memory=job.in_memory,
+            push=not job.atomic_push,
+            stop_on_conflict=stop_on_conflict,
+            conflicting_commits=conflicting_commits,
+        )
+        if len(job.commits) > 1:
+            git_batch_cherry_picker.report_conflicting_commits(conflicting_commits)
+        updated = [branch for branch, _ in picked]
+        refspecs = [refspec for _, refspec in picked]
+
+    if not job.atomic_push:
+        return True
+    succeeded = bool(refspecs) and utils.push_branches_atomically(refspecs)
+    utils.report_atomic_push(updated, succeeded)
+    return succeeded or not refspecs
+
+
+def git_batch_plan(plan_path: str, dry_run: bool = False) -> int:
+    """
+    Main entrypoint for plan files.
+    Returns the exit status: 0 if every job went through cleanly, 1 if there
+    were conflicts or rejected pushes, 2 if the plan is invalid.
+    """
+    print(INTRO_TEXT__GIT_BATCH_PLAN + "\n")
+
+    # Setup: one ref snapshot for every job
+    current_branch = utils.get_current_branch()
+    remote_branches = ref_index.load_ref_index()
+    try:
+        jobs = plan.resolve_plan(
+            plan.parse_plan(plan.load_plan_file(plan_path)), remote_branches
+        )
+    except plan.PlanError as e:
+        print(f"Invalid plan {plan_path}:\n{e}")
+        return 2
+
+    print_plan(jobs)
+    if dry_run:
+        return 0
+
+    # Do the work, with a single fetch of every branch the plan touches
+    all_branches = list(dict.fromkeys(b for job in jobs for b in job.branches))
+    prefetched = utils.prefetch_branches(all_branches)
+
+    conflict_branches = []
+    failed_jobs = []
+    for index, job in enumerate(jobs, start=1):
+        print(f"\n=== Job {index}/{len(jobs)}: {job.name} ===")
+        job_conflicts = []
+        if not run_job(job, current_branch, prefetched, job_conflicts):
+            failed_jobs.append(job.name)
+        if job_conflicts:
+            failed_jobs.append(job.name)
+        conflict_branches.extend(job_conflicts)
+
+    # Clean up
+    utils.perform_clean_up(
+        original_branch=current_branch,
+        conflict_branches=list(dict.fromkeys(conflict_branches)),
+    )
+    if failed_jobs:
+        print(f"Jobs that need attention: {', '.join(dict.fromkeys(failed_jobs))}")
+        return 1
+    return 0
+
+
+def main():
+    """Console entrypoint: parses command line options"""
+    parser = argparse.ArgumentParser(
+        prog="gitutils-plan",
+        description="Run the merge chains and cherry-picks of a plan file "
+        "(JSON, or YAML with PyYAML installed) without prompting.",
+    )
+    parser.add_argument("plan", help="Path to the plan file.")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Check the plan and show the expanded jobs without running them.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Time every git command and write a Chrome trace-event JSON file "
+        "to PATH, plus a summary table per phase and per branch.",
+    )
+    fetching.add_arguments(parser)
+    args = parser.parse_args()
+    fetching.configure(fetching.options_from_args(args))
+    with trace.tracing(args.trace):
+        status = git_batch_plan(args.plan, dry_run=args.dry_run)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,461 @@
 """Safely keep all your branches up to date with Remote"""
 
+import argparse
+import functools
 import os
-import subprocess
+import re
+import sys
+import time
+from typing import Callable
 
+from cli_utils import (
+    fetching,
+    git_process,
+    pull_state,
+    repo_discovery,
+    repo_status,
+    trace,
+    utils,
+)
 
-def is_git_directory(path: str) -> bool:
-    """Check if the path is a git repository."""
-    try:
-        subprocess.check_output(["git", "-C", path, "status"], stderr=subprocess.STDOUT)
-        return True
-    except subprocess.CalledProcessError:
-        return False
+# Seconds an ls-remote may take before the remote counts as unreadable
+LS_REMOTE_TIMEOUT = 60
 
 
-def get_current_branch(path: str) -> str:
-    """Get the current branch name of a git repository."""
-    try:
-        branch = (
-            subprocess.check_output(
-                ["git", "-C", path, "rev-parse", "--abbrev-ref", "HEAD"],
-                stderr=subprocess.STDOUT,
+def _upstream_command(path: str, branch: str) -> list[str]:
+    return [
+        "git",
+        "-C",
+        path,
+        "config",
+        "--get-regexp",
+        rf"^branch\.{re.escape(branch)}\.(remote|merge)$",
+    ]
+
+
+def _parse_upstream(branch: str, output: str) -> tuple[str, str] | None:
+    config = dict(line.split(" ", 1) for line in output.splitlines() if " " in line)
+    remote = config.get(f"branch.{branch}.remote")
+    merge = config.get(f"branch.{branch}.merge")
+    if not remote or not merge or remote == ".":
+        return None
+    return remote, merge
+
+
+def get_upstream(path: str, branch: str) -> tuple[str, str] | None:
+    """The remote and remote branch ref that branch pulls from, if configured."""
+    return_code, output, _ = utils.run_git_command(_upstream_command(path, branch))
+    if return_code != 0:
+        return None
+    return _parse_upstream(branch, output)
+
+
+def get_remote_heads(
+    statuses: dict[str, repo_status.RepoStatus | None],
+) -> dict[str, tuple[str, str] | None]:
+    """
+    For each probed repository, the upstream of the checked out main or master
+    branch ("origin refs/heads/main") and its SHA on the remote, from a single
+    ls-remote: no objects are fetched. None for a repository that isn't on
+    main or master or whose remote can't be read in LS_REMOTE_TIMEOUT seconds.
+    Every step runs for all the repositories at once on the shared git runner.
+    """
+    heads = dict.fromkeys(statuses)
+    on_default = {
+        path: status.branch
+        for path, status in statuses.items()
+        if status and status.branch in ["main", "master"]
+    }
+    configs = utils.run_git_commands(
+        [_upstream_command(path, branch) for path, branch in on_default.items()]
+    )
+    upstreams = {}
+    for (path, branch), (return_code, output, _) in zip(on_default.items(), configs):
+        upstream = _parse_upstream(branch, output) if return_code == 0 else None
+        if upstream:
+            upstreams[path] = upstream
+    listings = utils.run_git_commands(
+        [
+            ["git", "-C", path, "ls-remote", "--exit-code", remote, ref]
+            for path, (remote, ref) in upstreams.items()
+        ],
+        timeout=LS_REMOTE_TIMEOUT,
+    )
+    for (path, (remote, ref)), (return_code, output, _) in zip(
+        upstreams.items(), listings
+    ):
+        if return_code != 0:
+            continue
+        for line in output.splitlines():
+            sha, _, name = line.partition("\t")
+            if name == ref:
+                heads[path] = (f"{remote} {ref}", sha)
+                break
+    return heads
+
+
+def contained_commits(commits: dict[str, str]) -> list[str]:
+    """
+    The repositories, of a path -> SHA mapping, whose HEAD contains the
+    commit, e.g. after a pull. Checked for all of them at once.
+    """
+    results = utils.run_git_commands(
+        [
+            ["git", "-C", path, "merge-base", "--is-ancestor", sha, "HEAD"]
+            for path, sha in commits.items()
+        ]
+    )
+    return [
+        path for path, (return_code, _, _) in zip(commits, results) if return_code == 0
+    ]
+
+
+def git_pull(
+    path: str,
+    branch: str | None = None,
+    on_output: Callable[[str, str], None] | None = None,
+) -> str:
+    """
+    Perform a git pull in the given directory and return its report.
+    With the branch's upstream known, only that one branch is fetched.
+    The report includes the objects and bytes transferred. git's output is
+    streamed and only its tail is kept; with on_output it is handed on live
+    instead of being added to the report.
+    """
+    options = fetching.get_options()
+    upstream = get_upstream(path, branch) if branch else None
+    refspec = list(upstream) if upstream else []
+    commands = [fetching.pull_command(*refspec, git_options=("-C", path))]
+    if options.filter and upstream:
+        # git pull has no --filter, so the filtered fetch comes first
+        commands.insert(0, fetching.fetch_command(*refspec, git_options=("-C", path)))
+
+    output = ""
+    for command in commands:
+        result = utils.run_git_command(command, on_output=on_output)
+        # git writes the fetch's progress and messages before the merge's summary
+        output += result.stderr + result.stdout
+        if result.returncode != 0:
+            return (
+                f"🤔 Failed to pull latest changes in {path}: "
+                f"{' '.join(command)} exited with {result.returncode}\n"
+                f"{'' if on_output else output}\n"
             )
-            .strip()
-            .decode("utf-8")
+
+    stats = fetching.parse_transfer_stats(output)
+    report = f"✅ Successfully pulled latest changes in {path} ({stats})\n"
+    if on_output:
+        return report + "\n"
+    return report + f"Output for {path}:\n{_without_progress(output)}\n"
+
+
+def _without_progress(output: str) -> str:
+    """Drop the progress meter lines that --progress adds to the output"""
+    lines = output.replace("\r", "\n").splitlines()
+    return "".join(f"{line}\n" for line in lines if "%" not in line or "done." in line)
+
+
+def get_default_branch(path: str) -> str | None:
+    """The repository's local main or master branch, if it has one."""
+    for branch in ["main", "master"]:
+        return_code, _, _ = utils.run_git_command(
+            [
+                "git",
+                "-C",
+                path,
+                "show-ref",
+                "--verify",
+                "--quiet",
+                f"refs/heads/{branch}",
+            ]
         )
-        return branch
-    except subprocess.CalledProcessError:
-        return None
+        if return_code == 0:
+            return branch
+    return None
 
 
-def git_pull(path):
-    """Perform a git pull in the given directory."""
-    try:
-        # Execute git pull and capture output
-        output = subprocess.check_output(
-            ["git", "-C", path, "pull"], stderr=subprocess.STDOUT
+def fast_forward_branch(
+    path: str, branch: str, on_output: Callable[[str, str], None] | None = None
+) -> tuple[str, bool]:
+    """
+    Fetch the upstream of a branch that isn't checked out straight into its
+    local ref (`git fetch origin main:main`): git only moves it if that is a
+    fast-forward, and neither the working tree nor the current branch is
+    touched. Returns the report and whether the branch is now up to date.
+    """
+    upstream = get_upstream(path, branch)
+    if not upstream:
+        return f"🤔 Skipping {path}: {branch} has no upstream branch.\n\n", False
+    remote, ref = upstream
+    command = fetching.fetch_command(
+        remote, f"{ref}:refs/heads/{branch}", git_options=("-C", path)
+    )
+    result = utils.run_git_command(command, on_output=on_output)
+    output = result.stderr + result.stdout
+    if result.returncode != 0:
+        if "non-fast-forward" in output:
+            return (
+                f"🤔 Could not fast-forward {branch} in {path}: "
+                f"it has commits that aren't on {remote}.\n\n",
+                False,
+            )
+        return (
+            f"🤔 Failed to fast-forward {branch} in {path}: "
+            f"{' '.join(command)} exited with {result.returncode}\n"
+            f"{'' if on_output else output}\n",
+            False,
+        )
+    stats = fetching.parse_transfer_stats(output)
+    if re.search(rf"-> {re.escape(branch)}$", output, re.MULTILINE):
+        return f"✅ Fast-forwarded {branch} in {path} ({stats})\n\n", True
+    return f"✅ {branch} in {path} is already up to date.\n\n", True
+
+
+def planned_action(
+    status: repo_status.RepoStatus | None, fast_forward_default: bool = False
+) -> str:
+    """What update_repository does with a repository in that state"""
+    if status is None:
+        return "skip: not a repository"
+    if status.branch in ["main", "master"]:
+        return "pull"
+    if fast_forward_default:
+        return "fast-forward main or master"
+    return "skip: not on main or master"
+
+
+def update_repository(
+    path: str,
+    status: repo_status.RepoStatus | None,
+    on_output: Callable[[str, str], None] | None = None,
+    fast_forward_default: bool = False,
+    not_fast_forwarded: list[str] | None = None,
+) -> tuple[str, float]:
+    """
+    Update a single repository, given its probed status (None if it isn't one).
+    Returns the buffered report for that repository and the seconds it took.
+    fast_forward_default fast-forwards the local main or master of a repository
+    that is on another branch, without checking it out. The paths where that
+    wasn't possible are added to not_fast_forwarded.
+    """
+    started = time.perf_counter()
+    if status is not None:
+        branch = status.branch
+        default_branch = (
+            get_default_branch(path)
+            if fast_forward_default and branch not in ["main", "master"]
+            else None
         )
-        print(f"✅ Successfully pulled latest changes in {path}")
-        print(f"Output for {path}:\n{output.decode('utf-8')}")
-    except subprocess.CalledProcessError as e:
-        print(f"🤔 Failed to pull latest changes in {path}: {e}\n")
+        if branch in ["main", "master"]:
+            with trace.phase("pull", path):
+                report = git_pull(path, branch, on_output=on_output)
+        elif default_branch:
+            with trace.phase("fast-forward", path):
+                report, fast_forwarded = fast_forward_branch(
+                    path, default_branch, on_output=on_output
+                )
+            if not fast_forwarded and not_fast_forwarded is not None:
+                not_fast_forwarded.append(path)
+        else:
+            report = f"🤔 Skipping {path}: Not on main or master branch.\n\n"
+    else:
+        report = f"🤔 Skipping {path}: Not a git repository.\n\n"
+    return report, time.perf_counter() - started
 
 
-def git_batch_puller():
-    """Main entrypoint to the git batch puller"""
+def git_batch_puller(
+    jobs: int | None = None,
+    recursive: bool = False,
+    ignore_patterns: tuple[str, ...] = repo_discovery.DEFAULT_IGNORE_PATTERNS,
+    use_index: bool = True,
+    incremental: bool = False,
+    fast_forward_default: bool = False,
+):
+    """
+    Main entrypoint to the git batch puller.
+    fast_forward_default also updates the main or master branch of repositories
+    on another branch, when that is a fast-forward, without checking it out.
+    incremental first reads every repository's remote head with ls-remote, up
+    to `jobs` at a time, and only pulls those whose remote moved since the
+    last incremental run.
+    """
+    jobs = jobs or os.cpu_count() or 1
 
     # Display helper text and ask for confirmation
     print("This script will update all git repositories in the current directory.")
-    print("\nIt will only check directories one level down")
-    print("and assumes there are no git repositories nested within sub-directories.")
+    if recursive:
+        print("\nIt will search all sub-directories for git repositories,")
+        print(f"skipping directories matching: {', '.join(ignore_patterns)}")
+    else:
+        print("\nIt will only check directories one level down")
+        print(
+            "and assumes there are no git repositories nested within sub-directories."
+        )
     print("\nPress 'Y' or 'Enter' to continue, or any other key to exit.")
     confirmation = input().strip().lower()
     if confirmation != "" and confirmation != "y":
         print("Exiting script.")
         exit()
 
-    # Iterate through subdirectories
-    items = os.listdir(".")
-    for item in items:
-        full_path = os.path.join(".", item)
-
-        # Check if it's a directory
-        if os.path.isdir(full_path):
-            # Check if it's a git repository
-            if is_git_directory(full_path):
-                branch = get_current_branch(full_path)
-                if branch in ["main", "master"]:
-                    git_pull(full_path)
-                else:
-                    print(f"🤔 Skipping {full_path}: Not on main or master branch.\n")
-            else:
-                print(f"🤔 Skipping {full_path}: Not a git repository.\n")
+    # Collect repositories (recursive) or subdirectories (one level down)
+    if recursive:
+        paths = repo_discovery.discover_repositories(
+            ".", ignore_patterns=ignore_patterns, use_index=use_index
+        )
+    else:
+        paths = []
+        for item in os.listdir("."):
+            full_path = os.path.join(".", item)
+            if os.path.isdir(full_path):
+                paths.append(full_path)
 
+    started = time.perf_counter()
+    summed_seconds = 0.0
+    all_paths = paths
+    # One status probe per directory decides what happens to it
+    git_process.set_max_concurrency(jobs)
+    with trace.phase("probe"):
+        statuses = repo_status.probe_repositories(paths)
+    actions = {
+        path: planned_action(status, fast_forward_default)
+        for path, status in statuses.items()
+    }
+    if incremental:
+        known_heads = pull_state.load_pull_state()
+        print(f"Checking the remote heads of {len(paths)} directories...", flush=True)
+        with trace.phase("remote heads"):
+            remote_heads = get_remote_heads(statuses)
+        paths = [
+            path
+            for path in paths
+            if not pull_state.is_up_to_date(known_heads, path, remote_heads[path])
+        ]
+        for path in set(all_paths) - set(paths):
+            actions[path] = "skip: remote unchanged"
+    print()
+    repo_status.print_status_table(statuses, actions)
+    print()
+
+    update = update_repository
+    not_fast_forwarded = []
+    if fast_forward_default:
+        update = functools.partial(
+            update_repository,
+            fast_forward_default=True,
+            not_fast_forwarded=not_fast_forwarded,
+        )
+
+    if jobs == 1 and sys.stdout.isatty():
+        # One at a time in a terminal: show git's output and progress live
+        for path in paths:
+            print(f"Pulling {path}...", flush=True)
+            report, seconds = update(
+                path, statuses[path], on_output=git_process.write_to_terminal
+            )
+            print(report, end="")
+            summed_seconds += seconds
+    else:
+        # Update them on the shared pool. Results come back in submission order,
+        # so each repository's report is printed as one block in a stable order.
+        with git_process.thread_pool() as executor:
+            for report, seconds in executor.map(
+                update, paths, [statuses[path] for path in paths]
+            ):
+                print(report, end="")
+                summed_seconds += seconds
+
+    if incremental:
+        # Remember the remote heads that actually made it into each repository
+        pulled = {path: remote_heads[path][1] for path in paths if remote_heads[path]}
+        with trace.phase("remote heads"):
+            contained = contained_commits(pulled)
+        for path in contained:
+            pull_state.record(known_heads, path, remote_heads[path])
+        pull_state.save_pull_state(known_heads)
+        print(
+            f"⏭️  Skipped {len(all_paths) - len(paths)} repositories already "
+            "up to date with their remote."
+        )
+    if not_fast_forwarded:
+        print(
+            f"🤔 Could not fast-forward the default branch of "
+            f"{len(not_fast_forwarded)} repositories: "
+            f"{', '.join(sorted(not_fast_forwarded))}"
+        )
+    wall_seconds = time.perf_counter() - started
+
+    print(
+        f"⏱️  Processed {len(all_paths)} directories with {jobs} jobs in "
+        f"{wall_seconds:.2f}s wall time ({summed_seconds:.2f}s summed per-repo time)."
+    )
     print("🚀 git batch pull completed.")
 
 
+def main():
+    """Console entrypoint: parses command line options"""
+    parser = argparse.ArgumentParser(
+        prog="gitutils-batch-pull",
+        description="Update all git repositories in the current directory.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of repositories to update concurrently (default: CPU count).",
+    )
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="Find repositories in nested sub-directories as well.",
+    )
+    parser.add_argument(
+        "--ignore",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Extra directory name pattern to skip when searching recursively.",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Don't read or write the cached repository index.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Check every remote head with one ls-remote first and only pull the "
+        "repositories whose remote moved since the last incremental run.",
+    )
+    parser.add_argument(
+        "--fast-forward-default",
+        action="store_true",
+        help="In repositories on another branch, fast-forward the local main or "
+        "master to its upstream without checking it out, and report the "
+        "repositories where that isn't a fast-forward.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Time every git command and write a Chrome trace-event JSON file "
+        "to PATH, plus a summary table per phase and per repository.",
+    )
+    fetching.add_arguments(parser)
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    fetching.configure(fetching.options_from_args(args))
+    with trace.tracing(args.trace):
+        git_batch_puller(
+            jobs=args.jobs,
+            recursive=args.recursive,
+            ignore_patterns=repo_discovery.DEFAULT_IGNORE_PATTERNS + tuple(args.ignore),
+            use_index=not args.no_index,
+            incremental=args.incremental,
+            fast_forward_default=args.fast_forward_default,
+        )
+
+
 if __name__ == "__main__":
-    git_batch_puller()
+    main()
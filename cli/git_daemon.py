@@ -0,0 +1,64 @@
+"""Start, stop or check the daemon keeping repository state warm between commands"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+from cli_utils import daemon
+
+
+def main():
+    """Console entrypoint: parses command line options"""
+    parser = argparse.ArgumentParser(
+        prog="gitutils-daemon",
+        description="Keep ref indexes, repository lists and pull state in memory "
+        "so the other gitutils commands start warm. They work the same without it.",
+    )
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument(
+        "--detach",
+        action="store_true",
+        help="Run the daemon in the background.",
+    )
+    action.add_argument("--stop", action="store_true", help="Stop the running daemon.")
+    action.add_argument(
+        "--status", action="store_true", help="Tell whether a daemon is running."
+    )
+    args = parser.parse_args()
+
+    running = daemon.request("ping") is not None
+    if args.status:
+        print(f"The daemon is {'running' if running else 'not running'}.")
+        sys.exit(0 if running else 1)
+    if args.stop:
+        if running:
+            daemon.request("shutdown")
+            print("Daemon stopped.")
+        else:
+            print("No daemon is running.")
+        return
+    if running:
+        print(f"A daemon is already listening on {daemon.socket_path()}.")
+        return
+    if args.detach:
+        subprocess.Popen(
+            [sys.executable, "-m", "cli.git_daemon"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        print("Daemon started.")
+        return
+    try:
+        daemon.serve(
+            on_ready=lambda: print(f"Listening on {daemon.socket_path()}", flush=True)
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Base test case running git for real in a throw-away repository"""
+
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cli_utils import git_process
+
+
+class GitRepoTestCase(unittest.TestCase):
+    """
+    Each test gets an empty repository on master at self.repo, inside the
+    self.workspace directory, and its own gitutils cache directory.
+    patch_git() routes the utils git helpers into that repository.
+    """
+
+    def setUp(self):
+        workspace = tempfile.TemporaryDirectory()
+        self.addCleanup(workspace.cleanup)
+        self.workspace = workspace.name
+        self.repo = os.path.join(self.workspace, "repo")
+        env = patch.dict(
+            os.environ,
+            {
+                "XDG_CACHE_HOME": os.path.join(self.workspace, "cache"),
+                "GIT_AUTHOR_NAME": "Test",
+                "GIT_AUTHOR_EMAIL": "test@example.com",
+                "GIT_COMMITTER_NAME": "Test",
+                "GIT_COMMITTER_EMAIL": "test@example.com",
+            },
+        )
+        env.start()
+        self.addCleanup(env.stop)
+        self.git("init", "-q", "-b", "master", self.repo, cwd=self.workspace)
+        self._reader = None
+
+    def git(self, *args: str, cwd: str | None = None) -> str:
+        return subprocess.run(
+            ["git", *args],
+            cwd=cwd or self.repo,
+            check=True,
+            capture_output=True,
+            encoding="utf-8",
+        ).stdout
+
+    def commit(self, filename: str, content: str) -> str:
+        """Commit content to filename and return the new commit's SHA"""
+        with open(os.path.join(self.repo, filename), "w") as f:
+            f.write(content + "\n")
+        self.git("add", filename)
+        self.git("commit", "-q", "-m", content)
+        return self.head("HEAD")
+
+    def head(self, rev: str) -> str:
+        return self.git("rev-parse", rev).strip()
+
+    def enter_repo(self) -> None:
+        """Make the repository the current directory for the rest of the test"""
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.repo)
+
+    def run_in_repo(self, args, cwd=None, env=None, input=None):
+        return git_process.run_git(args, cwd=self.repo, env=env, input=input)
+
+    def run_many_in_repo(self, commands, timeout=None):
+        return git_process.run_git_concurrently(
+            [
+                (
+                    command._replace(cwd=self.repo)
+                    if isinstance(command, git_process.GitCommand)
+                    else git_process.GitCommand(command, cwd=self.repo)
+                )
+                for command in commands
+            ],
+            timeout=timeout,
+        )
+
+    def resolve_in_repo(self, rev):
+        if self._reader is None:
+            self._reader = git_process.ObjectReader(cwd=self.repo)
+            self.addCleanup(self._reader.close)
+        resolved = self._reader.resolve(rev)
+        return resolved[0] if resolved else None
+
+    def patch_git(self):
+        """
+        Run utils.run_git_command, run_git_commands and resolve_object in the
+        repository until the end of the test. Returns their mocks.
+        """
+        mocks = []
+        for target, side_effect in (
+            ("cli_utils.utils.run_git_command", self.run_in_repo),
+            ("cli_utils.utils.run_git_commands", self.run_many_in_repo),
+            ("cli_utils.utils.resolve_object", self.resolve_in_repo),
+        ):
+            patcher = patch(target, side_effect=side_effect)
+            mocks.append(patcher.start())
+            self.addCleanup(patcher.stop)
+        return tuple(mocks)
@@ -0,0 +1,102 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+from cli.tests.git_repo_test_case import GitRepoTestCase
+from cli_utils import daemon, pull_state, ref_index, repo_discovery
+
+
+class TestDaemon(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.git("commit", "-q", "--allow-empty", "-m", "c")
+        self.addCleanup(self.stop_daemon)
+
+    def stop_daemon(self) -> None:
+        if daemon.request("ping"):
+            daemon.request("shutdown")
+            self.server.join()
+
+    def start_daemon(self) -> None:
+        ready = threading.Event()
+        self.server = threading.Thread(target=daemon.serve, args=(None, ready.set))
+        self.server.start()
+        ready.wait()
+
+    def load_ref_index_in_repo(self) -> ref_index.RefIndex:
+        cwd = os.getcwd()
+        os.chdir(self.repo)
+        try:
+            return ref_index.load_ref_index()
+        finally:
+            os.chdir(cwd)
+
+    def test_request__falls_back_when_no_daemon_runs(self):
+        # WHEN:
+        served = daemon.request("ping")
+
+        # THEN:
+        self.assertIsNone(served)
+        self.assertEqual(self.load_ref_index_in_repo().local_branches, ["master"])
+
+    def test_ref_index__served_from_memory_until_refs_change(self):
+        # GIVEN:
+        self.start_daemon()
+        self.assertEqual(self.load_ref_index_in_repo().local_branches, ["master"])
+
+        # WHEN: refs are unchanged
+        with patch("cli_utils.utils.run_git_command") as mock_run_command:
+            index = self.load_ref_index_in_repo()
+
+        # THEN: no git command ran on either side
+        self.assertEqual(index.local_branches, ["master"])
+        mock_run_command.assert_not_called()
+
+        # WHEN: a branch is created
+        self.git("branch", "feature")
+
+        # THEN:
+        self.assertEqual(
+            self.load_ref_index_in_repo().local_branches, ["feature", "master"]
+        )
+
+    def test_repositories_and_pull_state__follow_the_filesystem(self):
+        # GIVEN:
+        self.start_daemon()
+        self.assertEqual(
+            repo_discovery.discover_repositories(self.workspace),
+            [self.repo],
+        )
+
+        # WHEN:
+        self.git("init", "-q", os.path.join(self.workspace, "api"))
+        pull_state.save_pull_state({self.repo: {"upstream": "u", "head": "h"}})
+
+        # THEN:
+        self.assertEqual(
+            repo_discovery.discover_repositories(self.workspace),
+            [
+                os.path.join(self.workspace, "api"),
+                self.repo,
+            ],
+        )
+        self.assertEqual(
+            pull_state.load_pull_state(), {self.repo: {"upstream": "u", "head": "h"}}
+        )
+
+    def test_shutdown__removes_the_socket(self):
+        # GIVEN:
+        self.start_daemon()
+
+        # WHEN:
+        daemon.request("shutdown")
+        self.server.join()
+
+        # THEN:
+        self.assertFalse(os.path.exists(daemon.socket_path()))
+        self.assertIsNone(daemon.request("ping"))
+
+
+if __name__ == "__main__":
+    unittest.main()
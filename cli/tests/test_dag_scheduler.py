@@ -0,0 +1,90 @@
+import threading
+import unittest
+
+from cli_utils import dag_scheduler, git_process
+
+TREE = [
+    ("main", "release"),
+    ("release", "team-a-qa"),
+    ("release", "team-b-qa"),
+    ("team-a-qa", "team-a-p1"),
+    ("team-a-p1", "team-a-p2"),
+    ("team-b-qa", "team-b-p1"),
+]
+
+
+class TestDagScheduler(unittest.TestCase):
+    def test_merge_graph__rejects_cycles(self):
+        with self.assertRaises(dag_scheduler.GraphError):
+            dag_scheduler.MergeGraph([("a", "b"), ("b", "c"), ("c", "a")])
+
+    def test_merge_graph__orders_parents_first(self):
+        # GIVEN:
+        graph = dag_scheduler.MergeGraph(TREE + [("team-b-p1", "team-a-p2")])
+
+        # WHEN:
+        order = graph.topological_order()
+
+        # THEN:
+        for parent, child in TREE:
+            self.assertLess(order.index(parent), order.index(child))
+        self.assertEqual(graph.parents["team-a-p2"], ["team-a-p1", "team-b-p1"])
+
+    def test_run_graph__skips_only_descendants_of_a_failure(self):
+        # GIVEN: team-b-qa conflicts
+        graph = dag_scheduler.MergeGraph(TREE)
+        calls = []
+        lock = threading.Lock()
+
+        def merge_node(branch, parent_heads):
+            with lock:
+                calls.append((branch, parent_heads))
+            if branch == "team-b-qa":
+                return dag_scheduler.NodeResult(dag_scheduler.NodeStatus.Failed)
+            return dag_scheduler.NodeResult(
+                dag_scheduler.NodeStatus.Merged, f"{branch}_sha"
+            )
+
+        # WHEN:
+        results = dag_scheduler.run_graph(graph, merge_node)
+
+        # THEN:
+        self.assertEqual(
+            {branch: result.status for branch, result in results.items()},
+            {
+                "main": dag_scheduler.NodeStatus.Merged,
+                "release": dag_scheduler.NodeStatus.Merged,
+                "team-a-qa": dag_scheduler.NodeStatus.Merged,
+                "team-b-qa": dag_scheduler.NodeStatus.Failed,
+                "team-a-p1": dag_scheduler.NodeStatus.Merged,
+                "team-a-p2": dag_scheduler.NodeStatus.Merged,
+                "team-b-p1": dag_scheduler.NodeStatus.Skipped,
+            },
+        )
+        self.assertNotIn("team-b-p1", [branch for branch, _ in calls])
+        self.assertIn(("team-a-p2", {"team-a-p1": "team-a-p1_sha"}), calls)
+        self.assertIn(("main", {}), calls)
+
+    def test_run_graph__runs_independent_branches_concurrently(self):
+        # GIVEN: both QA branches must be running at the same time to finish
+        graph = dag_scheduler.MergeGraph(TREE[:3])
+        barrier = threading.Barrier(2, timeout=5)
+        git_process.set_max_concurrency(2)
+        self.addCleanup(
+            git_process.set_max_concurrency, git_process.DEFAULT_MAX_CONCURRENCY
+        )
+
+        def merge_node(branch, parent_heads):
+            if branch in ("team-a-qa", "team-b-qa"):
+                barrier.wait()
+            return dag_scheduler.NodeResult(dag_scheduler.NodeStatus.Merged, branch)
+
+        # WHEN:
+        results = dag_scheduler.run_graph(graph, merge_node)
+
+        # THEN:
+        self.assertEqual(results["team-b-qa"].head, "team-b-qa")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,36 +1,52 @@
+import contextlib
 import unittest
 from unittest.mock import call, patch
 
 from cli import git_batch_cherry_picker
+from cli.tests.git_repo_test_case import GitRepoTestCase
+from cli_utils import patch_index, ref_index, utils
 
 
 class TestGitBatchCherryPicker(unittest.TestCase):
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_commit", side_effect=lambda spec: spec)
+    @patch("cli_utils.utils.resolve_object", return_value=None)
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
-    def test_git_batch_cherry_picker__happy_path(self, mock_input, mock_run_command):
+    def test_git_batch_cherry_picker__happy_path(
+        self,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_resolve_commit,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
+    ):
         """Tests the happy path and also shows the print output"""
 
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["branch0", "branch1", "branch2"], ["branch0", "branch1", "branch2"]
+        )
         # Mock the inputs for the function
         mock_input.side_effect = ["foo_commit", "branch0", "branch1", "", "1"]
 
         # Mock the outputs for the _run_command function
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "branch0\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
-            (0, ""),  # output for the call to git rev-parse the commit
-            (0, ""),  # output for the call to checkout to branch0
-            (0, ""),  # output for the call to pull branch0
-            (0, ""),  # output for the call to cherry-pick to branch0
-            (0, ""),  # output for the call to push branch0
-            (0, ""),  # output for the call to checkout to branch1
-            (0, ""),  # output for the call to pull branch1
-            (0, ""),  # output for the call to cherry-pick to branch1
-            (0, ""),  # output for the call to push branch1
-            (0, ""),  # output for the call to checkout to the original branch
+            (0, "master", ""),  # output for the first call to get the current branch
+            (0, "", ""),  # output for the call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to branch0
+            (0, "", ""),  # output for the call to pull branch0
+            (0, "", ""),  # output for the call to cherry-pick to branch0
+            (0, "", ""),  # output for the call to push branch0
+            (0, "", ""),  # output for the call to checkout to branch1
+            (0, "", ""),  # output for the call to pull branch1
+            (0, "", ""),  # output for the call to cherry-pick to branch1
+            (0, "", ""),  # output for the call to push branch1
+            (0, "", ""),  # output for the call to checkout to the original branch
         ]
 
         # WHEN:
@@ -39,7 +55,10 @@ class TestGitBatchCherryPicker(unittest.TestCase):
         # THEN:
         # Assert that the mock functions were called with the correct arguments
         assert mock_input.call_args_list == [
-            call("Please enter the commit id you would like to batch cherry-pick: "),
+            call(
+                "Please enter the commit id you would like to batch cherry-pick "
+                "(or several ids and A..B ranges, separated by spaces): "
+            ),
             call(
                 "Please enter the first branch name or press ENTER for default of current branch: "
             ),
@@ -51,35 +70,54 @@ class TestGitBatchCherryPicker(unittest.TestCase):
         ]
 
         assert mock_run_command.call_args_list == [
-            call("git branch --show-current"),
-            call("git branch -a"),
-            call("git rev-parse foo_commit"),
-            call("git checkout branch0"),
-            call("git pull --rebase origin branch0"),
-            call("git cherry-pick foo_commit"),
-            call("git push origin branch0"),
-            call("git checkout branch1"),
-            call("git pull --rebase origin branch1"),
-            call("git cherry-pick foo_commit"),
-            call("git push origin branch1"),
-            call("git checkout master"),
+            call(["git", "branch", "--show-current"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "fetch",
+                    "--progress",
+                    "origin",
+                    "+refs/heads/branch0:refs/remotes/origin/branch0",
+                    "+refs/heads/branch1:refs/remotes/origin/branch1",
+                ]
+            ),
+            call(["git", "checkout", "branch0"]),
+            call(["git", "rebase", "origin/branch0"]),
+            call(["git", "cherry-pick", "foo_commit"]),
+            call(["git", "push", "origin", "branch0"]),
+            call(["git", "checkout", "branch1"]),
+            call(["git", "rebase", "origin/branch1"]),
+            call(["git", "cherry-pick", "foo_commit"]),
+            call(["git", "push", "origin", "branch1"]),
+            call(["git", "checkout", "master"]),
         ]
 
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_commit", side_effect=lambda spec: spec)
+    @patch("cli_utils.utils.resolve_object", return_value=None)
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_cherry_picker__protects_from_cherry_picking_to_master(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_resolve_commit,
+        mock_load_ref_index,
+        mock_journal_path,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         mock_input.side_effect = ["foo_commit", "branch1", "master", ""]
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
-            (0, ""),  # output for the call to git rev-parse the commit
+            (0, "master", ""),  # output for the first call to get the current branch
         ]
 
         # WHEN:
@@ -90,26 +128,38 @@ class TestGitBatchCherryPicker(unittest.TestCase):
             "You cannot cherry-pick into `master` or `main` branches. Exiting."
         )
 
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_commit", side_effect=lambda spec: spec)
+    @patch("cli_utils.utils.resolve_object", return_value=None)
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_cherry_picker__allows_one_input_branch(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_resolve_commit,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         mock_input.side_effect = ["foo_commit", "branch1", "", "1"]
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
-            (0, ""),  # output for the call to git rev-parse the commit
-            (0, ""),  # output for the call to checkout to branch1
-            (0, ""),  # output for the call to pull branch1
-            (0, ""),  # output for the call to cherry-pick to branch1
-            (0, ""),  # output for the call to push branch1
-            (0, ""),  # output for the call to checkout to the original branch
+            (0, "master", ""),  # output for the first call to get the current branch
+            (0, "", ""),  # output for the call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to branch1
+            (0, "", ""),  # output for the call to pull branch1
+            (0, "", ""),  # output for the call to cherry-pick to branch1
+            (0, "", ""),  # output for the call to push branch1
+            (0, "", ""),  # output for the call to checkout to the original branch
         ]
 
         # WHEN:
@@ -117,15 +167,255 @@ class TestGitBatchCherryPicker(unittest.TestCase):
 
         # THEN:
         assert mock_run_command.call_args_list == [
-            call("git branch --show-current"),
-            call("git branch -a"),
-            call("git rev-parse foo_commit"),
-            call("git checkout branch1"),
-            call("git pull --rebase origin branch1"),
-            call("git cherry-pick foo_commit"),
-            call("git push origin branch1"),
-            call("git checkout master"),
+            call(["git", "branch", "--show-current"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "fetch",
+                    "--progress",
+                    "origin",
+                    "+refs/heads/branch1:refs/remotes/origin/branch1",
+                ]
+            ),
+            call(["git", "checkout", "branch1"]),
+            call(["git", "rebase", "origin/branch1"]),
+            call(["git", "cherry-pick", "foo_commit"]),
+            call(["git", "push", "origin", "branch1"]),
+            call(["git", "checkout", "master"]),
+        ]
+
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_commit", side_effect=lambda spec: spec)
+    @patch("cli_utils.utils.resolve_object", return_value=None)
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_git_batch_cherry_picker__range_in_one_pass_per_branch(
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_resolve_commit,
+        mock_load_ref_index,
+        mock_journal_path,
+    ):
+        # GIVEN: a range of two commits plus one more, the second conflicts on branch2
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
+        mock_input.side_effect = ["base..tip extra", "branch1", "branch2", "", "1"]
+
+        def run_command(cmd):
+            command = " ".join(cmd)
+            if command == "git rev-list --reverse --parents base..tip":
+                return (0, "sha1 base\nsha2 sha1\n", "")
+            if command == "git branch --show-current":
+                return (0, "master", "")
+            if command == "git checkout branch2":
+                run_command.branch = "branch2"
+            if command.startswith("git cherry-pick sha1"):
+                return (1 if run_command.branch == "branch2" else 0, "", "")
+            if command == "git rev-parse --verify -q CHERRY_PICK_HEAD":
+                return (0, "sha2\n", "")
+            return (0, "", "")
+
+        run_command.branch = None
+        mock_run_command.side_effect = run_command
+
+        # WHEN:
+        git_batch_cherry_picker.git_batch_cherry_picker()
+
+        # THEN: every commit goes in with one cherry-pick and one push per branch
+        cherry_picks = [
+            c
+            for c in mock_run_command.call_args_list
+            if c.args[0][:2] == ["git", "cherry-pick"]
+        ]
+        assert cherry_picks == [
+            call(["git", "cherry-pick", "sha1", "sha2", "extra"]),
+            call(["git", "cherry-pick", "sha1", "sha2", "extra"]),
+            call(["git", "cherry-pick", "--abort"]),
         ]
+        mock_run_command.assert_any_call(["git", "push", "origin", "branch1"])
+        assert (
+            call(["git", "push", "origin", "branch2"])
+            not in mock_run_command.call_args_list
+        )
+        mock_print.assert_any_call("Conflict detected at commit sha2, skipping branch2")
+        mock_print.assert_any_call("sha2 on branch2")
+
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.patch_index.classify_branches")
+    @patch("cli_utils.utils.resolve_commit", side_effect=lambda spec: spec)
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_git_batch_cherry_picker__skips_branches_that_contain_the_change(
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_commit,
+        mock_classify_branches,
+        mock_load_ref_index,
+        mock_journal_path,
+    ):
+        # GIVEN: branch1 already has the change, e.g. from an earlier backport
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
+        mock_input.side_effect = ["foo_commit", "branch1", "branch2", "", "1"]
+        mock_classify_branches.return_value = {
+            "branch1": patch_index.BranchContainment(
+                patch_index.Containment.Contains, []
+            ),
+            "branch2": patch_index.BranchContainment(
+                patch_index.Containment.NeedsPick, ["foo_commit"]
+            ),
+        }
+        mock_run_command.return_value = (0, "master", "")
+
+        # WHEN:
+        git_batch_cherry_picker.git_batch_cherry_picker()
+
+        # THEN: branch1 is never checked out, pulled or pushed
+        mock_classify_branches.assert_called_once_with(
+            ["foo_commit"], ["branch1", "branch2"]
+        )
+        for command in (
+            ["git", "checkout", "branch1"],
+            ["git", "rebase", "origin/branch1"],
+            ["git", "push", "origin", "branch1"],
+        ):
+            self.assertNotIn(call(command), mock_run_command.call_args_list)
+        mock_run_command.assert_any_call(["git", "cherry-pick", "foo_commit"])
+        mock_run_command.assert_any_call(["git", "push", "origin", "branch2"])
+        mock_print.assert_any_call("Already contains: branch1")
+        mock_print.assert_any_call("Needs pick: branch2")
+
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.worktrees.worktree_root")
+    @patch("cli_utils.worktrees.temporary_worktree")
+    @patch("cli_utils.utils.resolve_commit", side_effect=lambda spec: spec)
+    @patch("cli_utils.utils.resolve_object", return_value=None)
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_git_batch_cherry_picker__worktrees(
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_resolve_commit,
+        mock_temporary_worktree,
+        mock_worktree_root,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
+    ):
+        # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
+        mock_input.side_effect = ["foo_commit", "branch1", "branch2", "", "2"]
+        mock_worktree_root.return_value = contextlib.nullcontext("/wt")
+        mock_temporary_worktree.side_effect = lambda commitish, root: (
+            contextlib.nullcontext(f"{root}/{commitish}")
+        )
+
+        def run_command(cmd, cwd=None):
+            outputs = {
+                "git branch --show-current": "master",
+                "git rev-parse HEAD": "new_sha\n",
+            }
+            command = " ".join(cmd)
+            if command == "git cherry-pick foo_commit" and cwd == "/wt/origin/branch2":
+                return (1, "", "")  # CONFLICT on branch2
+            return (0, outputs.get(command, ""), "")
+
+        mock_run_command.side_effect = run_command
+
+        # WHEN:
+        git_batch_cherry_picker.git_batch_cherry_picker(use_worktrees=True, jobs=1)
+
+        # THEN: the user's checkout is never switched to another branch
+        assert (
+            call(["git", "checkout", "branch1"]) not in mock_run_command.call_args_list
+        )
+        assert mock_run_command.call_args_list[-3:] == [
+            call(["git", "cherry-pick", "foo_commit"], cwd="/wt/origin/branch2"),
+            call(["git", "cherry-pick", "--abort"], cwd="/wt/origin/branch2"),
+            call(["git", "checkout", "master"]),
+        ]
+        mock_run_command.assert_any_call(
+            ["git", "push", "origin", "HEAD:refs/heads/branch1"],
+            cwd="/wt/origin/branch1",
+        )
+        mock_run_command.assert_any_call(
+            ["git", "update-ref", "refs/heads/branch1", "new_sha"]
+        )
+        self.assertNotIn(
+            call(
+                ["git", "push", "origin", "HEAD:refs/heads/branch2"],
+                cwd="/wt/origin/branch2",
+            ),
+            mock_run_command.call_args_list,
+        )
+        mock_print.assert_any_call(
+            "There were conflicts with the following branches. Please manually resolve:"
+        )
+        mock_print.assert_any_call("branch2")
+
+
+class TestResolveCommits(GitRepoTestCase):
+    def test_resolve_commits__pins_symbolic_specs_to_their_sha(self):
+        # GIVEN: HEAD is the fix to cherry-pick
+        self.commit("base.txt", "base")
+        self.git("checkout", "-q", "-b", "fix")
+        sha = self.commit("fix.txt", "fix")
+        self.patch_git()
+
+        # WHEN:
+        commits = utils.resolve_commits(["HEAD", "fix", "@~0"])
+
+        # THEN: checking out another branch can't change what gets picked
+        self.git("checkout", "-q", "master")
+        self.assertEqual(commits, [sha, sha, sha])
+        with self.assertRaises(ValueError):
+            utils.resolve_commits(["nope"])
+
+    @patch("builtins.print")
+    @patch("builtins.input")
+    def test_get_input_commits_from_user__describes_the_order(
+        self, mock_input, mock_print
+    ):
+        # GIVEN:
+        shas = [self.commit(f"{number}.txt", f"c{number}") for number in range(3)]
+        self.patch_git()
+
+        # WHEN: plain ids, given newest first
+        mock_input.return_value = f"{shas[2]} {shas[1]}"
+        commits = utils.get_input_commits_from_user()
+
+        # THEN: they are applied as given
+        self.assertEqual(commits, [shas[2], shas[1]])
+        mock_print.assert_any_call("Cherry-picking 2 commits, in this order:")
+
+        # WHEN: a range
+        mock_input.return_value = f"{shas[0]}..{shas[2]}"
+        commits = utils.get_input_commits_from_user()
+
+        # THEN:
+        self.assertEqual(commits, [shas[1], shas[2]])
+        mock_print.assert_any_call("Cherry-picking 2 commits, oldest first:")
 
 
 if __name__ == "__main__":
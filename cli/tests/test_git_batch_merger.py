@@ -1,36 +1,51 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import call, patch
 
 from cli import git_batch_merger
+from cli_utils import git_process, ref_index, utils
 
 
 class TestGitBatchMerger(unittest.TestCase):
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_object", return_value=None)
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
-    def test_git_batch_merger__happy_path(self, mock_input, mock_run_command):
+    def test_git_batch_merger__happy_path(
+        self,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
+    ):
         """Tests the happy path and also shows the print output"""
 
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         # Mock the inputs
         mock_input.side_effect = ["master", "branch1", "branch2", "", "1"]
         # Mock the outputs
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
-            (0, ""),  # output for the call to checkout to master
-            (0, ""),  # output for the call to pull master
-            (0, ""),  # output for the call to checkout to branch1
-            (0, ""),  # output for the call to pull branch1
-            (0, ""),  # output for the call to merge master into branch1
-            (0, ""),  # output for the call to push branch1
-            (0, ""),  # output for the call to checkout to branch2
-            (0, ""),  # output for the call to pull branch2
-            (0, ""),  # output for the call to merge branch1 into branch2
-            (0, ""),  # output for the call to push branch2
-            (0, ""),  # output for the call to checkout to the original branch
+            (0, "master", ""),  # output for the first call to get the current branch
+            (0, "", ""),  # output for the call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to master
+            (0, "", ""),  # output for the call to pull master
+            (0, "", ""),  # output for the call to checkout to branch1
+            (0, "", ""),  # output for the call to pull branch1
+            (0, "", ""),  # output for the call to merge master into branch1
+            (0, "", ""),  # output for the call to push branch1
+            (0, "", ""),  # output for the call to checkout to branch2
+            (0, "", ""),  # output for the call to pull branch2
+            (0, "", ""),  # output for the call to merge branch1 into branch2
+            (0, "", ""),  # output for the call to push branch2
+            (0, "", ""),  # output for the call to checkout to the original branch
         ]
 
         # WHEN:
@@ -51,35 +66,53 @@ class TestGitBatchMerger(unittest.TestCase):
         ]
 
         assert mock_run_command.call_args_list == [
-            call("git branch --show-current"),
-            call("git branch -a"),
-            call("git checkout master"),
-            call("git pull --rebase origin master"),
-            call("git checkout branch1"),
-            call("git pull --rebase origin branch1"),
-            call("git merge master"),
-            call("git push origin branch1"),
-            call("git checkout branch2"),
-            call("git pull --rebase origin branch2"),
-            call("git merge branch1"),
-            call("git push origin branch2"),
-            call("git checkout master"),
+            call(["git", "branch", "--show-current"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "fetch",
+                    "--progress",
+                    "origin",
+                    "+refs/heads/master:refs/remotes/origin/master",
+                    "+refs/heads/branch1:refs/remotes/origin/branch1",
+                    "+refs/heads/branch2:refs/remotes/origin/branch2",
+                ]
+            ),
+            call(["git", "checkout", "master"]),
+            call(["git", "rebase", "origin/master"]),
+            call(["git", "checkout", "branch1"]),
+            call(["git", "rebase", "origin/branch1"]),
+            call(["git", "merge", "master"]),
+            call(["git", "push", "origin", "branch1"]),
+            call(["git", "checkout", "branch2"]),
+            call(["git", "rebase", "origin/branch2"]),
+            call(["git", "merge", "branch1"]),
+            call(["git", "push", "origin", "branch2"]),
+            call(["git", "checkout", "master"]),
         ]
 
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_merger__first_branch_does_not_exist(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_load_ref_index,
+        mock_journal_path,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         mock_input.side_effect = ["foo"]
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
+            (0, "master", ""),  # output for the first call to get the current branch
         ]
 
         # WHEN:
@@ -88,20 +121,26 @@ class TestGitBatchMerger(unittest.TestCase):
         # THEN:
         mock_print.assert_any_call("Branch foo does not exist. Stopping program.")
 
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_merger__less_than_2_branches_exits(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_load_ref_index,
+        mock_journal_path,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         mock_input.side_effect = ["master", ""]
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
+            (0, "master", ""),  # output for the first call to get the current branch
         ]
 
         # WHEN:
@@ -110,21 +149,27 @@ class TestGitBatchMerger(unittest.TestCase):
         # THEN:
         mock_print.assert_any_call("You must enter at least 2 branches.")
 
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_merger__duplicate_branches_to_merge(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_load_ref_index,
+        mock_journal_path,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master"], ["foo", "bar"]
+        )
         mock_input.side_effect = ["", "foo", "bar", "foo", ""]
         mock_run_command.side_effect = [
-            (0, "current_branch"),
-            (
-                0,
-                "master\nremotes/origin/foo\nremotes/origin/bar\n",
-            ),  # output for the call to get all branches
-            (0, "current_branch"),  # empty input, so calls to get current branch
+            (0, "current_branch", ""),
+            (0, "current_branch", ""),  # empty input, so calls to get current branch
         ]
 
         # WHEN:
@@ -136,34 +181,42 @@ class TestGitBatchMerger(unittest.TestCase):
             f"All the branches you enter must be unique. You entered: {user_branches_assertion}"
         )
 
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_object", return_value=None)
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_merger__handles_conflicts__abort_merge(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         mock_input.side_effect = ["master", "branch1", "branch2", "", "2", "No"]
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
-            (0, ""),  # output for the call to checkout to master
-            (0, ""),  # output for the call to fetch origin
-            (0, ""),  # output for the call to reset to master
-            (0, ""),  # output for the call to checkout to branch1
-            (0, ""),  # output for the call to fetch origin
-            (0, ""),  # output for the call to reset to branch1
-            (0, ""),  # output for the call to merge master into branch1
-            (0, ""),  # output for the call to push branch1
-            (0, ""),  # output for the call to checkout to branch2
-            (0, ""),  # output for the call to fetch origin
-            (0, ""),  # output for the call to reset to branch2
-            (1, ""),  # output for the CONFLICT call to merge branch1 into branch2
-            (0, ""),  # output for the call to git merge --abort for conflict
-            (0, ""),  # output for the call to checkout to the original branch
+            (0, "master", ""),  # output for the first call to get the current branch
+            (0, "", ""),  # output for the call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to master
+            (0, "", ""),  # output for the call to reset to master
+            (0, "", ""),  # output for the call to checkout to branch1
+            (0, "", ""),  # output for the call to reset to branch1
+            (0, "", ""),  # output for the call to merge master into branch1
+            (0, "", ""),  # output for the call to push branch1
+            (0, "", ""),  # output for the call to checkout to branch2
+            (0, "", ""),  # output for the call to reset to branch2
+            (1, "", ""),  # output for the CONFLICT call to merge branch1 into branch2
+            (0, "", ""),  # output for the call to git merge --abort for conflict
+            (0, "", ""),  # output for the call to checkout to the original branch
         ]
 
         # WHEN:
@@ -171,56 +224,76 @@ class TestGitBatchMerger(unittest.TestCase):
 
         # THEN:
         assert mock_run_command.call_args_list == [
-            call("git branch --show-current"),
-            call("git branch -a"),
-            call("git checkout master"),
-            call("git fetch origin"),
-            call("git reset --hard origin/master"),
-            call("git checkout branch1"),
-            call("git fetch origin"),
-            call("git reset --hard origin/branch1"),
-            call("git merge master"),
-            call("git push origin branch1"),
-            call("git checkout branch2"),
-            call("git fetch origin"),
-            call("git reset --hard origin/branch2"),
-            call("git merge branch1"),
-            call("git merge --abort"),
-            call("git checkout master"),
+            call(["git", "branch", "--show-current"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "fetch",
+                    "--progress",
+                    "origin",
+                    "+refs/heads/master:refs/remotes/origin/master",
+                    "+refs/heads/branch1:refs/remotes/origin/branch1",
+                    "+refs/heads/branch2:refs/remotes/origin/branch2",
+                ]
+            ),
+            call(["git", "checkout", "master"]),
+            call(["git", "reset", "--hard", "origin/master"]),
+            call(["git", "checkout", "branch1"]),
+            call(["git", "reset", "--hard", "origin/branch1"]),
+            call(["git", "merge", "master"]),
+            call(["git", "push", "origin", "branch1"]),
+            call(["git", "checkout", "branch2"]),
+            call(["git", "reset", "--hard", "origin/branch2"]),
+            call(["git", "merge", "branch1"]),
+            call(["git", "merge", "--abort"]),
+            call(["git", "checkout", "master"]),
         ]
         mock_print.assert_any_call(
             "There were conflicts with the following branches. Please manually resolve:"
         )
         mock_print.assert_any_call("branch2")
 
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_object", return_value=None)
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_merger__handles_conflicts__merge_override_theirs(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         mock_input.side_effect = ["master", "branch1", "branch2", "", "1", "yes"]
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
-            (0, ""),  # output for the call to checkout to master
-            (0, ""),  # output for the call to pull master
-            (0, ""),  # output for the call to checkout to branch1
-            (0, ""),  # output for the call to pull branch1
-            (0, ""),  # output for the call to merge master into branch1
-            (0, ""),  # output for the call to push branch1
-            (0, ""),  # output for the call to checkout to branch2
-            (0, ""),  # output for the call to pull branch2
-            (1, ""),  # output for the CONFLICT call to merge branch1 into branch2
-            (0, ""),  # output for the call to git checkout --theirs
-            (0, ""),  # output for the call to git add .
-            (0, ""),  # output for the call to git commit -m 'resolve conflicts'
-            (0, ""),  # output for the call to push branch2
-            (0, ""),  # output for the call to checkout to the original branch
+            (0, "master", ""),  # output for the first call to get the current branch
+            (0, "", ""),  # output for the call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to master
+            (0, "", ""),  # output for the call to pull master
+            (0, "", ""),  # output for the call to checkout to branch1
+            (0, "", ""),  # output for the call to pull branch1
+            (0, "", ""),  # output for the call to merge master into branch1
+            (0, "", ""),  # output for the call to push branch1
+            (0, "", ""),  # output for the call to checkout to branch2
+            (0, "", ""),  # output for the call to pull branch2
+            (1, "", ""),  # output for the CONFLICT call to merge branch1 into branch2
+            (0, "", ""),  # output for the call to git checkout --theirs
+            (0, "", ""),  # output for the call to git add .
+            (0, "", ""),  # output for the call to git commit -m 'resolve conflicts'
+            (0, "", ""),  # output for the call to push branch2
+            (0, "", ""),  # output for the call to checkout to the original branch
         ]
 
         # WHEN:
@@ -228,41 +301,64 @@ class TestGitBatchMerger(unittest.TestCase):
 
         # THEN:
         assert mock_run_command.call_args_list == [
-            call("git branch --show-current"),
-            call("git branch -a"),
-            call("git checkout master"),
-            call("git pull --rebase origin master"),
-            call("git checkout branch1"),
-            call("git pull --rebase origin branch1"),
-            call("git merge master"),
-            call("git push origin branch1"),
-            call("git checkout branch2"),
-            call("git pull --rebase origin branch2"),
-            call("git merge branch1"),
-            call("git checkout --theirs ."),
-            call("git add ."),
+            call(["git", "branch", "--show-current"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "fetch",
+                    "--progress",
+                    "origin",
+                    "+refs/heads/master:refs/remotes/origin/master",
+                    "+refs/heads/branch1:refs/remotes/origin/branch1",
+                    "+refs/heads/branch2:refs/remotes/origin/branch2",
+                ]
+            ),
+            call(["git", "checkout", "master"]),
+            call(["git", "rebase", "origin/master"]),
+            call(["git", "checkout", "branch1"]),
+            call(["git", "rebase", "origin/branch1"]),
+            call(["git", "merge", "master"]),
+            call(["git", "push", "origin", "branch1"]),
+            call(["git", "checkout", "branch2"]),
+            call(["git", "rebase", "origin/branch2"]),
+            call(["git", "merge", "branch1"]),
+            call(["git", "checkout", "--theirs", "."]),
+            call(["git", "add", "."]),
             call(
-                "git commit -m 'Resolved merge conflicts by accepting all changes from branch1'"
+                [
+                    "git",
+                    "commit",
+                    "-m",
+                    "Resolved merge conflicts by accepting all changes from branch1",
+                ]
             ),
-            call("git push origin branch2"),
-            call("git checkout master"),
+            call(["git", "push", "origin", "branch2"]),
+            call(["git", "checkout", "master"]),
         ]
         mock_print.assert_any_call("Performed command with no conflicts.")
 
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
     @patch("cli_utils.utils.run_git_command")
     @patch("builtins.input")
     @patch("builtins.print")
     def test_git_batch_merger__protects_from_merging_into_master(
-        self, mock_print, mock_input, mock_run_command
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_load_ref_index,
+        mock_journal_path,
     ):
         # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
         mock_input.side_effect = ["branch1", "master", ""]
         mock_run_command.side_effect = [
-            (0, "master"),  # output for the first call to get the current branch
-            (
-                0,
-                "master\nbranch1\nbranch2\n",
-            ),  # output for the call to get all branches
+            (0, "master", ""),  # output for the first call to get the current branch
         ]
 
         # WHEN:
@@ -273,6 +369,318 @@ class TestGitBatchMerger(unittest.TestCase):
             "You cannot merge any branches into main or master. Main or Master can only be merged into other branches."
         )
 
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_git_batch_merger__prefetch_fails__pulls_each_branch(
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_load_ref_index,
+        mock_journal_path,
+    ):
+        # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1"], ["master", "branch1"]
+        )
+        mock_input.side_effect = ["master", "branch1", "", "1"]
+        mock_run_command.side_effect = [
+            (0, "master", ""),  # output for the first call to get the current branch
+            (128, "", ""),  # output for the FAILED call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to master
+            (0, "", ""),  # output for the call to pull master
+            (0, "", ""),  # output for the call to checkout to branch1
+            (0, "", ""),  # output for the call to pull branch1
+            (0, "", ""),  # output for the call to merge master into branch1
+            (0, "", ""),  # output for the call to push branch1
+            (0, "", ""),  # output for the call to checkout to the original branch
+        ]
+
+        # WHEN:
+        git_batch_merger.git_batch_merger()
+
+        # THEN:
+        assert mock_run_command.call_args_list == [
+            call(["git", "branch", "--show-current"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "fetch",
+                    "--progress",
+                    "origin",
+                    "+refs/heads/master:refs/remotes/origin/master",
+                    "+refs/heads/branch1:refs/remotes/origin/branch1",
+                ]
+            ),
+            call(["git", "checkout", "master"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "pull",
+                    "--progress",
+                    "--rebase",
+                    "origin",
+                    "master",
+                ]
+            ),
+            call(["git", "checkout", "branch1"]),
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "pull",
+                    "--progress",
+                    "--rebase",
+                    "origin",
+                    "branch1",
+                ]
+            ),
+            call(["git", "merge", "master"]),
+            call(["git", "push", "origin", "branch1"]),
+            call(["git", "checkout", "master"]),
+        ]
+        mock_print.assert_any_call(
+            "...Fetch failed. Each branch will be pulled separately instead."
+        )
+
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_object")
+    @patch("cli_utils.utils.run_git_commands")
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_git_batch_merger__skips_hops_that_are_already_up_to_date(
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_run_commands,
+        mock_resolve_object,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
+    ):
+        # GIVEN: branch1 already contains master, branch2 lacks branch1,
+        # and the local branch1 is behind its remote
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
+        mock_input.side_effect = ["master", "branch1", "branch2", "", "2"]
+        tips = {
+            "refs/heads/master": "m",
+            "refs/remotes/origin/master": "m",
+            "refs/heads/branch1": "old1",
+            "refs/remotes/origin/branch1": "b1",
+            "refs/remotes/origin/branch2": "b2",
+        }
+        mock_resolve_object.side_effect = tips.get
+        ancestors = {("m", "b1"), ("old1", "b1")}
+
+        def run_command(cmd):
+            if cmd == ["git", "branch", "--show-current"]:
+                return (0, "master", "")
+            return (0, "", "")
+
+        def run_commands(cmds):
+            # The ancestry checks all run in one concurrent batch
+            for cmd in cmds:
+                self.assertEqual(cmd[:3], ["git", "merge-base", "--is-ancestor"])
+            return [(0 if tuple(cmd[3:]) in ancestors else 1, "", "") for cmd in cmds]
+
+        mock_run_command.side_effect = run_command
+        mock_run_commands.side_effect = run_commands
+
+        # WHEN:
+        git_batch_merger.git_batch_merger()
+
+        # THEN: master and branch1 are never checked out or pushed,
+        # branch1's local ref is fast-forwarded for the next hop
+        commands = [c.args[0] for c in mock_run_command.call_args_list]
+        self.assertNotIn(["git", "checkout", "branch1"], commands)
+        self.assertNotIn(["git", "push", "origin", "branch1"], commands)
+        self.assertEqual(commands.count(["git", "checkout", "master"]), 1)
+        self.assertIn(
+            ["git", "update-ref", "refs/heads/branch1", "b1", "old1"], commands
+        )
+        assert commands[-5:] == [
+            ["git", "checkout", "branch2"],
+            ["git", "reset", "--hard", "origin/branch2"],
+            ["git", "merge", "branch1"],
+            ["git", "push", "origin", "branch2"],
+            ["git", "checkout", "master"],
+        ]
+        mock_print.assert_any_call("Already up to date, skipping: master -> branch1")
+        mock_print.assert_any_call("1 branches already up to date: branch1")
+
+    @patch("cli_utils.utils.has_remote_branch", return_value=True)
+    @patch("cli_utils.journal.journal_path", return_value=None)
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_object", return_value=None)
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_git_batch_merger__atomic_push_rejected(
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_resolve_object,
+        mock_load_ref_index,
+        mock_journal_path,
+        mock_has_remote_branch,
+    ):
+        # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1", "branch2"], ["master", "branch1", "branch2"]
+        )
+        mock_input.side_effect = ["master", "branch1", "branch2", "", "2"]
+        mock_run_command.side_effect = [
+            (0, "master", ""),  # output for the first call to get the current branch
+            (0, "", ""),  # output for the call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to master
+            (0, "", ""),  # output for the call to reset to master
+            (0, "", ""),  # output for the call to checkout to branch1
+            (0, "", ""),  # output for the call to reset to branch1
+            (0, "", ""),  # output for the call to merge master into branch1
+            (0, "", ""),  # output for the call to checkout to branch2
+            (0, "", ""),  # output for the call to reset to branch2
+            (0, "", ""),  # output for the call to merge branch1 into branch2
+            (1, "", ""),  # output for the REJECTED call to push all branches at once
+            (0, "", ""),  # output for the call to checkout to the original branch
+        ]
+
+        # WHEN:
+        git_batch_merger.git_batch_merger(atomic_push=True)
+
+        # THEN: no push happens inside the loop, one atomic push at the end
+        assert mock_run_command.call_args_list[-2:] == [
+            call(["git", "push", "--atomic", "origin", "branch1", "branch2"]),
+            call(["git", "checkout", "master"]),
+        ]
+        assert (
+            call(["git", "push", "origin", "branch1"])
+            not in mock_run_command.call_args_list
+        )
+        mock_print.assert_any_call(
+            "Atomic push was rejected as a whole. None of these 2 branches were updated on remote:"
+        )
+
+    @patch("cli_utils.journal.journal_path")
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.get_current_branch", return_value="master")
+    @patch("cli_utils.utils.get_input_branches_from_user")
+    @patch("cli_utils.utils.get_input_pull_config_from_user", return_value="1")
+    @patch("cli_utils.utils.prefetch_branches", return_value=True)
+    @patch("cli_utils.plumbing.supports_merge_tree", return_value=True)
+    @patch("cli.git_batch_merger.run_preflight")
+    @patch("cli.git_batch_merger.merge_chain", return_value=[])
+    @patch("cli_utils.utils.perform_clean_up")
+    @patch("builtins.print")
+    def test_git_batch_merger__journal_only_records_the_chain_after_preflight(
+        self,
+        mock_print,
+        mock_perform_clean_up,
+        mock_merge_chain,
+        mock_run_preflight,
+        mock_supports_merge_tree,
+        mock_prefetch_branches,
+        mock_get_input_pull_config,
+        mock_get_input_branches,
+        mock_get_current_branch,
+        mock_load_ref_index,
+        mock_journal_path,
+    ):
+        with tempfile.TemporaryDirectory() as git_dir:
+            # GIVEN:
+            mock_journal_path.return_value = os.path.join(git_dir, "merge.json")
+            mock_get_input_branches.return_value = ["master", "b1", "b2", "b3"]
+
+            # WHEN: the user exits at the pre-flight prompt
+            mock_run_preflight.return_value = None
+            git_batch_merger.git_batch_merger(preflight_check=True)
+
+            # THEN: there is no run to resume
+            self.assertFalse(os.path.exists(mock_journal_path.return_value))
+            git_batch_merger.git_batch_merger(resume=True)
+            mock_print.assert_any_call(
+                "There is no interrupted run of gitutils-merge to resume."
+            )
+            mock_merge_chain.assert_not_called()
+
+            # WHEN: the user drops the conflicting b2 instead
+            mock_run_preflight.return_value = ["master", "b1", "b3"]
+            git_batch_merger.git_batch_merger(preflight_check=True)
+
+            # THEN: the journal records the chain that actually runs
+            run_journal = mock_merge_chain.call_args.kwargs["run_journal"]
+            self.assertEqual(run_journal.inputs["branches"], ["master", "b1", "b3"])
+
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.print")
+    def test_prefetch_branches__leaves_local_only_branches_out(
+        self, mock_print, mock_run_command, mock_load_ref_index
+    ):
+        # GIVEN: branch1 was never pushed
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "branch1"], ["master"]
+        )
+        mock_run_command.return_value = (0, "", "")
+
+        # WHEN:
+        prefetched = utils.prefetch_branches(["master", "branch1"])
+
+        # THEN: the fetch of the others still counts
+        self.assertTrue(prefetched)
+        mock_run_command.assert_called_once_with(
+            [
+                "git",
+                "-c",
+                "fetch.unpackLimit=1",
+                "fetch",
+                "--progress",
+                "origin",
+                "+refs/heads/master:refs/remotes/origin/master",
+            ]
+        )
+        mock_print.assert_any_call("Only local, nothing to fetch: branch1")
+
+    @patch("cli_utils.utils._live_output_writer")
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.print")
+    def test_push_branch_to_remote__errors_shown_live_are_not_printed_again(
+        self, mock_print, mock_run_command, mock_live_output_writer
+    ):
+        # GIVEN:
+        mock_run_command.return_value = (1, "", "! [rejected] branch1 (fetch first)\n")
+
+        # WHEN: git's output went straight to the terminal
+        mock_live_output_writer.return_value = git_process.write_to_terminal
+        utils.push_branch_to_remote("branch1")
+
+        # THEN:
+        self.assertNotIn(
+            call("! [rejected] branch1 (fetch first)"), mock_print.call_args_list
+        )
+        mock_print.assert_any_call("...Failed to push to remote: branch1")
+
+        # WHEN: it didn't
+        mock_live_output_writer.return_value = None
+        utils.push_branch_to_remote("branch1")
+
+        # THEN:
+        mock_print.assert_any_call("! [rejected] branch1 (fetch first)")
+
 
 if __name__ == "__main__":
     unittest.main()
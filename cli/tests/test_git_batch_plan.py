@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import call, patch
+
+from cli import git_batch_plan
+from cli_utils import ref_index, utils
+
+
+class TestGitBatchPlan(unittest.TestCase):
+    def write_plan(self, tmp, data):
+        path = os.path.join(tmp, "plan.json")
+        with open(path, "w", encoding="utf-8") as plan_file:
+            json.dump(data, plan_file)
+        return path
+
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.resolve_commit", side_effect=lambda spec: spec)
+    @patch("cli.git_batch_cherry_picker.cherry_pick_branches")
+    @patch("cli.git_batch_merger.merge_chain")
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_git_batch_plan__runs_every_job_after_one_fetch(
+        self,
+        mock_print,
+        mock_input,
+        mock_run_command,
+        mock_merge_chain,
+        mock_cherry_pick_branches,
+        mock_resolve_commit,
+        mock_load_ref_index,
+    ):
+        # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(
+            ["master", "dev", "release/1", "release/2"],
+            ["master", "dev", "release/1", "release/2"],
+        )
+        mock_run_command.side_effect = [
+            (0, "master", ""),  # output for the call to get the current branch
+            (0, "", ""),  # output for the call to fetch all branches
+            (0, "", ""),  # output for the call to checkout to the original branch
+        ]
+        mock_merge_chain.return_value = ["dev"]
+        mock_cherry_pick_branches.return_value = [("release/1", "release/1")]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_plan(
+                tmp,
+                {
+                    "pull": "reset",
+                    "jobs": [
+                        {"merge": ["master", "dev"], "on_conflict": "theirs"},
+                        {"cherry_pick": "abc123", "branches": ["release/*"]},
+                    ],
+                },
+            )
+
+            # WHEN:
+            status = git_batch_plan.git_batch_plan(path)
+
+        # THEN: no prompt, a single fetch, every job run with its policy
+        self.assertEqual(status, 0)
+        mock_input.assert_not_called()
+        self.assertEqual(
+            mock_run_command.call_args_list[1],
+            call(
+                [
+                    "git",
+                    "-c",
+                    "fetch.unpackLimit=1",
+                    "fetch",
+                    "--progress",
+                    "origin",
+                    "+refs/heads/master:refs/remotes/origin/master",
+                    "+refs/heads/dev:refs/remotes/origin/dev",
+                    "+refs/heads/release/1:refs/remotes/origin/release/1",
+                    "+refs/heads/release/2:refs/remotes/origin/release/2",
+                ]
+            ),
+        )
+        mock_merge_chain.assert_called_once_with(
+            ["master", "dev"],
+            utils.PullConfigChoice.ResetToRemote,
+            "master",
+            True,
+            [],
+            in_memory=False,
+            push=True,
+            conflict_decision="yes",
+            stop_on_conflict=False,
+            up_to_date_branches=[],
+        )
+        self.assertEqual(
+            mock_cherry_pick_branches.call_args.args[:2],
+            (["abc123"], ["release/1", "release/2"]),
+        )
+
+    @patch("cli_utils.ref_index.load_ref_index")
+    @patch("cli_utils.utils.run_git_command")
+    @patch("builtins.print")
+    def test_git_batch_plan__invalid_plan_changes_nothing(
+        self, mock_print, mock_run_command, mock_load_ref_index
+    ):
+        # GIVEN:
+        mock_load_ref_index.return_value = ref_index.RefIndex(["master"], ["master"])
+        mock_run_command.side_effect = [
+            (0, "master", ""),  # output for the call to get the current branch
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_plan(tmp, {"jobs": [{"merge": ["master", "dev"]}]})
+
+            # WHEN:
+            status = git_batch_plan.git_batch_plan(path)
+
+        # THEN:
+        self.assertEqual(status, 2)
+        self.assertEqual(mock_run_command.call_count, 1)
+        mock_print.assert_any_call(
+            f"Invalid plan {path}:\njob 1: branch dev does not exist."
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,89 +1,166 @@
 import io
 import os
-import subprocess
 import sys
 import unittest
 from unittest.mock import patch
 
 from cli import git_batch_puller
+from cli_utils import fetching, git_process, repo_status, trace
 
 
 class TestGitFunctions(unittest.TestCase):
 
-    @patch("subprocess.check_output")
-    def test_is_git_directory_true(self, mock_check_output):
-        # Setup mock to simulate success
-        mock_check_output.return_value = b"Success"
+    @patch("cli_utils.utils.run_git_commands")
+    def test_get_remote_heads__probes_every_repository_concurrently(
+        self, mock_run_commands
+    ):
+        # GIVEN: repo1 is on main, repo2 on a feature branch,
+        # repo3 on master but its remote can't be read
+        statuses = {
+            "repo1": repo_status.RepoStatus("main"),
+            "repo2": repo_status.RepoStatus("feature"),
+            "repo3": repo_status.RepoStatus("master"),
+        }
 
-        # Call the function under test
-        result = git_batch_puller.is_git_directory("/fake/path")
+        def run_commands(cmds, timeout=None):
+            results = []
+            for cmd in cmds:
+                path, subcommand = cmd[2], cmd[3]
+                if subcommand == "config":
+                    branch = "main" if path == "repo1" else "master"
+                    results.append(
+                        (
+                            0,
+                            f"branch.{branch}.remote origin\n"
+                            f"branch.{branch}.merge refs/heads/{branch}\n",
+                            "",
+                        )
+                    )
+                elif path == "repo1":
+                    results.append((0, f"{'1' * 40}\trefs/heads/main\n", ""))
+                else:
+                    results.append((git_process.TIMEOUT_RETURNCODE, "", "timed out"))
+            return results
 
-        # Assert the expected outcome
-        self.assertTrue(result)
-        mock_check_output.assert_called_with(
-            ["git", "-C", "/fake/path", "status"], stderr=subprocess.STDOUT
-        )
+        mock_run_commands.side_effect = run_commands
 
-    @patch("subprocess.check_output")
-    def test_is_git_directory_false(self, mock_check_output):
-        # Setup mock to simulate failure
-        mock_check_output.side_effect = subprocess.CalledProcessError(128, "cmd")
+        # WHEN:
+        heads = git_batch_puller.get_remote_heads(statuses)
 
-        # Call the function under test
-        result = git_batch_puller.is_git_directory("/fake/path")
-
-        # Assert the expected outcome
-        self.assertFalse(result)
-        mock_check_output.assert_called_with(
-            ["git", "-C", "/fake/path", "status"], stderr=subprocess.STDOUT
+        # THEN: one batch per step, only the repositories still in the running
+        self.assertEqual(
+            heads,
+            {
+                "repo1": ("origin refs/heads/main", "1" * 40),
+                "repo2": None,
+                "repo3": None,
+            },
+        )
+        self.assertEqual(
+            [len(c.args[0]) for c in mock_run_commands.call_args_list], [2, 2]
+        )
+        self.assertEqual(
+            mock_run_commands.call_args_list[-1].kwargs,
+            {"timeout": git_batch_puller.LS_REMOTE_TIMEOUT},
         )
 
-    @patch("subprocess.check_output")
-    def test_get_current_branch(self, mock_check_output):
+    @patch("cli_utils.git_process.stream_git")
+    def test_git_pull_success(self, mock_stream_git):
         # Setup mock to simulate success
-        mock_check_output.return_value = b"main\n"
+        mock_stream_git.return_value = git_process.GitResult(0, "Successful pull\n", "")
 
         # Call the function under test
-        result = git_batch_puller.get_current_branch("/fake/path")
+        git_batch_puller.git_pull("/fake/path")
 
         # Assert the expected outcome
-        self.assertEqual(result, "main")
-        mock_check_output.assert_called_with(
-            ["git", "-C", "/fake/path", "rev-parse", "--abbrev-ref", "HEAD"],
-            stderr=subprocess.STDOUT,
+        self.assertEqual(
+            mock_stream_git.call_args.args[0],
+            [
+                "git",
+                "-C",
+                "/fake/path",
+                "-c",
+                "fetch.unpackLimit=1",
+                "pull",
+                "--progress",
+            ],
         )
 
-    @patch("subprocess.check_output")
-    def test_git_pull_success(self, mock_check_output):
-        # Setup mock to simulate success
-        mock_check_output.return_value = b"Successful pull\n"
+    @patch("cli_utils.git_process.stream_git")
+    def test_git_pull_failure(self, mock_stream_git):
+        # GIVEN:
+        mock_stream_git.return_value = git_process.GitResult(
+            1, "", "fatal: not possible to fast-forward\n"
+        )
 
-        # Call the function under test
-        git_batch_puller.git_pull("/fake/path")
+        # WHEN:
+        report = git_batch_puller.git_pull("/fake/path")
 
-        # Assert the expected outcome
-        mock_check_output.assert_called_with(
-            ["git", "-C", "/fake/path", "pull"], stderr=subprocess.STDOUT
+        # THEN:
+        self.assertIn("🤔 Failed to pull latest changes in /fake/path", report)
+        self.assertIn("fatal: not possible to fast-forward", report)
+
+    @patch("cli_utils.git_process.stream_git")
+    @patch(
+        "cli.git_batch_puller.get_upstream", return_value=("origin", "refs/heads/main")
+    )
+    def test_git_pull__fetches_only_the_upstream_branch(
+        self, mock_get_upstream, mock_stream_git
+    ):
+        # GIVEN:
+        mock_stream_git.return_value = git_process.GitResult(
+            0,
+            "Fast-forward\n",
+            "remote: Total 3 (delta 0), reused 0 (delta 0), pack-reused 0\n"
+            "Receiving objects: 100% (3/3), 1.50 KiB | 1.50 MiB/s, done.\n",
+        )
+        fetching.configure(fetching.FetchOptions(no_tags=True, depth=1))
+        self.addCleanup(fetching.configure, fetching.FetchOptions())
+
+        # WHEN:
+        report = git_batch_puller.git_pull("/fake/path", "main")
+
+        # THEN:
+        self.assertEqual(
+            mock_stream_git.call_args.args[0],
+            [
+                "git",
+                "-C",
+                "/fake/path",
+                "-c",
+                "fetch.unpackLimit=1",
+                "pull",
+                "--progress",
+                "--no-tags",
+                "--depth=1",
+                "origin",
+                "refs/heads/main",
+            ],
         )
+        self.assertIn(
+            "✅ Successfully pulled latest changes in /fake/path (3 objects, 1.50 KiB)",
+            report,
+        )
+        # THEN: the fetch's messages come before the merge's, as git prints them
+        self.assertLess(report.index("remote: Total"), report.index("Fast-forward"))
 
     @patch("os.listdir")
     @patch("os.path.isdir")
-    @patch("cli.git_batch_puller.is_git_directory")
-    @patch("cli.git_batch_puller.get_current_branch")
+    @patch("cli_utils.utils.run_git_commands")
     @patch("cli.git_batch_puller.git_pull")
     def test_git_batch_puller(
         self,
         mock_git_pull,
-        mock_get_current_branch,
-        mock_is_git_directory,
+        mock_run_commands,
         mock_isdir,
         mock_listdir,
     ):
         # Setup mocks
         mock_listdir.return_value = ["repo1", "not_a_repo"]
         mock_isdir.side_effect = [True, False]
-        mock_is_git_directory.return_value = True
-        mock_get_current_branch.return_value = "main"
+        mock_run_commands.return_value = [
+            (0, "# branch.oid 1a2b3c4\n# branch.head main\n", "")
+        ]
 
         # Redirect stdin to simulate user input using StringIO
         with io.StringIO("\n") as inputs:
@@ -93,9 +170,243 @@ class TestGitFunctions(unittest.TestCase):
             git_batch_puller.git_batch_puller()
 
         # Assert the expected outcomes
-        mock_is_git_directory.assert_called_with(os.path.join(".", "repo1"))
-        mock_get_current_branch.assert_called_with(os.path.join(".", "repo1"))
-        mock_git_pull.assert_called_once_with(os.path.join(".", "repo1"))
+        mock_run_commands.assert_called_once_with(
+            [repo_status.probe_command(os.path.join(".", "repo1"))]
+        )
+        mock_git_pull.assert_called_once_with(
+            os.path.join(".", "repo1"), "main", on_output=None
+        )
+
+    @patch("os.listdir")
+    @patch("os.path.isdir")
+    @patch("cli_utils.repo_status.probe_repositories")
+    @patch("cli.git_batch_puller.update_repository")
+    @patch("builtins.print")
+    def test_git_batch_puller__prints_blocks_in_stable_order(
+        self,
+        mock_print,
+        mock_update_repository,
+        mock_probe_repositories,
+        mock_isdir,
+        mock_listdir,
+    ):
+        # Setup mocks: the first repo is the slowest to finish
+        mock_listdir.return_value = ["slow", "fast"]
+        mock_isdir.return_value = True
+        mock_probe_repositories.side_effect = lambda paths: {
+            path: repo_status.RepoStatus("main") for path in paths
+        }
+        mock_update_repository.side_effect = lambda path, status: (
+            f"report {path}\n",
+            1.0,
+        )
+
+        with io.StringIO("y\n") as inputs:
+            sys.stdin = inputs
+            git_batch_puller.git_batch_puller(jobs=2)
+
+        # Reports are printed in directory order regardless of completion order
+        reports = [
+            c.args[0]
+            for c in mock_print.call_args_list
+            if c.args and c.args[0].startswith("report")
+        ]
+        self.assertEqual(
+            reports,
+            [
+                f"report {os.path.join('.', 'slow')}\n",
+                f"report {os.path.join('.', 'fast')}\n",
+            ],
+        )
+        summary = mock_print.call_args_list[-2].args[0]
+        self.assertIn("with 2 jobs", summary)
+        self.assertIn("(2.00s summed per-repo time)", summary)
+
+    @patch("os.listdir")
+    @patch("os.path.isdir")
+    @patch("cli_utils.pull_state.save_pull_state")
+    @patch("cli_utils.pull_state.load_pull_state")
+    @patch("cli_utils.repo_status.probe_repositories")
+    @patch("cli.git_batch_puller.get_remote_heads")
+    @patch("cli.git_batch_puller.contained_commits")
+    @patch("cli.git_batch_puller.update_repository")
+    @patch("builtins.print")
+    def test_git_batch_puller__incremental_only_pulls_moved_remotes(
+        self,
+        mock_print,
+        mock_update_repository,
+        mock_contained_commits,
+        mock_get_remote_heads,
+        mock_probe_repositories,
+        mock_load_pull_state,
+        mock_save_pull_state,
+        mock_isdir,
+        mock_listdir,
+    ):
+        # GIVEN: repo1's remote is where it was last time, repo2's moved
+        mock_listdir.return_value = ["repo1", "repo2"]
+        mock_isdir.return_value = True
+        repo1 = os.path.join(".", "repo1")
+        repo2 = os.path.join(".", "repo2")
+        heads = {
+            repo1: ("origin refs/heads/main", "1" * 40),
+            repo2: ("origin refs/heads/main", "3" * 40),
+        }
+        statuses = {path: repo_status.RepoStatus("main") for path in heads}
+        mock_probe_repositories.return_value = statuses
+        mock_get_remote_heads.return_value = heads
+        mock_load_pull_state.return_value = {
+            os.path.abspath(repo1): {"upstream": heads[repo1][0], "head": "1" * 40},
+            os.path.abspath(repo2): {"upstream": heads[repo2][0], "head": "2" * 40},
+        }
+        mock_update_repository.side_effect = lambda path, status: (
+            f"report {path}\n",
+            1.0,
+        )
+        mock_contained_commits.side_effect = list
+
+        # WHEN:
+        with io.StringIO("y\n") as inputs:
+            sys.stdin = inputs
+            git_batch_puller.git_batch_puller(jobs=2, incremental=True)
+
+        # THEN: only repo2 is pulled, and its new head is remembered
+        mock_get_remote_heads.assert_called_once_with(statuses)
+        mock_update_repository.assert_called_once_with(repo2, statuses[repo2])
+        mock_contained_commits.assert_called_once_with({repo2: "3" * 40})
+        saved = mock_save_pull_state.call_args.args[0]
+        self.assertEqual(saved[os.path.abspath(repo2)]["head"], "3" * 40)
+        printed = [c.args[0] for c in mock_print.call_args_list if c.args]
+        self.assertIn(
+            "⏭️  Skipped 1 repositories already up to date with their remote.",
+            printed,
+        )
+        self.assertIn("Processed 2 directories", printed[-2])
+
+    @patch("cli_utils.git_process.stream_git")
+    @patch("cli.git_batch_puller.get_upstream")
+    def test_fast_forward_branch__fetches_into_the_local_ref(
+        self, mock_get_upstream, mock_stream_git
+    ):
+        # GIVEN:
+        mock_get_upstream.return_value = ("origin", "refs/heads/main")
+        mock_stream_git.return_value = git_process.GitResult(
+            0, "", "   1a2b3c4..5d6e7f8  main       -> main\n"
+        )
+
+        # WHEN:
+        report, fast_forwarded = git_batch_puller.fast_forward_branch(
+            "/fake/path", "main"
+        )
+
+        # THEN: no checkout, git itself refuses anything but a fast-forward
+        self.assertEqual(
+            mock_stream_git.call_args.args[0],
+            [
+                "git",
+                "-C",
+                "/fake/path",
+                "-c",
+                "fetch.unpackLimit=1",
+                "fetch",
+                "--progress",
+                "origin",
+                "refs/heads/main:refs/heads/main",
+            ],
+        )
+        self.assertTrue(fast_forwarded)
+        self.assertIn("✅ Fast-forwarded main in /fake/path", report)
+
+    @patch("cli_utils.git_process.stream_git")
+    @patch("cli.git_batch_puller.get_upstream")
+    def test_fast_forward_branch__reports_diverged_branch(
+        self, mock_get_upstream, mock_stream_git
+    ):
+        # GIVEN:
+        mock_get_upstream.return_value = ("origin", "refs/heads/master")
+        mock_stream_git.return_value = git_process.GitResult(
+            1, "", " ! [rejected]        master     -> master  (non-fast-forward)\n"
+        )
+
+        # WHEN:
+        report, fast_forwarded = git_batch_puller.fast_forward_branch(
+            "/fake/path", "master"
+        )
+
+        # THEN:
+        self.assertFalse(fast_forwarded)
+        self.assertEqual(
+            report,
+            "🤔 Could not fast-forward master in /fake/path: "
+            "it has commits that aren't on origin.\n\n",
+        )
+
+    @patch("cli.git_batch_puller.get_default_branch")
+    @patch("cli.git_batch_puller.fast_forward_branch")
+    @patch("cli.git_batch_puller.git_pull")
+    def test_update_repository__fast_forwards_default_branch_of_feature_branch(
+        self,
+        mock_git_pull,
+        mock_fast_forward_branch,
+        mock_get_default_branch,
+    ):
+        # GIVEN:
+        mock_get_default_branch.return_value = "main"
+        mock_fast_forward_branch.return_value = ("🤔 Could not fast-forward\n", False)
+        not_fast_forwarded = []
+
+        # WHEN:
+        report, _ = git_batch_puller.update_repository(
+            "./repo1",
+            repo_status.RepoStatus("feature"),
+            fast_forward_default=True,
+            not_fast_forwarded=not_fast_forwarded,
+        )
+
+        # THEN: the feature branch isn't pulled, the failure is collected
+        mock_git_pull.assert_not_called()
+        mock_fast_forward_branch.assert_called_once_with(
+            "./repo1", "main", on_output=None
+        )
+        self.assertEqual(report, "🤔 Could not fast-forward\n")
+        self.assertEqual(not_fast_forwarded, ["./repo1"])
+
+    @patch("cli.git_batch_puller.git_pull")
+    def test_update_repository__skips_feature_branch(self, mock_git_pull):
+        report, seconds = git_batch_puller.update_repository(
+            "./repo1", repo_status.RepoStatus("feature")
+        )
+
+        self.assertEqual(
+            report, "🤔 Skipping ./repo1: Not on main or master branch.\n\n"
+        )
+        self.assertGreaterEqual(seconds, 0)
+        mock_git_pull.assert_not_called()
+
+    @patch("builtins.print")
+    def test_update_repository__skips_non_repositories(self, mock_print):
+        report, _ = git_batch_puller.update_repository("./notes", None)
+
+        self.assertEqual(report, "🤔 Skipping ./notes: Not a git repository.\n\n")
+
+    @patch("cli_utils.git_process.stream_git")
+    @patch("cli.git_batch_puller.get_upstream", return_value=None)
+    def test_update_repository__traces_the_pull_per_repository(
+        self, mock_get_upstream, mock_stream_git
+    ):
+        # GIVEN:
+        mock_stream_git.return_value = git_process.GitResult(0, "", "")
+        tracer = trace.start_tracing()
+        self.addCleanup(trace.stop_tracing)
+
+        # WHEN:
+        git_batch_puller.update_repository("./repo1", repo_status.RepoStatus("main"))
+
+        # THEN:
+        self.assertEqual(
+            [(event.phase, event.branch) for event in tracer.events],
+            [("pull", "./repo1")],
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from cli_utils import git_process, utils
+
+
+class TestGitProcess(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        subprocess.run(["git", "init", "-q", self.repo.name], check=True)
+        subprocess.run(
+            [
+                "git",
+                "-C",
+                self.repo.name,
+                "-c",
+                "user.name=Test",
+                "-c",
+                "user.email=test@example.com",
+                "commit",
+                "-q",
+                "--allow-empty",
+                "-m",
+                "first commit",
+            ],
+            check=True,
+        )
+
+    def tearDown(self):
+        self.repo.cleanup()
+
+    def test_run_git__captures_stdout_and_stderr_separately(self):
+        # WHEN: an argument with spaces and quotes is passed as-is, no shell involved
+        result = git_process.run_git(
+            ["git", "log", "-1", "--format=%s 'quoted' $HOME"], cwd=self.repo.name
+        )
+        failure = git_process.run_git(
+            ["git", "rev-parse", "--verify", "no-such-branch"], cwd=self.repo.name
+        )
+
+        # THEN:
+        self.assertEqual(result, (0, "first commit 'quoted' $HOME\n", ""))
+        self.assertNotEqual(failure.returncode, 0)
+        self.assertEqual(failure.stdout, "")
+        self.assertIn("fatal:", failure.stderr)
+
+    def test_stream_git__hands_on_output_and_keeps_a_bounded_tail(self):
+        # GIVEN: 50 commits
+        for number in range(50):
+            git_process.run_git(
+                [
+                    "git",
+                    "-c",
+                    "user.name=Test",
+                    "-c",
+                    "user.email=test@example.com",
+                    "commit",
+                    "-q",
+                    "--allow-empty",
+                    "-m",
+                    f"commit {number}",
+                ],
+                cwd=self.repo.name,
+            )
+        chunks = []
+
+        # WHEN:
+        result = git_process.stream_git(
+            ["git", "log", "--format=%s", "--reverse"],
+            cwd=self.repo.name,
+            on_output=lambda text, stream: chunks.append((text, stream)),
+            tail_lines=3,
+        )
+
+        # THEN: every line was handed on, only the last 3 are kept
+        self.assertEqual(result, (0, "commit 47\ncommit 48\ncommit 49\n", ""))
+        streamed = "".join(text for text, stream in chunks if stream == "stdout")
+        self.assertEqual(len(streamed.splitlines()), 51)
+
+    def test_run_git_command__passes_input_to_streamed_commands(self):
+        # WHEN: fetch, normally streamed, reads its refspecs from stdin
+        result = utils.run_git_command(
+            ["git", "fetch", "--stdin", self.repo.name],
+            cwd=self.repo.name,
+            input="HEAD:refs/heads/copy\n",
+        )
+
+        # THEN: the branch was fetched
+        heads = git_process.run_git(
+            ["git", "rev-parse", "copy", "HEAD"], cwd=self.repo.name
+        )
+        self.assertEqual(result.returncode, 0)
+        copy, head = heads.stdout.split()
+        self.assertEqual(copy, head)
+
+    def test_run_git_concurrently__returns_results_in_command_order(self):
+        finished = []
+
+        # WHEN: a command with stdin input, a failing one and a plain one
+        results = git_process.run_git_concurrently(
+            [
+                git_process.GitCommand(
+                    ["git", "hash-object", "--stdin"], cwd=self.repo.name, input="x\n"
+                ),
+                git_process.GitCommand(
+                    ["git", "rev-parse", "--verify", "no-such-branch"],
+                    cwd=self.repo.name,
+                ),
+                ["git", "--version"],
+            ],
+            on_finished=lambda args, started, seconds, result: finished.append(args),
+        )
+
+        # THEN:
+        self.assertEqual(
+            results[0], (0, "587be6b4c3f93f93c489c0111bba5596147a26cb\n", "")
+        )
+        self.assertNotEqual(results[1].returncode, 0)
+        self.assertTrue(results[2].stdout.startswith("git version"))
+        self.assertEqual(len(finished), 3)
+
+    def test_run_git_concurrently__kills_commands_that_time_out(self):
+        # GIVEN:
+        sleep = [sys.executable, "-c", "import time; time.sleep(30)"]
+        started = time.perf_counter()
+
+        # WHEN:
+        results = git_process.run_git_concurrently(
+            [sleep, ["git", "--version"]], timeout=0.5
+        )
+
+        # THEN: the slow command was killed, the other one wasn't affected
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertEqual(results[0].returncode, git_process.TIMEOUT_RETURNCODE)
+        self.assertIn("timed out", results[0].stderr)
+        self.assertEqual(results[1].returncode, 0)
+
+    def test_thread_pool__interrupt_kills_running_commands(self):
+        # GIVEN: one slot, taken by a command that would run for a minute
+        git_process.set_max_concurrency(1)
+        self.addCleanup(
+            git_process.set_max_concurrency, git_process.DEFAULT_MAX_CONCURRENCY
+        )
+        sleep = [sys.executable, "-c", "import time; time.sleep(60)"]
+        started = time.perf_counter()
+
+        # WHEN: Ctrl+C while it runs, with another command queued
+        with self.assertRaises(KeyboardInterrupt):
+            with git_process.thread_pool() as executor:
+                running = executor.submit(git_process.run_git, sleep)
+                queued = executor.submit(git_process.run_git, sleep)
+                while not git_process._running:
+                    time.sleep(0.01)
+                raise KeyboardInterrupt
+
+        # THEN: the pool didn't wait for either of them
+        self.assertNotEqual(running.result().returncode, 0)
+        self.assertTrue(queued.cancelled())
+        self.assertLess(time.perf_counter() - started, 30)
+
+    def test_output_tail__keeps_the_final_state_of_progress_lines(self):
+        # GIVEN:
+        tail = git_process.OutputTail(max_lines=2)
+
+        # WHEN:
+        tail.feed("remote: Total 3\nReceiving objects:  33% (1/3)\r")
+        tail.feed("Receiving objects: 100% (3/3), done.\nFrom origin\n")
+
+        # THEN:
+        self.assertEqual(
+            tail.text(), "Receiving objects: 100% (3/3), done.\nFrom origin\n"
+        )
+
+    def test_object_reader__answers_many_queries_from_one_process(self):
+        reader = git_process.ObjectReader(cwd=self.repo.name)
+        try:
+            head = reader.resolve("HEAD")
+            process = reader._process
+
+            self.assertEqual(head[1], "commit")
+            self.assertTrue(reader.exists("HEAD^{commit}"))
+            self.assertFalse(reader.exists("no-such-branch"))
+            self.assertFalse(reader.exists("has spaces missing"))
+            self.assertFalse(reader.exists(""))
+
+            # A ref created by another process is seen by the running reader
+            git_process.run_git(
+                ["git", "update-ref", "refs/heads/new-branch", head[0]],
+                cwd=self.repo.name,
+            )
+            self.assertEqual(reader.resolve("refs/heads/new-branch"), head)
+            self.assertIs(reader._process, process)
+        finally:
+            reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
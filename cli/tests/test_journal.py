@@ -0,0 +1,91 @@
+import os
+import unittest
+
+from cli.tests.git_repo_test_case import GitRepoTestCase
+from cli_utils import journal
+
+
+class TestJournal(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+        for branch in ("master", "b1", "b2"):
+            self.git("checkout", "-q", "-B", branch)
+            self.git("commit", "-q", "--allow-empty", "-m", branch)
+        self.patch_git()
+
+    def record_chain(self) -> journal.Journal:
+        run_journal = journal.Journal.start(
+            "merge", {"branches": ["master", "b1", "b2"]}, ordered=True
+        )
+        for branch in ("master", "b1", "b2"):
+            run_journal.record(
+                journal.Step(
+                    branch,
+                    journal.StepStatus.Done,
+                    self.head(f"refs/heads/{branch}"),
+                    pushed=True,
+                )
+            )
+        return run_journal
+
+    def test_resume__replays_the_recorded_steps_of_unmoved_branches(self):
+        # GIVEN: an interrupted run
+        self.record_chain()
+
+        # WHEN:
+        run_journal = journal.Journal.resume("merge", ordered=True)
+
+        # THEN:
+        self.assertEqual(run_journal.inputs, {"branches": ["master", "b1", "b2"]})
+        self.assertEqual(
+            [run_journal.replay(branch).branch for branch in ("master", "b1", "b2")],
+            ["master", "b1", "b2"],
+        )
+
+        # WHEN: the run completes
+        run_journal.finish()
+
+        # THEN: there is nothing left to resume
+        self.assertIsNone(journal.Journal.resume("merge"))
+
+    def test_replay__redoes_a_moved_branch_and_every_later_step_of_a_chain(self):
+        # GIVEN: b1 moved since the interrupted run
+        self.record_chain()
+        self.git("update-ref", "refs/heads/b1", "master")
+        run_journal = journal.Journal.resume("merge", ordered=True)
+
+        # WHEN:
+        replayed = [run_journal.replay(branch) for branch in ("master", "b1", "b2")]
+
+        # THEN: b2 was merged from the old b1, so it is redone as well
+        self.assertIsNotNone(replayed[0])
+        self.assertEqual(replayed[1:], [None, None])
+
+    def test_replay__only_redoes_the_moved_branch_of_independent_steps(self):
+        # GIVEN:
+        self.record_chain()
+        self.git("update-ref", "refs/heads/b1", "master")
+        run_journal = journal.Journal.resume("merge")
+
+        # WHEN:
+        replayed = [run_journal.replay(branch) for branch in ("master", "b1", "b2")]
+
+        # THEN:
+        self.assertEqual(
+            [step and step.branch for step in replayed], ["master", None, "b2"]
+        )
+
+    def test_start__keeps_the_journal_in_the_git_directory(self):
+        # WHEN:
+        journal.Journal.start("cherry-pick", {})
+
+        # THEN:
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.repo, ".git", "gitutils", "cherry-pick-journal.json")
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
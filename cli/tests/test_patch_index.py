@@ -0,0 +1,117 @@
+import os
+import unittest
+
+from cli.tests.git_repo_test_case import GitRepoTestCase
+from cli_utils import patch_index
+
+
+class TestPatchIndex(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+        # master: base. feature: fix. release: other, then the fix backported
+        # on top of it (same change, different parent). stale: other only.
+        self.commit("base.txt", "base")
+        self.git("checkout", "-q", "-b", "release")
+        self.commit("other.txt", "other")
+        self.git("branch", "stale")
+        self.git("checkout", "-q", "-b", "feature", "master")
+        self.fix = self.commit("fix.txt", "fix")
+        self.git("checkout", "-q", "release")
+        self.git("cherry-pick", self.fix)
+        for branch in ("release", "stale"):
+            self.git("update-ref", f"refs/remotes/origin/{branch}", branch)
+
+    def test_classify_branches__finds_backports_by_patch_id(self):
+        mock_run_command, mock_run_commands, _ = self.patch_git()
+
+        # WHEN:
+        classified = patch_index.classify_branches(
+            [self.fix], ["release", "stale", "missing"]
+        )
+
+        # THEN:
+        self.assertEqual(
+            classified,
+            {
+                "release": patch_index.BranchContainment(
+                    patch_index.Containment.Contains, []
+                ),
+                "stale": patch_index.BranchContainment(
+                    patch_index.Containment.NeedsPick, [self.fix]
+                ),
+                "missing": patch_index.BranchContainment(
+                    patch_index.Containment.Unknown, [self.fix]
+                ),
+            },
+        )
+
+        # THEN: both branch histories were read in one concurrent batch
+        self.assertEqual(
+            [len(c.args[0]) for c in mock_run_commands.call_args_list], [2, 2]
+        )
+
+        # WHEN: the branches didn't move, their indexes come from the cache
+        mock_run_command.reset_mock()
+        mock_run_commands.reset_mock()
+        patch_index.classify_branches([self.fix], ["release", "stale"])
+
+        # THEN: only the picked commit's patch id is computed
+        self.assertEqual(
+            [c.args[0][:2] for c in mock_run_command.call_args_list],
+            [["git", "log"], ["git", "patch-id"]],
+        )
+        self.assertEqual(
+            [len(c.args[0]) for c in mock_run_commands.call_args_list], [0, 0]
+        )
+
+    def test_classify_branches__unknown_when_history_is_cut_off(self):
+        # GIVEN: the backport on release is older than the last 3 commits
+        self.git("checkout", "-q", "release")
+        for content in ("later", "latest", "last"):
+            self.commit(f"{content}.txt", content)
+        self.git("update-ref", "refs/remotes/origin/release", "release")
+        self.patch_git()
+
+        # WHEN:
+        classified = patch_index.classify_branches(
+            [self.fix], ["release", "stale"], depth=3
+        )
+
+        # THEN: stale's whole history was read, release's wasn't
+        self.assertEqual(
+            classified,
+            {
+                "release": patch_index.BranchContainment(
+                    patch_index.Containment.Unknown, [self.fix]
+                ),
+                "stale": patch_index.BranchContainment(
+                    patch_index.Containment.NeedsPick, [self.fix]
+                ),
+            },
+        )
+
+    def test_prune_indexes__keeps_the_most_recently_used(self):
+        # GIVEN: four cached indexes, "c" read last
+        for age, tip in enumerate(["d", "c", "b", "a"]):
+            patch_index._write_index(
+                tip, patch_index.DEFAULT_DEPTH, patch_index.BranchIndex({})
+            )
+            path = patch_index._index_path(tip)
+            os.utime(path, (1000 - age, 1000 - age))
+        self.assertEqual(
+            patch_index._read_index("c", patch_index.DEFAULT_DEPTH),
+            patch_index.BranchIndex({}),
+        )
+
+        # WHEN:
+        patch_index._prune_indexes(keep=2)
+
+        # THEN:
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(patch_index._index_path("c")))),
+            ["c.json", "d.json"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cli_utils import plan, ref_index, utils
+
+
+class TestPlan(unittest.TestCase):
+    @unittest.skipUnless(importlib.util.find_spec("yaml"), "needs PyYAML")
+    def test_load_plan_file__reads_yaml_and_json(self):
+        # GIVEN:
+        with tempfile.TemporaryDirectory() as tmp:
+            yaml_path = os.path.join(tmp, "plan.yaml")
+            with open(yaml_path, "w", encoding="utf-8") as plan_file:
+                plan_file.write("jobs:\n  - merge: [master, dev]\n")
+            json_path = os.path.join(tmp, "plan.json")
+            with open(json_path, "w", encoding="utf-8") as plan_file:
+                json.dump({"jobs": [{"merge": ["master", "dev"]}]}, plan_file)
+
+            # WHEN:
+            from_yaml = plan.load_plan_file(yaml_path)
+            from_json = plan.load_plan_file(json_path)
+
+        # THEN:
+        self.assertEqual(from_yaml, from_json)
+
+    def test_parse_plan__applies_defaults_and_overrides(self):
+        # GIVEN:
+        data = {
+            "pull": "reset",
+            "on_conflict": "stop",
+            "jobs": [
+                {"name": "cascade", "merge": ["master", "release/*"]},
+                {
+                    "cherry_pick": "abc123",
+                    "branches": "hotfix",
+                    "pull": "rebase",
+                    "on_conflict": "skip",
+                    "worktrees": True,
+                },
+            ],
+        }
+
+        # WHEN:
+        jobs = plan.parse_plan(data)
+
+        # THEN:
+        self.assertEqual(
+            jobs,
+            [
+                plan.PlanJob(
+                    name="cascade",
+                    kind="merge",
+                    branches=["master", "release/*"],
+                    pull_choice=utils.PullConfigChoice.ResetToRemote,
+                    on_conflict=plan.ConflictPolicy.Stop,
+                ),
+                plan.PlanJob(
+                    name="job 2",
+                    kind="cherry-pick",
+                    branches=["hotfix"],
+                    pull_choice=utils.PullConfigChoice.RebaseLocalToRemote,
+                    on_conflict=plan.ConflictPolicy.Skip,
+                    commits=["abc123"],
+                    worktrees=True,
+                ),
+            ],
+        )
+
+    def test_parse_plan__rejects_invalid_jobs(self):
+        invalid_jobs = [
+            {"merge": ["master"]},
+            {"merge": ["a", "b"], "cherry_pick": "abc123"},
+            {"merge": ["a", "b"], "pull": "merge"},
+            {"merge": ["a", "b"], "push": True},
+            {"merge_graph": {"a": ["b"], "b": ["a"]}},
+            {"cherry_pick": "abc123", "branches": ["a"], "on_conflict": "theirs"},
+            {"cherry_pick": [], "branches": ["a"]},
+            {
+                "cherry_pick": "abc123",
+                "branches": ["a"],
+                "on_conflict": "stop",
+                "worktrees": True,
+            },
+        ]
+        for job in invalid_jobs:
+            with self.subTest(job=job), self.assertRaises(plan.PlanError):
+                plan.parse_plan({"jobs": [job]})
+
+    def test_resolve_plan__expands_merge_graph(self):
+        # GIVEN:
+        refs = ref_index.RefIndex(["main", "release", "qa-a", "qa-b"], [])
+        jobs = plan.parse_plan(
+            {"jobs": [{"merge_graph": {"main": "release", "release": ["qa-*"]}}]}
+        )
+
+        # WHEN:
+        plan.resolve_plan(jobs, refs)
+
+        # THEN:
+        self.assertEqual(jobs[0].kind, "merge-graph")
+        self.assertEqual(
+            jobs[0].graph, {"main": ["release"], "release": ["qa-a", "qa-b"]}
+        )
+        self.assertEqual(jobs[0].branches, ["main", "release", "qa-a", "qa-b"])
+
+    @patch("cli_utils.utils.resolve_commit", return_value=None)
+    def test_resolve_plan__expands_patterns_and_lists_every_problem(
+        self, mock_resolve_commit
+    ):
+        # GIVEN:
+        refs = ref_index.RefIndex(["master", "release/1", "release/2"], [])
+        jobs = plan.parse_plan(
+            {
+                "jobs": [
+                    {"merge": ["master", "release/*"]},
+                    {"merge": ["release/1", "master"]},
+                    {"cherry_pick": "abc123", "branches": ["nope/*"]},
+                ]
+            }
+        )
+
+        # WHEN:
+        with self.assertRaises(plan.PlanError) as context:
+            plan.resolve_plan(jobs, refs)
+
+        # THEN:
+        self.assertEqual(jobs[0].branches, ["master", "release/1", "release/2"])
+        self.assertEqual(
+            str(context.exception).splitlines(),
+            [
+                "job 2: main or master can only be merged into other branches.",
+                "job 3: no branches match nope/*.",
+                "job 3: Commit abc123 does not exist.",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from unittest.mock import call, patch
+
+from cli_utils import plumbing, utils
+
+
+class TestPlumbing(unittest.TestCase):
+    @patch("cli_utils.utils.run_git_command")
+    def test_merge_tree__parses_conflicted_files(self, mock_run_command):
+        # GIVEN: merge-tree exits 1 and lists the conflicted files
+        mock_run_command.return_value = (
+            1,
+            "tree_sha\na.txt\nb.txt\n\nAuto-merging a.txt\nCONFLICT (content)\n",
+            "",
+        )
+
+        # WHEN:
+        result = plumbing.merge_tree("ours", "theirs")
+
+        # THEN:
+        self.assertEqual(
+            result,
+            plumbing.MergeTreeResult(
+                clean=False, tree="tree_sha", conflicted_files=["a.txt", "b.txt"]
+            ),
+        )
+        mock_run_command.assert_called_once_with(
+            ["git", "merge-tree", "--write-tree", "--name-only", "ours", "theirs"]
+        )
+
+    @patch("cli_utils.utils.run_git_command")
+    def test_merge_commits__creates_merge_commit(self, mock_run_command):
+        # GIVEN:
+        mock_run_command.side_effect = [
+            (1, "", ""),  # output for the call to check theirs is an ancestor
+            (1, "", ""),  # output for the call to check ours is an ancestor
+            (0, "tree_sha\n", ""),  # output for the call to merge-tree
+            (0, "merge_sha\n", ""),  # output for the call to commit-tree
+        ]
+
+        # WHEN:
+        result = plumbing.merge_commits("ours", "theirs", "Merge branch 'a' into b")
+
+        # THEN:
+        self.assertTrue(result.clean)
+        self.assertEqual(result.commit, "merge_sha")
+        assert mock_run_command.call_args_list == [
+            call(["git", "merge-base", "--is-ancestor", "theirs", "ours"]),
+            call(["git", "merge-base", "--is-ancestor", "ours", "theirs"]),
+            call(
+                ["git", "merge-tree", "--write-tree", "--name-only", "ours", "theirs"]
+            ),
+            call(
+                [
+                    "git",
+                    "commit-tree",
+                    "tree_sha",
+                    "-p",
+                    "ours",
+                    "-p",
+                    "theirs",
+                    "-m",
+                    "Merge branch 'a' into b",
+                ],
+                env=None,
+            ),
+        ]
+
+    @patch("cli_utils.plumbing.is_ancestor")
+    @patch("cli_utils.plumbing.rev_parse")
+    def test_resolve_target_tip__diverged_local_needs_checkout(
+        self, mock_rev_parse, mock_is_ancestor
+    ):
+        # GIVEN: local and remote both have commits the other doesn't
+        mock_rev_parse.side_effect = lambda rev: {
+            "refs/heads/b1": "local_sha",
+            "refs/remotes/origin/b1": "remote_sha",
+        }[rev]
+        mock_is_ancestor.return_value = False
+
+        # WHEN / THEN: a rebase needs a working tree, a reset doesn't
+        self.assertEqual(
+            plumbing.resolve_target_tip(
+                "b1", utils.PullConfigChoice.RebaseLocalToRemote
+            ),
+            (None, "local_sha"),
+        )
+        self.assertEqual(
+            plumbing.resolve_target_tip("b1", utils.PullConfigChoice.ResetToRemote),
+            ("remote_sha", "local_sha"),
+        )
+
+    @patch("cli_utils.utils.resolve_object")
+    @patch("cli_utils.utils.run_git_command")
+    def test_cherry_pick_commit__already_applied_change_is_not_committed(
+        self, mock_run_command, mock_resolve_object
+    ):
+        # GIVEN: merge-tree leaves the tree of onto as it was
+        mock_run_command.side_effect = [
+            (0, "parent_sha\n", ""),  # output for the call to rev-parse the parent
+            (0, "onto_tree\n", ""),  # output for the call to merge-tree
+        ]
+        mock_resolve_object.return_value = "onto_tree"
+
+        # WHEN:
+        result = plumbing.cherry_pick_commit("onto", "commit")
+
+        # THEN: no empty commit is created
+        self.assertEqual(
+            result,
+            plumbing.MergeTreeResult(
+                clean=False, tree="onto_tree", already_applied=True
+            ),
+        )
+        mock_resolve_object.assert_called_once_with("onto^{tree}")
+        self.assertEqual(mock_run_command.call_count, 2)
+
+    @patch("cli_utils.utils.has_remote_branch")
+    @patch("cli_utils.utils.run_git_command")
+    def test_update_ref__new_branch_tracks_its_remote(
+        self, mock_run_command, mock_has_remote_branch
+    ):
+        # GIVEN:
+        mock_run_command.return_value = (0, "", "")
+        mock_has_remote_branch.return_value = True
+
+        # WHEN: the branch only exists as origin/b1
+        updated = plumbing.update_ref("b1", "new_sha", None)
+
+        # THEN:
+        self.assertTrue(updated)
+        assert mock_run_command.call_args_list == [
+            call(["git", "update-ref", "refs/heads/b1", "new_sha", plumbing.ZERO_OID]),
+            call(["git", "branch", "--set-upstream-to=origin/b1", "b1"]),
+        ]
+
+        # WHEN: the branch already existed
+        mock_run_command.reset_mock()
+        plumbing.update_ref("b1", "newer_sha", "new_sha")
+
+        # THEN: its upstream is left alone
+        mock_run_command.assert_called_once_with(
+            ["git", "update-ref", "refs/heads/b1", "newer_sha", "new_sha"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from cli.tests.git_repo_test_case import GitRepoTestCase
+from cli_utils import preflight, utils
+
+
+class TestPreflight(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter_repo()
+
+    def test_simulate_merge_chain__carries_merged_result_to_next_hop(self):
+        # GIVEN: b2 conflicts with a file that only reaches it through b1
+        self.commit("base.txt", "base")
+        self.git("branch", "b1")
+        self.git("branch", "b2")
+        self.git("branch", "b3")
+        self.commit("shared.txt", "from master")
+        self.git("checkout", "-q", "b1")
+        self.commit("b1.txt", "b1")
+        self.git("checkout", "-q", "b2")
+        self.commit("shared.txt", "from b2")
+        self.git("checkout", "-q", "master")
+        for branch in ("master", "b1", "b2", "b3"):
+            self.git("update-ref", f"refs/remotes/origin/{branch}", branch)
+
+        # WHEN:
+        predictions = preflight.simulate_merge_chain(
+            ["master", "b1", "b2", "b3"], utils.PullConfigChoice.ResetToRemote
+        )
+
+        # THEN: no branch was touched, and the conflict is found two hops down
+        self.assertEqual(
+            [(p.branch, p.status, p.conflicted_files) for p in predictions],
+            [
+                ("b1", preflight.HopStatus.Clean, []),
+                ("b2", preflight.HopStatus.Conflict, ["shared.txt"]),
+                ("b3", preflight.HopStatus.FastForward, []),
+            ],
+        )
+        self.assertEqual(
+            utils.run_git_command(["git", "rev-parse", "b1"])[1],
+            utils.run_git_command(["git", "rev-parse", "origin/b1"])[1],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cli_utils import pull_state
+
+HEAD = ("origin refs/heads/main", "a" * 40)
+
+
+class TestPullState(unittest.TestCase):
+    def setUp(self):
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_home.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.cache_home.cleanup()
+
+    def test_pull_state__round_trips_the_recorded_heads(self):
+        # GIVEN: a head recorded and saved by a previous run
+        repos = pull_state.load_pull_state()
+        self.assertEqual(repos, {})
+        pull_state.record(repos, "./repo1", HEAD)
+        pull_state.save_pull_state(repos)
+
+        # WHEN:
+        repos = pull_state.load_pull_state()
+
+        # THEN: only the exact same upstream and head count as up to date
+        self.assertTrue(pull_state.is_up_to_date(repos, "./repo1", HEAD))
+        self.assertFalse(
+            pull_state.is_up_to_date(repos, "./repo1", (HEAD[0], "b" * 40))
+        )
+        self.assertFalse(
+            pull_state.is_up_to_date(repos, "./repo1", ("origin refs/heads/x", HEAD[1]))
+        )
+        self.assertFalse(pull_state.is_up_to_date(repos, "./repo2", HEAD))
+        self.assertFalse(pull_state.is_up_to_date(repos, "./repo1", None))
+
+    def test_load_pull_state__ignores_an_unreadable_file(self):
+        # GIVEN:
+        with open(pull_state.state_path(), "w", encoding="utf-8") as state_file:
+            state_file.write("{not json")
+
+        # WHEN / THEN:
+        self.assertEqual(pull_state.load_pull_state(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
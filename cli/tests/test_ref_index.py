@@ -0,0 +1,100 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cli_utils import ref_index, utils
+
+
+class TestRefIndex(unittest.TestCase):
+    @patch("cli_utils.utils.run_git_command")
+    def test_build_ref_index__separates_local_and_remote(self, mock_run_command):
+        # GIVEN:
+        mock_run_command.return_value = (
+            0,
+            "refs/heads/master\n"
+            "refs/heads/feature\n"
+            "refs/remotes/origin/HEAD\n"
+            "refs/remotes/origin/master\n"
+            "refs/remotes/origin/release/1.0\n",
+            "",
+        )
+
+        # WHEN:
+        index = ref_index.build_ref_index()
+
+        # THEN:
+        self.assertEqual(index.local_branches, ["feature", "master"])
+        self.assertEqual(index.remote_branches, ["master", "release/1.0"])
+        self.assertTrue(index.is_local("feature"))
+        self.assertFalse(index.is_remote("feature"))
+        self.assertNotIn("HEAD", index)
+        self.assertIn("release/1.0", index)
+
+    def test_match__expands_globs_and_prefixes(self):
+        index = ref_index.RefIndex(
+            ["release/1.0", "feature"], ["release/1.1", "release/2.0", "releases"]
+        )
+
+        self.assertEqual(
+            index.match("release/*"), ["release/1.0", "release/1.1", "release/2.0"]
+        )
+        self.assertEqual(index.match("release/1.?"), ["release/1.0", "release/1.1"])
+        self.assertEqual(index.match("hotfix/*"), [])
+        self.assertEqual(
+            index.with_prefix("release"),
+            ["release/1.0", "release/1.1", "release/2.0", "releases"],
+        )
+
+    @patch("builtins.input")
+    @patch("builtins.print")
+    def test_get_input_branches_from_user__expands_patterns(
+        self, mock_print, mock_input
+    ):
+        # GIVEN:
+        mock_input.side_effect = ["master", "release/*", "nope/*", ""]
+        index = ref_index.RefIndex(["master"], ["release/1.0", "release/1.1"])
+
+        # WHEN:
+        branches = utils.get_input_branches_from_user(index)
+
+        # THEN:
+        self.assertEqual(branches, ["master", "release/1.0", "release/1.1"])
+        mock_print.assert_any_call(
+            "Pattern release/* matched: release/1.0, release/1.1"
+        )
+        mock_print.assert_any_call("No branches match nope/*. Skipping...")
+
+    def test_load_ref_index__cached_until_refs_change(self):
+        with tempfile.TemporaryDirectory() as cache_home, tempfile.TemporaryDirectory() as repo, patch.dict(
+            os.environ, {"XDG_CACHE_HOME": cache_home}
+        ):
+            git = ["git", "-C", repo, "-c", "user.name=T", "-c", "user.email=t@e.st"]
+            subprocess.run(git + ["init", "-q", "-b", "master"], check=True)
+            subprocess.run(
+                git + ["commit", "-q", "--allow-empty", "-m", "c"], check=True
+            )
+            cwd = os.getcwd()
+            os.chdir(repo)
+            try:
+                self.assertEqual(ref_index.load_ref_index().local_branches, ["master"])
+
+                # Unchanged refs: served from the cache without for-each-ref
+                with patch("cli_utils.ref_index.build_ref_index") as mock_build:
+                    self.assertEqual(
+                        ref_index.load_ref_index().local_branches, ["master"]
+                    )
+                mock_build.assert_not_called()
+
+                # A new loose ref changes refs/heads and invalidates the cache
+                subprocess.run(git + ["branch", "feature"], check=True)
+                self.assertEqual(
+                    ref_index.load_ref_index().local_branches, ["feature", "master"]
+                )
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cli_utils import repo_discovery
+
+
+class TestRepoDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.workspace = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_home.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.cache_home.cleanup()
+        self.workspace.cleanup()
+
+    def make_dirs(self, *paths):
+        for path in paths:
+            os.makedirs(os.path.join(self.workspace.name, path))
+
+    def test_discover_repositories__walks_nested_and_prunes(self):
+        # GIVEN: repos grouped in team folders, one repo with a nested repo inside
+        self.make_dirs(
+            "team-a/service1/.git",
+            "team-a/service1/vendored/.git",
+            "team-b/nested/service2/.git",
+            "team-b/node_modules/pkg/.git",
+            "plain/folder",
+        )
+
+        # WHEN:
+        repos = repo_discovery.discover_repositories(self.workspace.name)
+
+        # THEN: the walk stops at each .git and skips ignored folders
+        self.assertEqual(
+            repos,
+            [
+                os.path.join(self.workspace.name, "team-a/service1"),
+                os.path.join(self.workspace.name, "team-b/nested/service2"),
+            ],
+        )
+
+    def test_discover_repositories__reuses_index_until_a_directory_changes(self):
+        # GIVEN: a first run that builds the index
+        self.make_dirs("team-a/service1/.git")
+        repo_discovery.discover_repositories(self.workspace.name)
+
+        # WHEN: nothing changed, no directory is listed again
+        with patch("cli_utils.repo_discovery._scan_directory") as mock_scan:
+            repos = repo_discovery.discover_repositories(self.workspace.name)
+        mock_scan.assert_not_called()
+        self.assertEqual(repos, [os.path.join(self.workspace.name, "team-a/service1")])
+
+        # WHEN: a new repo shows up, its parent's mtime invalidates that entry
+        self.make_dirs("team-a/service2/.git")
+        repos = repo_discovery.discover_repositories(self.workspace.name)
+        self.assertEqual(
+            repos,
+            [
+                os.path.join(self.workspace.name, "team-a/service1"),
+                os.path.join(self.workspace.name, "team-a/service2"),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
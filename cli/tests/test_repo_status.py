@@ -0,0 +1,77 @@
+import os
+import subprocess
+import tempfile
+import unittest
+
+from cli_utils import repo_status
+
+
+class TestRepoStatus(unittest.TestCase):
+    def test_parse_status__reads_branch_upstream_and_changes(self):
+        # GIVEN:
+        output = (
+            "# branch.oid 1a2b3c4d\n"
+            "# branch.head main\n"
+            "# branch.upstream origin/main\n"
+            "# branch.ab +2 -5\n"
+            "1 .M N... 100644 100644 100644 1a2b 1a2b README.md\n"
+        )
+
+        # WHEN:
+        status = repo_status.parse_status(output)
+
+        # THEN:
+        self.assertEqual(
+            status,
+            repo_status.RepoStatus(
+                "main", upstream="origin/main", ahead=2, behind=5, dirty=True
+            ),
+        )
+
+    def test_parse_status__detached_head_without_upstream(self):
+        status = repo_status.parse_status(
+            "# branch.oid 1a2b3c4d\n# branch.head (detached)\n"
+        )
+
+        self.assertEqual(status, repo_status.RepoStatus(None))
+
+    def test_probe_repositories__one_status_per_directory(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            # GIVEN: a clean repository, one with a change and a plain directory
+            repos = [os.path.join(workspace, name) for name in ("clean", "changed")]
+            for repo in repos:
+                git = [
+                    "git",
+                    "-C",
+                    repo,
+                    "-c",
+                    "user.name=T",
+                    "-c",
+                    "user.email=t@e.st",
+                ]
+                subprocess.run(["git", "init", "-q", "-b", "main", repo], check=True)
+                with open(os.path.join(repo, "file"), "w") as file:
+                    file.write("a")
+                subprocess.run(git + ["add", "file"], check=True)
+                subprocess.run(git + ["commit", "-q", "-m", "c"], check=True)
+            with open(os.path.join(repos[1], "file"), "w") as file:
+                file.write("b")
+            plain = os.path.join(workspace, "plain")
+            os.mkdir(plain)
+
+            # WHEN:
+            statuses = repo_status.probe_repositories(repos + [plain])
+
+            # THEN:
+            self.assertEqual(
+                statuses,
+                {
+                    repos[0]: repo_status.RepoStatus("main"),
+                    repos[1]: repo_status.RepoStatus("main", dirty=True),
+                    plain: None,
+                },
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
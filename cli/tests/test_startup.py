@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# Microseconds `python -X importtime` may report for importing a command,
+# interpreter start-up excluded. Most of it is the standard library the
+# commands need (argparse, re, subprocess, dataclasses); the budget leaves
+# room for slow machines, the deferred modules check below is exact.
+START_UP_BUDGET_US = 250_000
+# Only imported by the code paths that use them
+DEFERRED_MODULES = ["asyncio", "concurrent.futures", "yaml"]
+COMMANDS = [
+    "cli.git_batch_merger",
+    "cli.git_batch_cherry_picker",
+    "cli.git_batch_puller",
+    "cli.git_batch_plan",
+    "cli.git_daemon",
+]
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of every module importing module loads"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        encoding="utf-8",
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        _, cumulative, name = (part.strip() for part in line.split("|"))
+        if cumulative.isdigit():
+            times[name] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def test_commands__import_within_the_start_up_budget(self):
+        for command in COMMANDS:
+            with self.subTest(command=command):
+                # WHEN: the best of a few runs, as timings are noisy
+                runs = [import_times(command) for _ in range(3)]
+
+                # THEN:
+                self.assertLess(min(run[command] for run in runs), START_UP_BUDGET_US)
+                for module in DEFERRED_MODULES:
+                    self.assertNotIn(module, runs[0])
+
+    def test_entry_points__only_import_their_command(self):
+        # WHEN:
+        times = import_times("cli.entry_points")
+
+        # THEN:
+        self.assertFalse([module for module in times if module.startswith("cli_utils")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cli_utils import git_process, trace, utils
+
+
+class TestTrace(unittest.TestCase):
+    def tearDown(self):
+        trace.stop_tracing()
+
+    @patch("cli_utils.git_process.stream_git")
+    @patch("cli_utils.git_process.run_git")
+    def test_run_git_command__records_phase_and_branch(
+        self, mock_run_git, mock_stream_git
+    ):
+        # GIVEN:
+        mock_run_git.return_value = git_process.GitResult(0, "", "")
+        mock_stream_git.return_value = git_process.GitResult(0, "", "")
+        tracer = trace.start_tracing()
+
+        # WHEN:
+        utils.run_git_command(["git", "branch", "--show-current"])
+        with trace.phase("merge", "branch1"):
+            utils.run_git_command(["git", "merge", "master"])
+            with trace.phase("push"):
+                utils.run_git_command(["git", "push", "origin", "branch1"])
+        utils.run_git_command(["git", "checkout", "master"])
+
+        # THEN: nested phases keep the enclosing branch and are undone on exit
+        self.assertEqual(
+            [(event.phase, event.branch) for event in tracer.events],
+            [
+                ("setup", None),
+                ("merge", "branch1"),
+                ("push", "branch1"),
+                ("setup", None),
+            ],
+        )
+
+    @patch("cli_utils.git_process.run_git")
+    def test_run_git_command__not_recorded_without_tracing(self, mock_run_git):
+        # GIVEN:
+        mock_run_git.return_value = git_process.GitResult(0, "", "")
+        tracer = trace.start_tracing()
+        trace.stop_tracing()
+
+        # WHEN:
+        utils.run_git_command(["git", "status"])
+
+        # THEN:
+        self.assertEqual(tracer.events, [])
+
+    @patch("builtins.print")
+    def test_tracing__writes_chrome_trace(self, mock_print):
+        # GIVEN:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+
+            # WHEN:
+            with trace.tracing(path):
+                with trace.phase("fetch"):
+                    trace.record(["git", "fetch", "origin"], 0.0, 0.25, 0)
+
+            # THEN:
+            with open(path, encoding="utf-8") as trace_file:
+                events = json.load(trace_file)["traceEvents"]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["name"], "git fetch origin")
+        self.assertEqual(events[0]["cat"], "fetch")
+        self.assertEqual(events[0]["ph"], "X")
+        self.assertEqual(events[0]["dur"], 250000)
+        self.assertEqual(events[0]["args"]["exit_code"], 0)
+        mock_print.assert_any_call(f"Trace written to {path}")
+
+
+if __name__ == "__main__":
+    unittest.main()
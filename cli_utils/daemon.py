@@ -0,0 +1,182 @@
+"""
+Optional background daemon keeping repository state warm between invocations:
+ref indexes, discovered repository lists and the batch puller's pull state.
+
+It listens on a Unix socket in the cache directory and answers one JSON line
+per connection. Everything it serves is revalidated on each request with the
+same stat signatures the on-disk caches use, so it never answers stale data;
+it only saves the reloading and rebuilding. Commands ask it first through
+`request` and fall back to their own caches when no daemon is running.
+"""
+
+import json
+import os
+import threading
+
+from cli_utils import utils
+
+# Seconds a command waits for an answer before doing the work itself
+REQUEST_TIMEOUT = 2.0
+
+
+def socket_path() -> str:
+    return os.path.join(utils.get_cache_dir(), "daemon.sock")
+
+
+def request(method: str, **params):
+    """
+    Ask the running daemon for method(**params).
+    Returns nothing when there is no daemon or it could not answer.
+    """
+    return _ask(socket_path(), method, params)
+
+
+def _ask(path: str, method: str, params: dict):
+    if not os.path.exists(path):
+        return None
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(REQUEST_TIMEOUT)
+            client.connect(path)
+            message = json.dumps({"method": method, "params": params})
+            client.sendall(message.encode("utf-8") + b"\n")
+            with client.makefile("rb") as answer:
+                response = json.loads(answer.readline())
+    except (OSError, ValueError):
+        return None
+    return response.get("result") if isinstance(response, dict) else None
+
+
+class DaemonState:
+    """The state served by the daemon, revalidated on every request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._git_dirs = {}
+        self._ref_indexes = {}
+        self._repo_dirs = {}
+        self._pull_state = (None, {})
+
+    def ref_index(self, cwd: str) -> dict | None:
+        # Imported here: ref_index asks the daemon, the daemon builds ref indexes
+        from cli_utils import ref_index
+
+        git_dir = self._git_dir(cwd)
+        if git_dir is None:
+            return None
+        signature = ref_index.refs_signature(git_dir)
+        with self._lock:
+            cached = self._ref_indexes.get(git_dir)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        index = ref_index.build_ref_index(git_dir=git_dir).to_dict()
+        with self._lock:
+            self._ref_indexes[git_dir] = (signature, index)
+        return index
+
+    def repositories(self, root: str, ignore: list[str]) -> list[str]:
+        from cli_utils import repo_discovery
+
+        key = (root, tuple(ignore))
+        with self._lock:
+            cached_dirs = self._repo_dirs.get(key, {})
+        repos, dirs = repo_discovery.walk_repositories(root, key[1], cached_dirs)
+        with self._lock:
+            self._repo_dirs[key] = dirs
+        return repos
+
+    def pull_state(self) -> dict:
+        from cli_utils import pull_state
+
+        path = pull_state.state_path()
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return {}
+        with self._lock:
+            if self._pull_state[0] == signature:
+                return self._pull_state[1]
+        try:
+            with open(path, encoding="utf-8") as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+        repos = {}
+        if isinstance(state, dict) and state.get("version") == pull_state.STATE_VERSION:
+            repos = state.get("repos", {})
+        with self._lock:
+            self._pull_state = (signature, repos)
+        return repos
+
+    def _git_dir(self, cwd: str) -> str | None:
+        with self._lock:
+            git_dir = self._git_dirs.get(cwd)
+        if git_dir is not None and os.path.isdir(git_dir):
+            return git_dir
+        return_code, output, _ = utils.run_git_command(
+            [
+                "git",
+                "-C",
+                cwd,
+                "rev-parse",
+                "--path-format=absolute",
+                "--git-common-dir",
+            ]
+        )
+        if return_code != 0:
+            return None
+        git_dir = output.strip()
+        with self._lock:
+            self._git_dirs[cwd] = git_dir
+        return git_dir
+
+
+def serve(path: str | None = None, on_ready=None) -> None:
+    """Serve requests on the socket at path until a `shutdown` request"""
+    import socketserver
+
+    path = path or socket_path()
+    state = DaemonState()
+    methods = {
+        "ping": lambda: True,
+        "ref_index": state.ref_index,
+        "repositories": state.repositories,
+        "pull_state": state.pull_state,
+    }
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                message = json.loads(self.rfile.readline())
+                method = message["method"]
+                if method == "shutdown":
+                    response = {"result": True}
+                    threading.Thread(target=self.server.shutdown).start()
+                else:
+                    response = {"result": methods[method](**message["params"])}
+            except Exception as error:  # the client falls back on any failure
+                response = {"error": str(error)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+    # A socket left behind by a daemon that didn't stop cleanly
+    if os.path.exists(path) and _ask(path, "ping", {}) is None:
+        os.unlink(path)
+    previous_umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    finally:
+        os.umask(previous_umask)
+    server.daemon_threads = True
+    try:
+        if on_ready:
+            on_ready()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,127 @@
+"""
+Scheduling of merges over a graph of branches, e.g.
+main -> release -> {team-a-qa, team-b-qa}, with stacked branches below each.
+A branch is merged once all of its parents are done. Independent subtrees
+run concurrently, and a failed branch only skips its own descendants,
+so the whole graph takes about as long as its longest path.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from cli_utils import git_process
+
+
+class GraphError(Exception):
+    """The branch graph is not a DAG"""
+
+
+class NodeStatus:
+    Source = "source"  # a branch without parents, only merged from
+    Merged = "merged"
+    Failed = "failed"
+    Skipped = "skipped"
+
+
+@dataclass
+class NodeResult:
+    """Outcome of one branch: its new head (None unless it succeeded) and report"""
+
+    status: str
+    head: str | None = None
+    report: str = ""
+
+
+class MergeGraph:
+    """Branches and the parents merged into each of them, in input order"""
+
+    def __init__(self, edges: Iterable[tuple[str, str]]):
+        self.parents: dict[str, list[str]] = {}
+        self.children: dict[str, list[str]] = {}
+        for parent, child in edges:
+            if parent == child:
+                raise GraphError(f"{parent} can't be merged into itself.")
+            for node in (parent, child):
+                self.parents.setdefault(node, [])
+                self.children.setdefault(node, [])
+            if parent not in self.parents[child]:
+                self.parents[child].append(parent)
+                self.children[parent].append(child)
+        self.topological_order()
+
+    @property
+    def nodes(self) -> list[str]:
+        return list(self.parents)
+
+    def topological_order(self) -> list[str]:
+        """Parents before children. Raises GraphError if the graph has a cycle."""
+        pending = {node: len(parents) for node, parents in self.parents.items()}
+        ready = deque(node for node, count in pending.items() if count == 0)
+        order = []
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for child in self.children[node]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    ready.append(child)
+        if len(order) != len(self.parents):
+            cycle = sorted(node for node in self.parents if node not in order)
+            raise GraphError(
+                f"The branch graph has a cycle through: {', '.join(cycle)}"
+            )
+        return order
+
+
+def run_graph(
+    graph: MergeGraph,
+    merge_node: Callable[[str, dict[str, str]], NodeResult],
+    on_result: Callable[[str, NodeResult], None] | None = None,
+) -> dict[str, NodeResult]:
+    """
+    Run merge_node(branch, {parent: parent head}) on the shared
+    git_process.thread_pool, each branch as soon as all its parents succeeded. Branches without
+    parents are called with an empty mapping and resolve their own head.
+    Descendants of a failed branch are Skipped without being called.
+    on_result is called on this thread as each branch finishes.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    results: dict[str, NodeResult] = {}
+    waiting_on = {node: set(parents) for node, parents in graph.parents.items()}
+    ready = deque(node for node in graph.nodes if not waiting_on[node])
+    running = {}
+
+    def finish(node: str, result: NodeResult) -> None:
+        results[node] = result
+        if on_result:
+            on_result(node, result)
+        for child in graph.children[node]:
+            waiting_on[child].discard(node)
+            if not waiting_on[child]:
+                ready.append(child)
+
+    with git_process.thread_pool() as executor:
+        while ready or running:
+            while ready:
+                node = ready.popleft()
+                parents = graph.parents[node]
+                failed = [parent for parent in parents if results[parent].head is None]
+                if failed:
+                    finish(
+                        node,
+                        NodeResult(
+                            NodeStatus.Skipped,
+                            report=f"Skipping {node}: {', '.join(failed)} not merged\n",
+                        ),
+                    )
+                    continue
+                heads = {parent: results[parent].head for parent in parents}
+                running[executor.submit(merge_node, node, heads)] = node
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(running.pop(future), future.result())
+    return results
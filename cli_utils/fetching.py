@@ -0,0 +1,136 @@
+"""
+Fetch strategies for huge repositories, and the transfer statistics of a fetch.
+FetchOptions narrow what a fetch downloads (no tags, a partial clone filter,
+a depth). They are set once from the command line with configure() and used
+by every fetch and pull the commands make.
+"""
+
+import argparse
+import re
+from dataclasses import dataclass
+
+# Keep even small fetches as one pack: git then reports the bytes received,
+# and the repository isn't littered with loose objects.
+PACK_ARGUMENTS = ["-c", "fetch.unpackLimit=1"]
+
+_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024**2, "GiB": 1024**3}
+_TOTAL_RE = re.compile(r"^remote: Total (\d+)", re.MULTILINE)
+_RECEIVED_RE = re.compile(
+    r"Receiving objects: 100% \((\d+)/\d+\), ([\d.]+) (bytes|KiB|MiB|GiB)"
+)
+
+
+@dataclass
+class FetchOptions:
+    no_tags: bool = False
+    filter: str | None = None  # e.g. blob:none, makes the remote a partial clone
+    depth: int | None = None
+
+    def arguments(self, include_filter: bool = True) -> list[str]:
+        """Options for git fetch (git pull takes them without --filter)"""
+        arguments = ["--progress"]
+        if self.no_tags:
+            arguments.append("--no-tags")
+        if self.filter and include_filter:
+            arguments.append(f"--filter={self.filter}")
+        if self.depth:
+            arguments.append(f"--depth={self.depth}")
+        return arguments
+
+
+@dataclass
+class TransferStats:
+    objects: int = 0
+    bytes: int | None = None  # None if git didn't say
+
+    def __str__(self) -> str:
+        if self.bytes is None:
+            return f"{self.objects} objects"
+        return f"{self.objects} objects, {format_bytes(self.bytes)}"
+
+
+_options = FetchOptions()
+
+
+def configure(options: FetchOptions) -> None:
+    global _options
+    _options = options
+
+
+def get_options() -> FetchOptions:
+    return _options
+
+
+def format_bytes(size: int) -> str:
+    if size < 1024:
+        return f"{size} bytes"
+    for unit in ("KiB", "MiB", "GiB"):
+        size /= 1024
+        if size < 1024 or unit == "GiB":
+            return f"{size:.2f} {unit}"
+
+
+def fetch_command(*arguments: str, git_options: tuple[str, ...] = ()) -> list[str]:
+    """git fetch with the configured options, e.g. fetch_command("origin", refspec)"""
+    return [
+        "git",
+        *git_options,
+        *PACK_ARGUMENTS,
+        "fetch",
+        *_options.arguments(),
+        *arguments,
+    ]
+
+
+def pull_command(*arguments: str, git_options: tuple[str, ...] = ()) -> list[str]:
+    """git pull with the configured options (pull has no --filter)"""
+    return [
+        "git",
+        *git_options,
+        *PACK_ARGUMENTS,
+        "pull",
+        *_options.arguments(include_filter=False),
+        *arguments,
+    ]
+
+
+def parse_transfer_stats(output: str) -> TransferStats:
+    """Objects and bytes received, from the --progress output of a fetch or pull"""
+    output = output.replace("\r", "\n")
+    received = _RECEIVED_RE.findall(output)
+    if received:
+        return TransferStats(
+            objects=sum(int(objects) for objects, _, _ in received),
+            bytes=round(sum(float(size) * _UNITS[unit] for _, size, unit in received)),
+        )
+    totals = _TOTAL_RE.findall(output)
+    return TransferStats(objects=sum(int(total) for total in totals))
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """The fetch strategy options shared by every command"""
+    group = parser.add_argument_group("fetch options")
+    group.add_argument(
+        "--no-tags",
+        action="store_true",
+        help="Don't fetch tags.",
+    )
+    group.add_argument(
+        "--filter",
+        metavar="SPEC",
+        help="Partial clone filter such as blob:none: file contents are only "
+        "downloaded when needed. The remote must support it.",
+    )
+    group.add_argument(
+        "--depth",
+        type=int,
+        metavar="N",
+        help="Only fetch the last N commits of each branch. This turns a full "
+        "clone into a shallow one for good: later merges may fail with "
+        "'refusing to merge unrelated histories' until `git fetch --unshallow` "
+        "restores the whole history.",
+    )
+
+
+def options_from_args(args: argparse.Namespace) -> FetchOptions:
+    return FetchOptions(no_tags=args.no_tags, filter=args.filter, depth=args.depth)
@@ -0,0 +1,397 @@
+"""
+Shell-free git execution.
+Commands are passed as argument vectors straight to git, with stdout and
+stderr captured separately. Long commands can be streamed: their output is
+handed on as it arrives and only a bounded tail is kept. Independent commands
+are overlapped on an asyncio runner, with a concurrency limit, timeouts and
+cancellation. Flows running several commands per repository or branch share
+a thread pool with the same limit, and Ctrl+C kills their commands too.
+Object and ref existence queries are answered by one long-lived
+`git cat-file --batch-check` process instead of a new process per lookup.
+"""
+
+import atexit
+import codecs
+import contextlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, NamedTuple
+
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TAIL_LINES = 200
+# Git processes run_git_concurrently, or threads thread_pool, keeps running at once
+DEFAULT_MAX_CONCURRENCY = 16
+# The exit code of a command killed by its timeout, as timeout(1) reports it
+TIMEOUT_RETURNCODE = 124
+
+_max_concurrency = DEFAULT_MAX_CONCURRENCY
+# The processes run_git and stream_git are waiting on, for thread_pool to kill
+_running: set[subprocess.Popen] = set()
+_running_lock = threading.Lock()
+
+
+class GitResult(NamedTuple):
+    """Exit code and decoded output of a git command"""
+
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+def run_git(
+    args: list[str],
+    cwd: str | None = None,
+    env: dict[str, str] | None = None,
+    input: str | None = None,
+) -> GitResult:
+    """
+    Run a git command given as an argument vector, e.g. ["git", "checkout", "main"].
+    cwd runs it in another directory, env adds environment variables on top of
+    the current environment and input is written to its stdin.
+    """
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+        errors="replace",
+        cwd=cwd,
+        env={**os.environ, **env} if env else None,
+    )
+    with _tracked(process):
+        stdout, stderr = process.communicate(input)
+    return GitResult(process.returncode, stdout, stderr)
+
+
+@contextlib.contextmanager
+def _tracked(process: subprocess.Popen) -> Iterator[None]:
+    """Register process while it is waited on, and kill it if the wait fails"""
+    with _running_lock:
+        _running.add(process)
+    try:
+        yield
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        with _running_lock:
+            _running.discard(process)
+
+
+def _kill_running() -> None:
+    with _running_lock:
+        processes = list(_running)
+    for process in processes:
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+
+class GitCommand(NamedTuple):
+    """A git command for run_git_concurrently, with the options of run_git"""
+
+    args: list[str]
+    cwd: str | None = None
+    env: dict[str, str] | None = None
+    input: str | None = None
+
+
+def set_max_concurrency(limit: int) -> None:
+    """
+    The number of git processes run_git_concurrently keeps running at once,
+    and of threads in a thread_pool
+    """
+    global _max_concurrency
+    _max_concurrency = max(1, limit)
+
+
+async def run_git_async(
+    args: list[str],
+    cwd: str | None = None,
+    env: dict[str, str] | None = None,
+    input: str | None = None,
+    timeout: float | None = None,
+) -> GitResult:
+    """
+    run_git as a coroutine. A command still running after timeout seconds is
+    killed and returns TIMEOUT_RETURNCODE. Cancelling the coroutine kills
+    the command as well, so no git process outlives its caller.
+    """
+    import asyncio
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        env={**os.environ, **env} if env else None,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(input.encode("utf-8") if input is not None else None),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        await _kill(process)
+        return GitResult(
+            TIMEOUT_RETURNCODE, "", f"{' '.join(args)} timed out after {timeout}s\n"
+        )
+    except asyncio.CancelledError:
+        await _kill(process)
+        raise
+    return GitResult(
+        process.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace"),
+    )
+
+
+async def _kill(process: "asyncio.subprocess.Process") -> None:
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    await process.wait()
+
+
+def run_git_concurrently(
+    commands: Iterable[list[str] | GitCommand],
+    timeout: float | None = None,
+    on_finished: Callable[[list[str], float, float, GitResult], None] | None = None,
+) -> list[GitResult]:
+    """
+    Run independent git commands at the same time, at most the configured
+    maximum (see set_max_concurrency) at once, and return their results in
+    the order of the commands. Blocks until all of them finished; timeout
+    applies to each command. on_finished(args, started, seconds, result) is
+    called as each one finishes. Interrupting the call (Ctrl+C) kills the
+    commands still running.
+    """
+    commands = [
+        command if isinstance(command, GitCommand) else GitCommand(command)
+        for command in commands
+    ]
+    if not commands:
+        return []
+    # asyncio alone costs more than the rest of start-up, import it when needed
+    import asyncio
+
+    async def run_all() -> list[GitResult]:
+        slots = asyncio.Semaphore(_max_concurrency)
+
+        async def run_one(command: GitCommand) -> GitResult:
+            async with slots:
+                started = time.perf_counter()
+                result = await run_git_async(*command, timeout=timeout)
+            if on_finished:
+                on_finished(
+                    command.args, started, time.perf_counter() - started, result
+                )
+            return result
+
+        return await asyncio.gather(*(run_one(command) for command in commands))
+
+    return asyncio.run(run_all())
+
+
+@contextlib.contextmanager
+def thread_pool() -> Iterator["ThreadPoolExecutor"]:
+    """
+    A thread pool for flows running several git commands per item, such as
+    pulling a repository or cherry-picking in a branch's worktree, with as
+    many threads as the configured maximum (see set_max_concurrency).
+    Interrupting the caller (Ctrl+C) cancels the items not started yet and
+    kills the git commands still running, so the pool doesn't wait on them.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=_max_concurrency)
+    try:
+        yield executor
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        _kill_running()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+
+
+def subcommand(args: list[str]) -> str | None:
+    """The git subcommand of an argument vector, skipping options such as -C path"""
+    skip_next = False
+    for arg in args[1:]:
+        if skip_next:
+            skip_next = False
+        elif arg in ("-C", "-c"):
+            skip_next = True
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+class OutputTail:
+    """
+    The last lines of a stream of output. Progress meters redraw a line with
+    carriage returns, only the final state of such a line is kept.
+    """
+
+    def __init__(self, max_lines: int):
+        self.lines: deque[str] = deque(maxlen=max_lines)
+        self._partial = ""
+
+    def feed(self, text: str) -> None:
+        *complete, self._partial = (self._partial + text).split("\n")
+        for line in complete:
+            self.lines.append(line.rstrip("\r").rsplit("\r", 1)[-1])
+
+    def text(self) -> str:
+        lines = list(self.lines)
+        if self._partial:
+            lines.append(self._partial.rsplit("\r", 1)[-1])
+        return "".join(f"{line}\n" for line in lines)
+
+
+def stream_git(
+    args: list[str],
+    cwd: str | None = None,
+    env: dict[str, str] | None = None,
+    on_output: Callable[[str, str], None] | None = None,
+    tail_lines: int = DEFAULT_TAIL_LINES,
+) -> GitResult:
+    """
+    Run a git command like run_git, reading its output while it runs.
+    on_output(text, stream) gets every chunk as it arrives, stream being
+    "stdout" or "stderr", progress meters and their carriage returns included.
+    Only the last tail_lines lines of each stream are kept in the result,
+    so huge outputs are never held in memory.
+    """
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        env={**os.environ, **env} if env else None,
+    )
+    tails = {"stdout": OutputTail(tail_lines), "stderr": OutputTail(tail_lines)}
+    output_lock = threading.Lock()
+
+    def read(pipe, stream: str) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        with pipe:
+            for chunk in iter(lambda: pipe.read1(65536), b""):
+                text = decoder.decode(chunk)
+                tails[stream].feed(text)
+                if on_output:
+                    with output_lock:
+                        on_output(text, stream)
+
+    readers = [
+        threading.Thread(target=read, args=(process.stdout, "stdout"), daemon=True),
+        threading.Thread(target=read, args=(process.stderr, "stderr"), daemon=True),
+    ]
+    with _tracked(process):
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        returncode = process.wait()
+    return GitResult(returncode, tails["stdout"].text(), tails["stderr"].text())
+
+
+def write_to_terminal(text: str, stream: str) -> None:
+    """An on_output for stream_git that shows git's output as git would"""
+    target = sys.stdout if stream == "stdout" else sys.stderr
+    target.write(text)
+    target.flush()
+
+
+class ObjectReader:
+    """
+    A persistent `git cat-file --batch-check` process.
+    resolve() writes one revision per line and reads back "<sha> <type> <size>"
+    or "<rev> missing". Refs are re-read for every query, so the answers stay
+    correct while other git commands update the repository. Thread safe.
+    """
+
+    def __init__(self, cwd: str | None = None):
+        self._cwd = cwd
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch-check"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                encoding="utf-8",
+                errors="replace",
+                cwd=self._cwd,
+            )
+        return self._process
+
+    def resolve(self, rev: str) -> tuple[str, str] | None:
+        """Returns (sha, object type) for a revision, or None if it doesn't exist"""
+        if not rev.strip() or "\n" in rev:
+            return None
+        with self._lock:
+            process = self._ensure_started()
+            try:
+                process.stdin.write(rev + "\n")
+                process.stdin.flush()
+                line = process.stdout.readline()
+            except OSError:
+                self._close()
+                return None
+        parts = line.split()
+        if len(parts) != 3 or parts[-1] in ("missing", "ambiguous"):
+            return None
+        return parts[0], parts[1]
+
+    def exists(self, rev: str) -> bool:
+        return self.resolve(rev) is not None
+
+    def _close(self) -> None:
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+                self._process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+            self._process = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+_object_readers: dict[str | None, ObjectReader] = {}
+_object_readers_lock = threading.Lock()
+
+
+def get_object_reader(cwd: str | None = None) -> ObjectReader:
+    """The shared ObjectReader for a repository (default: the current directory)"""
+    with _object_readers_lock:
+        if cwd not in _object_readers:
+            _object_readers[cwd] = ObjectReader(cwd)
+        return _object_readers[cwd]
+
+
+@atexit.register
+def _close_object_readers() -> None:
+    for reader in list(_object_readers.values()):
+        reader.close()
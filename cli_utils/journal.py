@@ -0,0 +1,155 @@
+"""
+Step journal of a merge or cherry-pick run, to resume it after an interruption.
+Every branch a run finishes with is written to .git/gitutils/<command>-journal.json
+along with the SHA it left the branch at. `--resume` reads the run's inputs
+back and skips the recorded steps whose branch didn't move since, instead of
+checking out, pulling, merging and pushing every branch again.
+The journal is removed once a run completes.
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass
+
+from cli_utils import utils
+
+JOURNAL_VERSION = 1
+
+
+class StepStatus:
+    Done = "done"
+    Conflict = "conflict"
+
+
+@dataclass
+class Step:
+    """The outcome of one branch of a run"""
+
+    branch: str
+    status: str
+    head: str | None  # the local branch ref after the step
+    pushed: bool = False
+    new_head: str | None = None  # the commit to push, when it isn't head
+    conflicting: str | None = None  # the commit a cherry-pick stopped at
+
+
+def journal_path(command: str) -> str | None:
+    """Where the journal of command is kept, in the .git directory of the checkout"""
+    return_code, git_dir, _ = utils.run_git_command(
+        ["git", "rev-parse", "--absolute-git-dir"]
+    )
+    if return_code != 0 or not git_dir.strip():
+        return None
+    return os.path.join(git_dir.strip(), "gitutils", f"{command}-journal.json")
+
+
+class Journal:
+    """
+    The steps of a run, saved after each one. Steps of the interrupted run
+    being resumed are replayed with replay(). In an ordered run such as a
+    merge chain, every step depends on the one before: once a step has to be
+    redone, none of the following recorded steps are trusted either.
+    """
+
+    def __init__(
+        self,
+        path: str | None,
+        inputs: dict,
+        ordered: bool,
+        interrupted_steps: list[Step] | None = None,
+    ):
+        self.path = path
+        self.inputs = inputs
+        self.ordered = ordered
+        self.steps: list[Step] = []
+        self._pending = list(interrupted_steps or [])
+
+    @classmethod
+    def start(cls, command: str, inputs: dict, ordered: bool = False) -> "Journal":
+        """A new journal for a run with the given inputs (branches, ...)"""
+        journal = cls(journal_path(command), inputs, ordered)
+        if journal.path and os.path.exists(journal.path):
+            print(
+                "Replacing the journal of an interrupted run "
+                "(--resume would have continued it)."
+            )
+        journal.save()
+        return journal
+
+    @classmethod
+    def resume(cls, command: str, ordered: bool = False) -> "Journal | None":
+        """The journal of the interrupted run of command, if there is one"""
+        path = journal_path(command)
+        try:
+            with open(path, encoding="utf-8") as journal_file:
+                data = json.load(journal_file)
+            if data.get("version") != JOURNAL_VERSION:
+                return None
+            steps = [Step(**step) for step in data["steps"]]
+            return cls(path, data["inputs"], ordered, steps)
+        except (OSError, TypeError, ValueError, KeyError):
+            return None
+
+    def replay(self, branch: str) -> Step | None:
+        """
+        The step recorded for branch by the interrupted run, if it can be
+        reused: the branch ref must still be where the step left it.
+        Returns None if the branch has to be processed again.
+        """
+        index = next(
+            (i for i, step in enumerate(self._pending) if step.branch == branch),
+            None,
+        )
+        if index is None:
+            if self.ordered:
+                self._pending.clear()
+            return None
+        step = self._pending.pop(index)
+        if utils.resolve_object(f"refs/heads/{branch}") != step.head:
+            print(f"{branch} moved since the interrupted run, processing it again.")
+            if self.ordered:
+                self._pending.clear()
+            return None
+        self.steps.append(step)
+        self.save()
+        return step
+
+    def record(self, step: Step) -> None:
+        """Save a finished step, replacing an earlier one of the same branch"""
+        self.steps = [s for s in self.steps if s.branch != step.branch] + [step]
+        self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        except OSError:
+            return
+        utils.write_json_atomically(
+            self.path,
+            {
+                "version": JOURNAL_VERSION,
+                "inputs": self.inputs,
+                "steps": [asdict(step) for step in self.steps],
+            },
+            indent=2,
+        )
+
+    def finish(self) -> None:
+        """The run completed, there is nothing left to resume"""
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def abort_interrupted_operation() -> None:
+    """
+    Abort the merge or cherry-pick an interrupted run left in the checkout,
+    e.g. when it was stopped at a conflict prompt.
+    """
+    if utils.object_exists("MERGE_HEAD"):
+        print("Aborting the merge the interrupted run left in progress.")
+        utils.run_git_command(["git", "merge", "--abort"])
+    if utils.object_exists("CHERRY_PICK_HEAD"):
+        print("Aborting the cherry-pick the interrupted run left in progress.")
+        utils.run_git_command(["git", "cherry-pick", "--abort"])
@@ -0,0 +1,242 @@
+"""
+Patch-id index of branch histories, to find the branches that already
+contain a change before cherry-picking it.
+
+`git patch-id --stable` gives the same id to commits that make the same change,
+whatever their parent, author or message, so an earlier backport or a merge
+of the commit is recognised without touching the branch. The index of a branch
+covers its last DEFAULT_DEPTH commits and is cached per tip SHA: a branch is
+only read again once it moved, and the branches that moved are read
+concurrently. A change older than that can't be told apart from a missing one.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+
+from cli_utils import git_process, utils
+
+INDEX_VERSION = 2
+DEFAULT_DEPTH = 500
+# Cached indexes kept, the least recently used are removed beyond that
+MAX_CACHED_INDEXES = 500
+
+
+class Containment:
+    Contains = "already contains"
+    NeedsPick = "needs pick"
+    Unknown = "unknown"
+
+
+@dataclass
+class BranchContainment:
+    """Whether a branch has the commits, and which of them it still needs"""
+
+    status: str
+    missing: list[str] = field(default_factory=list)
+
+
+@dataclass
+class BranchIndex:
+    """Patch ids of the last commits of a branch, keyed by patch id"""
+
+    patch_ids: dict[str, str]
+    # False when the history was cut off at the depth read
+    complete: bool = True
+
+
+def _log_command(log_arguments: list[str]) -> list[str]:
+    return [
+        "git",
+        "log",
+        "-p",
+        "--no-merges",
+        "--no-color",
+        "--no-ext-diff",
+        "--format=commit %H",
+        *log_arguments,
+    ]
+
+
+def _parse_patch_ids(output: str) -> dict[str, str]:
+    ids = {}
+    for line in reversed(output.splitlines()):
+        parts = line.split()
+        if len(parts) == 2:
+            ids[parts[0]] = parts[1]
+    return ids
+
+
+def patch_ids(log_arguments: list[str]) -> dict[str, str] | None:
+    """
+    Patch ids of the commits `git log` lists with the given arguments,
+    keyed by patch id (the newest commit wins). Merges and empty commits
+    have none. Returns None if git failed.
+    """
+    return_code, log, _ = utils.run_git_command(_log_command(log_arguments))
+    if return_code != 0:
+        return None
+    if not log.strip():
+        return {}
+    return_code, output, _ = utils.run_git_command(
+        ["git", "patch-id", "--stable"], input=log
+    )
+    if return_code != 0:
+        return None
+    return _parse_patch_ids(output)
+
+
+def _index_path(tip: str) -> str:
+    return os.path.join(utils.get_cache_dir("patch-ids"), f"{tip}.json")
+
+
+def _count_commits(log: str) -> int:
+    return sum(1 for line in log.splitlines() if line.startswith("commit "))
+
+
+def _read_index(tip: str, depth: int) -> BranchIndex | None:
+    index_path = _index_path(tip)
+    try:
+        with open(index_path, encoding="utf-8") as index_file:
+            index = json.load(index_file)
+        if index.get("version") == INDEX_VERSION and index.get("depth") == depth:
+            # The mtime tells _prune_indexes which indexes are still used
+            os.utime(index_path)
+            return BranchIndex(index["patch_ids"], index["complete"])
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return None
+
+
+def _write_index(tip: str, depth: int, index: BranchIndex) -> None:
+    utils.write_json_atomically(
+        _index_path(tip),
+        {
+            "version": INDEX_VERSION,
+            "depth": depth,
+            "complete": index.complete,
+            "patch_ids": index.patch_ids,
+        },
+    )
+
+
+def _prune_indexes(keep: int = MAX_CACHED_INDEXES) -> None:
+    """
+    Remove the least recently used indexes beyond keep: there is one per
+    branch tip ever read, and a tip that moved on is never read again.
+    """
+    index_dir = utils.get_cache_dir("patch-ids")
+    try:
+        with os.scandir(index_dir) as entries:
+            indexes = [
+                (entry.stat().st_mtime_ns, entry.path)
+                for entry in entries
+                if entry.name.endswith(".json")
+            ]
+    except OSError:
+        return
+    for _, path in sorted(indexes, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_branch_indexes(
+    tips: list[str], depth: int = DEFAULT_DEPTH
+) -> dict[str, BranchIndex | None]:
+    """
+    The patch ids of the last `depth` commits reachable from each tip SHA,
+    read from the cache or computed and cached. None for a tip git failed on.
+    An index is incomplete when the tip has more than `depth` commits.
+    The histories that aren't cached are all read at once on the shared git
+    runner, then all hashed at once.
+    """
+    indexes = {tip: _read_index(tip, depth) for tip in dict.fromkeys(tips)}
+    missing = [tip for tip, index in indexes.items() if index is None]
+    logs = utils.run_git_commands(
+        [_log_command([f"--max-count={depth}", tip]) for tip in missing]
+    )
+    to_hash = {}
+    complete = {}
+    for tip, (return_code, log, _) in zip(missing, logs):
+        if return_code != 0:
+            continue
+        if log.strip():
+            to_hash[tip] = log
+            complete[tip] = _count_commits(log) < depth
+        else:
+            indexes[tip] = BranchIndex({})
+    hashed = utils.run_git_commands(
+        [
+            git_process.GitCommand(["git", "patch-id", "--stable"], input=log)
+            for log in to_hash.values()
+        ]
+    )
+    for tip, (return_code, output, _) in zip(to_hash, hashed):
+        if return_code == 0:
+            indexes[tip] = BranchIndex(_parse_patch_ids(output), complete[tip])
+    for tip in missing:
+        if indexes[tip] is not None:
+            _write_index(tip, depth, indexes[tip])
+    if missing:
+        _prune_indexes()
+    return indexes
+
+
+def load_branch_index(tip: str, depth: int = DEFAULT_DEPTH) -> BranchIndex | None:
+    """
+    The patch ids of the last `depth` commits reachable from the tip SHA,
+    read from the cache or computed and cached. None if git failed.
+    """
+    return load_branch_indexes([tip], depth)[tip]
+
+
+def classify_branches(
+    commits: list[str], branches: list[str], depth: int = DEFAULT_DEPTH
+) -> dict[str, BranchContainment]:
+    """
+    Classify each branch, from its remote-tracking ref (origin/<branch>), as
+    already containing every commit, needing some of them picked, or unknown
+    when the commits or the branch can't be read, or a commit isn't among the
+    `depth` commits read of a longer history. Commits only on the local branch
+    are ignored, even though a rebasing pull keeps them. Needs the branches
+    fetched.
+    """
+    shas = [utils.resolve_object(f"{commit}^{{commit}}") for commit in commits]
+    picked = {}
+    if all(shas):
+        ids = patch_ids(["--no-walk", *shas])
+        picked = {sha: patch_id for patch_id, sha in (ids or {}).items()}
+    # Merges and empty commits have no patch id to look for
+    known = all(shas) and len(picked) == len(set(shas))
+
+    tips = {
+        branch: utils.resolve_object(f"refs/remotes/origin/{branch}")
+        for branch in branches
+    }
+    indexes = (
+        load_branch_indexes([tip for tip in tips.values() if tip], depth)
+        if known
+        else {}
+    )
+    classified = {}
+    for branch in branches:
+        index = indexes.get(tips[branch])
+        if index is None:
+            classified[branch] = BranchContainment(Containment.Unknown, list(commits))
+            continue
+        missing = [
+            commit
+            for commit, sha in zip(commits, shas)
+            if picked[sha] not in index.patch_ids
+        ]
+        if not missing:
+            status = Containment.Contains
+        elif index.complete:
+            status = Containment.NeedsPick
+        else:
+            # The commits may have been picked before the part of history read
+            status = Containment.Unknown
+        classified[branch] = BranchContainment(status, missing)
+    return classified
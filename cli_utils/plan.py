@@ -0,0 +1,311 @@
+"""
+Plan files: many merge chains and cherry-pick jobs declared up front,
+so they can run unattended in a single invocation.
+
+A plan is a JSON or YAML (needs PyYAML) mapping such as:
+
+    pull: reset          # rebase (default) or reset, for jobs without their own
+    on_conflict: skip    # skip (default), theirs (merges only) or stop
+    jobs:
+      - name: nightly cascade
+        merge: [master, release/*, develop]
+        in_memory: true
+        atomic_push: true
+      - cherry_pick: [1a2b3c4, 5d6e7f8..9a0b1c2]   # commits and A..B ranges
+        branches: [release/*]
+        pull: rebase
+        worktrees: true
+      - name: qa fan-out       # each parent maps to the branches merged from it
+        merge_graph:
+          main: [release]
+          release: [team-a-qa, team-b-qa]
+          team-a-qa: [team-a/*]
+        jobs: 4
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from cli_utils import dag_scheduler, utils
+
+if TYPE_CHECKING:
+    from cli_utils.ref_index import RefIndex
+
+
+class PlanError(Exception):
+    """The plan file is unreadable or invalid"""
+
+
+class ConflictPolicy:
+    Skip = "skip"
+    Theirs = "theirs"
+    Stop = "stop"
+
+
+PULL_CHOICES = {
+    "rebase": utils.PullConfigChoice.RebaseLocalToRemote,
+    "reset": utils.PullConfigChoice.ResetToRemote,
+}
+CONFLICT_POLICIES = (ConflictPolicy.Skip, ConflictPolicy.Theirs, ConflictPolicy.Stop)
+JOB_KEYS = {
+    "name",
+    "merge",
+    "merge_graph",
+    "cherry_pick",
+    "branches",
+    "pull",
+    "on_conflict",
+    "in_memory",
+    "worktrees",
+    "jobs",
+    "atomic_push",
+}
+
+
+@dataclass
+class PlanJob:
+    """One merge chain or cherry-pick of a plan"""
+
+    name: str
+    kind: str  # "merge", "merge-graph" or "cherry-pick"
+    branches: list[str]
+    pull_choice: str
+    on_conflict: str = ConflictPolicy.Skip
+    # cherry-pick: commits and A..B ranges, then the commits they resolve to
+    commits: list[str] | None = None
+    in_memory: bool = False
+    worktrees: bool = False
+    jobs: int | None = None
+    atomic_push: bool = False
+    # merge-graph: parent -> the branches merged from it
+    graph: dict[str, list[str]] | None = None
+
+
+def load_plan_file(path: str) -> dict:
+    """Read a plan file, as YAML for .yml/.yaml files and JSON otherwise"""
+    try:
+        with open(path, encoding="utf-8") as plan_file:
+            text = plan_file.read()
+    except OSError as e:
+        raise PlanError(f"Could not read plan file {path}: {e}") from e
+
+    if os.path.splitext(path)[1].lower() in (".yml", ".yaml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise PlanError(
+                "YAML plan files need PyYAML (pip install pyyaml). "
+                "Use a .json plan file instead."
+            ) from e
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise PlanError(f"Invalid YAML in {path}: {e}") from e
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise PlanError(f"Invalid JSON in {path}: {e}") from e
+
+    if not isinstance(data, dict):
+        raise PlanError("A plan must be a mapping with a list of jobs.")
+    return data
+
+
+def _string_list(value, field: str, label: str) -> list[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise PlanError(f"{label}: {field} must be a list of branch names.")
+    return [v.strip() for v in value if v.strip()]
+
+
+def _parse_job(raw, index: int, pull: str, on_conflict: str) -> PlanJob:
+    label = f"Job {index}"
+    if not isinstance(raw, dict):
+        raise PlanError(f"{label}: must be a mapping.")
+    label = f"Job {index} ({raw['name']})" if raw.get("name") else label
+    unknown = set(raw) - JOB_KEYS
+    if unknown:
+        raise PlanError(f"{label}: unknown keys {', '.join(sorted(unknown))}.")
+    kinds = [key for key in ("merge", "merge_graph", "cherry_pick") if key in raw]
+    if len(kinds) != 1:
+        raise PlanError(
+            f"{label}: needs exactly one of merge, merge_graph or cherry_pick."
+        )
+
+    pull = raw.get("pull", pull)
+    if pull not in PULL_CHOICES:
+        raise PlanError(f"{label}: pull must be one of {', '.join(PULL_CHOICES)}.")
+    on_conflict = raw.get("on_conflict", on_conflict)
+    if on_conflict not in CONFLICT_POLICIES:
+        raise PlanError(
+            f"{label}: on_conflict must be one of {', '.join(CONFLICT_POLICIES)}."
+        )
+    jobs = raw.get("jobs")
+    if jobs is not None and (not isinstance(jobs, int) or jobs < 1):
+        raise PlanError(f"{label}: jobs must be a positive number.")
+
+    job = PlanJob(
+        name=raw.get("name") or f"job {index}",
+        kind=kinds[0].replace("_", "-"),
+        branches=[],
+        pull_choice=PULL_CHOICES[pull],
+        on_conflict=on_conflict,
+        in_memory=bool(raw.get("in_memory", False)),
+        worktrees=bool(raw.get("worktrees", False)),
+        jobs=jobs,
+        atomic_push=bool(raw.get("atomic_push", False)),
+    )
+    if job.kind == "merge":
+        if "branches" in raw or job.worktrees:
+            raise PlanError(f"{label}: merge jobs list their chain under merge.")
+        job.branches = _string_list(raw["merge"], "merge", label)
+        if len(job.branches) < 2:
+            raise PlanError(f"{label}: a merge chain needs at least 2 branches.")
+    elif job.kind == "merge-graph":
+        graph = raw["merge_graph"]
+        if not isinstance(graph, dict) or not graph:
+            raise PlanError(
+                f"{label}: merge_graph maps each parent to a list of branches."
+            )
+        job.graph = {
+            str(parent): _string_list(children, "merge_graph", label)
+            for parent, children in graph.items()
+        }
+        if "branches" in raw or job.in_memory or job.worktrees:
+            raise PlanError(
+                f"{label}: merge_graph jobs always run in worktrees, "
+                "with the branches listed under merge_graph."
+            )
+        if on_conflict == ConflictPolicy.Theirs:
+            raise PlanError(
+                f"{label}: merge_graph jobs skip the branches below a conflict, "
+                "on_conflict theirs is not supported."
+            )
+        _build_graph(job.graph, label)
+        job.branches = _graph_nodes(job.graph)
+    else:
+        commits = raw["cherry_pick"]
+        if isinstance(commits, str):
+            commits = commits.split()
+        if (
+            not isinstance(commits, list)
+            or not commits
+            or not all(isinstance(c, str) and c.strip() for c in commits)
+        ):
+            raise PlanError(
+                f"{label}: cherry_pick must be a commit, a range A..B or a list of them."
+            )
+        job.commits = [c.strip() for c in commits]
+        job.branches = _string_list(raw.get("branches"), "branches", label)
+        if not job.branches:
+            raise PlanError(f"{label}: cherry_pick needs a list of branches.")
+        if on_conflict == ConflictPolicy.Theirs:
+            raise PlanError(f"{label}: on_conflict theirs only applies to merges.")
+        if on_conflict == ConflictPolicy.Stop and job.worktrees:
+            raise PlanError(
+                f"{label}: on_conflict stop can't be used with worktrees, "
+                "which cherry-pick all branches at once."
+            )
+        if job.in_memory and job.worktrees:
+            raise PlanError(f"{label}: choose either in_memory or worktrees.")
+    return job
+
+
+def _graph_edges(graph: dict[str, list[str]]) -> list[tuple[str, str]]:
+    return [(parent, child) for parent, children in graph.items() for child in children]
+
+
+def _graph_nodes(graph: dict[str, list[str]]) -> list[str]:
+    nodes = [node for edge in _graph_edges(graph) for node in edge]
+    return list(dict.fromkeys([*graph, *nodes]))
+
+
+def _build_graph(graph: dict[str, list[str]], label: str) -> dag_scheduler.MergeGraph:
+    try:
+        return dag_scheduler.MergeGraph(_graph_edges(graph))
+    except dag_scheduler.GraphError as e:
+        raise PlanError(f"{label}: {e}") from e
+
+
+def parse_plan(data: dict) -> list[PlanJob]:
+    """Validate the structure of a plan. Branch patterns are kept as written."""
+    pull = data.get("pull", "rebase")
+    on_conflict = data.get("on_conflict", ConflictPolicy.Skip)
+    raw_jobs = data.get("jobs")
+    if not isinstance(raw_jobs, list) or not raw_jobs:
+        raise PlanError("A plan needs a non-empty list of jobs.")
+    return [
+        _parse_job(raw, index, pull, on_conflict)
+        for index, raw in enumerate(raw_jobs, start=1)
+    ]
+
+
+def resolve_plan(jobs: list[PlanJob], remote_branches: "RefIndex") -> list[PlanJob]:
+    """
+    Expand branch patterns against the ref index and check every job
+    the same way the interactive commands do.
+    Raises PlanError listing every problem found.
+    """
+    problems = []
+
+    def expand(job: PlanJob, names: list[str]) -> list[str]:
+        branches = []
+        for name in names:
+            if utils.is_pattern(name):
+                matches = remote_branches.match(name)
+                if not matches:
+                    problems.append(f"{job.name}: no branches match {name}.")
+                branches.extend(matches)
+            elif name not in remote_branches:
+                problems.append(f"{job.name}: branch {name} does not exist.")
+            else:
+                branches.append(name)
+        return branches
+
+    for job in jobs:
+        if job.kind == "merge-graph":
+            for parent in job.graph:
+                if parent not in remote_branches:
+                    problems.append(f"{job.name}: branch {parent} does not exist.")
+            job.graph = {
+                parent: expand(job, children) for parent, children in job.graph.items()
+            }
+            children = {child for children in job.graph.values() for child in children}
+            if ("main" in children) or ("master" in children):
+                problems.append(
+                    f"{job.name}: main or master can only be merged into other branches."
+                )
+            try:
+                _build_graph(job.graph, job.name)
+            except PlanError as e:
+                problems.append(str(e))
+            job.branches = _graph_nodes(job.graph)
+            continue
+
+        branches = expand(job, job.branches)
+        job.branches = branches
+
+        if len(branches) != len(set(branches)):
+            problems.append(f"{job.name}: branches must be unique: {branches}")
+        if job.kind == "merge":
+            if ("main" in branches[1:]) or ("master" in branches[1:]):
+                problems.append(
+                    f"{job.name}: main or master can only be merged into other branches."
+                )
+        else:
+            if ("master" in branches) or ("main" in branches):
+                problems.append(
+                    f"{job.name}: cannot cherry-pick into `master` or `main` branches."
+                )
+            try:
+                job.commits = utils.resolve_commits(job.commits)
+            except ValueError as e:
+                problems.append(f"{job.name}: {e}")
+
+    if problems:
+        raise PlanError("\n".join(problems))
+    return jobs
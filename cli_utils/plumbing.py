@@ -0,0 +1,205 @@
+"""
+Checkout-free merges and cherry-picks built on git plumbing commands:
+`merge-tree --write-tree` computes the result, `commit-tree` records it
+and `update-ref` moves the branch. Nothing touches the index or a worktree.
+"""
+
+import functools
+import re
+from dataclasses import dataclass, field
+
+from cli_utils import utils
+
+ZERO_OID = "0" * 40
+
+
+@dataclass
+class MergeTreeResult:
+    """Outcome of `git merge-tree --write-tree`"""
+
+    clean: bool
+    tree: str | None
+    conflicted_files: list[str] = field(default_factory=list)
+    commit: str | None = None
+    # A cherry-pick whose change the target already has: nothing to commit
+    already_applied: bool = False
+
+
+@functools.lru_cache(maxsize=None)
+def git_version() -> tuple[int, ...]:
+    """Version of the installed git, e.g. (2, 43, 0)"""
+    _, output, _ = utils.run_git_command(["git", "version"])
+    match = re.search(r"(\d+)\.(\d+)(?:\.(\d+))?", output)
+    if not match:
+        return (0,)
+    return tuple(int(part) for part in match.groups(default="0"))
+
+
+def supports_merge_tree() -> bool:
+    """`merge-tree --write-tree` exists since git 2.38"""
+    return git_version() >= (2, 38)
+
+
+def supports_merge_tree_merge_base() -> bool:
+    """`merge-tree --merge-base`, needed for cherry-picks, exists since git 2.40"""
+    return git_version() >= (2, 40)
+
+
+def rev_parse(rev: str) -> str | None:
+    """Resolve a revision to its commit SHA, or None if it doesn't exist"""
+    return_code, output, _ = utils.run_git_command(
+        ["git", "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"]
+    )
+    return output.strip() if return_code == 0 else None
+
+
+def is_ancestor(ancestor: str, descendant: str) -> bool:
+    return_code, _, _ = utils.run_git_command(
+        ["git", "merge-base", "--is-ancestor", ancestor, descendant]
+    )
+    return return_code == 0
+
+
+def merge_tree(
+    ours: str, theirs: str, merge_base: str | None = None
+) -> MergeTreeResult | None:
+    """
+    Merge two commits in memory.
+    Returns None if git couldn't attempt the merge at all.
+    """
+    merge_base_option = [f"--merge-base={merge_base}"] if merge_base else []
+    return_code, output, _ = utils.run_git_command(
+        ["git", "merge-tree", "--write-tree", "--name-only"]
+        + merge_base_option
+        + [ours, theirs]
+    )
+    if return_code not in (0, 1):
+        return None
+    # Output: the tree, then one conflicted file per line, a blank line and messages
+    lines = output.split("\n")
+    conflicted_files = []
+    for line in lines[1:]:
+        if not line:
+            break
+        conflicted_files.append(line)
+    return MergeTreeResult(
+        clean=return_code == 0,
+        tree=lines[0].strip() or None,
+        conflicted_files=conflicted_files,
+    )
+
+
+def commit_tree(
+    tree: str,
+    parents: list[str],
+    message: str,
+    env: dict[str, str] | None = None,
+) -> str | None:
+    """Create a commit object for tree without touching any ref"""
+    parent_options = [option for parent in parents for option in ("-p", parent)]
+    return_code, output, _ = utils.run_git_command(
+        ["git", "commit-tree", tree, *parent_options, "-m", message], env=env
+    )
+    return output.strip() if return_code == 0 else None
+
+
+def update_ref(branch: str, new: str, old: str | None) -> bool:
+    """
+    Point refs/heads/<branch> at new, but only if it still points at old
+    (None: the branch must not exist yet). A branch created from origin/<branch>
+    tracks it, like one created by `git checkout <branch>`.
+    """
+    return_code, _, _ = utils.run_git_command(
+        ["git", "update-ref", f"refs/heads/{branch}", new, old or ZERO_OID]
+    )
+    if return_code != 0:
+        return False
+    if old is None and utils.has_remote_branch(branch):
+        utils.run_git_command(
+            ["git", "branch", f"--set-upstream-to=origin/{branch}", branch]
+        )
+    return True
+
+
+def get_commit_author_env(commit: str) -> dict[str, str]:
+    """Environment that makes commit-tree keep the author of commit"""
+    _, output, _ = utils.run_git_command(
+        ["git", "log", "-1", "--format=%an%n%ae%n%aI", commit]
+    )
+    name, email, date = (output.split("\n") + ["", "", ""])[:3]
+    return {
+        "GIT_AUTHOR_NAME": name,
+        "GIT_AUTHOR_EMAIL": email,
+        "GIT_AUTHOR_DATE": date,
+    }
+
+
+def get_commit_message(commit: str) -> str:
+    _, output, _ = utils.run_git_command(["git", "log", "-1", "--format=%B", commit])
+    return output.rstrip("\n")
+
+
+def resolve_target_tip(
+    branch: str, pull_choice: utils.PullConfigChoice
+) -> tuple[str | None, str | None]:
+    """
+    Work out what a prefetched branch would point at after checkout_and_pull_branch,
+    without checking it out.
+    Returns (tip, current local tip). The tip is None when that needs a working tree,
+    i.e. local commits that have to be rebased onto a moved remote.
+    """
+    local = rev_parse(f"refs/heads/{branch}")
+    remote = rev_parse(f"refs/remotes/origin/{branch}")
+    if remote is None:
+        return local, local
+    if pull_choice == utils.PullConfigChoice.ResetToRemote or local is None:
+        return remote, local
+    if local == remote or is_ancestor(local, remote):
+        return remote, local
+    if is_ancestor(remote, local):
+        return local, local
+    return None, local
+
+
+def merge_commits(ours: str, theirs: str, message: str) -> MergeTreeResult:
+    """
+    Merge theirs into ours in memory, the way `git merge` would:
+    nothing to do, a fast-forward or a new merge commit.
+    The resulting commit is set on the result if the merge was clean.
+    """
+    if is_ancestor(theirs, ours):
+        return MergeTreeResult(clean=True, tree=None, commit=ours)
+    if is_ancestor(ours, theirs):
+        return MergeTreeResult(clean=True, tree=None, commit=theirs)
+    result = merge_tree(ours, theirs) or MergeTreeResult(clean=False, tree=None)
+    if result.clean:
+        result.commit = commit_tree(result.tree, [ours, theirs], message)
+        result.clean = result.commit is not None
+    return result
+
+
+def cherry_pick_commit(onto: str, commit: str) -> MergeTreeResult:
+    """
+    Apply commit on top of onto in memory, keeping its author and message.
+    The new commit is set on the result if it applied cleanly. If it leaves
+    the tree of onto unchanged it is reported as already applied instead,
+    where `git cherry-pick` would stop with nothing to commit.
+    """
+    parent = rev_parse(f"{commit}^")
+    if parent is None:
+        return MergeTreeResult(clean=False, tree=None)
+    result = merge_tree(onto, commit, merge_base=parent) or MergeTreeResult(
+        clean=False, tree=None
+    )
+    if result.clean and result.tree == utils.resolve_object(f"{onto}^{{tree}}"):
+        result.clean = False
+        result.already_applied = True
+    if result.clean:
+        result.commit = commit_tree(
+            result.tree,
+            [onto],
+            get_commit_message(commit),
+            env=get_commit_author_env(commit),
+        )
+        result.clean = result.commit is not None
+    return result
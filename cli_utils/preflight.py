@@ -0,0 +1,153 @@
+"""
+Pre-flight analysis of a merge chain.
+Simulates the whole cascade with merge-tree before any branch is checked out,
+feeding each hop's merged result into the next one, and predicts which hops
+will conflict and on which files.
+The cheaper ancestry pass only finds the hops that need no work at all.
+"""
+
+from dataclasses import dataclass, field
+
+from cli_utils import plumbing, trace, utils
+
+
+class HopStatus:
+    UpToDate = "up to date"
+    FastForward = "fast-forward"
+    Clean = "clean merge"
+    Conflict = "CONFLICT"
+    Unknown = "unknown"
+
+
+@dataclass
+class HopPrediction:
+    """Predicted outcome of merging prior_branch into branch"""
+
+    prior_branch: str
+    branch: str
+    status: str
+    conflicted_files: list[str] = field(default_factory=list)
+
+
+def _branch_tip(branch: str, pull_choice: utils.PullConfigChoice) -> str | None:
+    tip, local = plumbing.resolve_target_tip(branch, pull_choice)
+    if tip is None:
+        # Local commits still to be rebased: the local tip is the closest guess
+        return local
+    return tip
+
+
+def simulate_merge_chain(
+    branches: list[str], pull_choice: utils.PullConfigChoice
+) -> list[HopPrediction]:
+    """
+    Predict every hop of a merge chain. Expects the branches to be prefetched.
+    A conflicting hop is assumed to be aborted, so the next branch receives
+    the unchanged tip of the conflicting one.
+    """
+    predictions = []
+    source = _branch_tip(branches[0], pull_choice)
+    for prior_branch, branch in zip(branches, branches[1:]):
+        target = _branch_tip(branch, pull_choice)
+        if source is None or target is None:
+            predictions.append(HopPrediction(prior_branch, branch, HopStatus.Unknown))
+            source = target
+            continue
+
+        if plumbing.is_ancestor(source, target):
+            status, new_tip, conflicted_files = HopStatus.UpToDate, target, []
+        elif plumbing.is_ancestor(target, source):
+            status, new_tip, conflicted_files = HopStatus.FastForward, source, []
+        else:
+            result = plumbing.merge_tree(target, source)
+            if result is None:
+                status, new_tip, conflicted_files = HopStatus.Unknown, target, []
+            elif not result.clean:
+                status, new_tip = HopStatus.Conflict, target
+                conflicted_files = result.conflicted_files
+            else:
+                # A dangling commit object: no ref points at it, gc drops it later
+                status, conflicted_files = HopStatus.Clean, []
+                new_tip = plumbing.commit_tree(
+                    result.tree,
+                    [target, source],
+                    f"Merge branch '{prior_branch}' into {branch}",
+                )
+        predictions.append(
+            HopPrediction(prior_branch, branch, status, conflicted_files)
+        )
+        source = new_tip
+    return predictions
+
+
+def print_preflight_report(predictions: list[HopPrediction]) -> None:
+    print("Pre-flight check of the merge chain:")
+    for prediction in predictions:
+        line = (
+            f"  {prediction.prior_branch} -> {prediction.branch}: {prediction.status}"
+        )
+        if prediction.conflicted_files:
+            line += f" in {', '.join(prediction.conflicted_files)}"
+        print(line)
+
+
+def _ancestry_command(ancestor: str, descendant: str) -> list[str]:
+    return ["git", "merge-base", "--is-ancestor", ancestor, descendant]
+
+
+def find_up_to_date_hops(branches: list[str], current_branch: str) -> int:
+    """
+    Count the leading hops of a prefetched merge chain that need no work:
+    every branch up to there already contains the one before it on remote,
+    and has no local commits. The count stops at the first hop with work to
+    do, as every later hop then receives new commits.
+    Tips are read through the shared cat-file process and the ancestry checks
+    all run at once on the shared git runner. The local refs of the skipped
+    branches are fast-forwarded to remote, as the checkout and pull they skip
+    would have done.
+    """
+    if len(branches) < 2:
+        return 0
+    local_tips = [utils.resolve_object(f"refs/heads/{branch}") for branch in branches]
+    remote_tips = [
+        utils.resolve_object(f"refs/remotes/origin/{branch}") for branch in branches
+    ]
+
+    # A branch is synced when pulling it would only fast-forward its local
+    # ref to the remote one, with nothing to rebase, push or check out
+    synced = [
+        remote is not None and (local is None or local == remote)
+        for local, remote in zip(local_tips, remote_tips)
+    ]
+    checks = {}
+    for i, (branch, local, remote) in enumerate(zip(branches, local_tips, remote_tips)):
+        if not synced[i] and remote is not None and branch != current_branch:
+            checks[("synced", i)] = _ancestry_command(local, remote)
+        if i > 0 and remote_tips[i - 1] is not None and remote is not None:
+            checks[("hop", i)] = _ancestry_command(remote_tips[i - 1], remote)
+    with trace.phase("ancestry"):
+        results = utils.run_git_commands(list(checks.values()))
+    passed = {
+        key for key, (return_code, _, _) in zip(checks, results) if return_code == 0
+    }
+
+    hops = 0
+    for i in range(len(branches)):
+        if not (synced[i] or ("synced", i) in passed):
+            break
+        if i > 0:
+            if ("hop", i) not in passed:
+                break
+            hops = i
+    if hops == 0:
+        return 0
+    for branch, local, remote in zip(
+        branches[: hops + 1], local_tips[: hops + 1], remote_tips[: hops + 1]
+    ):
+        if local is None:
+            utils.run_git_command(
+                ["git", "branch", "--track", branch, f"origin/{branch}"]
+            )
+        elif local != remote:
+            plumbing.update_ref(branch, remote, local)
+    return hops
@@ -0,0 +1,57 @@
+"""
+Last-known remote heads of the repositories updated by the batch puller,
+so an incremental run only pulls the repositories whose remote moved.
+"""
+
+import json
+import os
+
+from cli_utils import daemon, utils
+
+STATE_VERSION = 1
+
+
+def state_path() -> str:
+    return os.path.join(utils.get_cache_dir(), "pull-state.json")
+
+
+def load_pull_state() -> dict[str, dict]:
+    """
+    Load the known remote heads, keyed by absolute repository path:
+    {"upstream": "origin refs/heads/main", "head": <sha>}.
+    Returns nothing if there is no usable state file.
+    A running daemon serves them from memory.
+    """
+    served = daemon.request("pull_state")
+    if served is not None:
+        return served
+    try:
+        with open(state_path(), encoding="utf-8") as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return {}
+    return state.get("repos", {})
+
+
+def save_pull_state(repos: dict[str, dict]) -> None:
+    utils.write_json_atomically(
+        state_path(), {"version": STATE_VERSION, "repos": repos}
+    )
+
+
+def is_up_to_date(
+    repos: dict[str, dict], path: str, remote_head: tuple[str, str] | None
+) -> bool:
+    """Whether the remote head (upstream, sha) is the one last pulled into path"""
+    if remote_head is None:
+        return False
+    upstream, head = remote_head
+    known = repos.get(os.path.abspath(path))
+    return known == {"upstream": upstream, "head": head}
+
+
+def record(repos: dict[str, dict], path: str, remote_head: tuple[str, str]) -> None:
+    upstream, head = remote_head
+    repos[os.path.abspath(path)] = {"upstream": upstream, "head": head}
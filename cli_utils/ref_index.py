@@ -0,0 +1,171 @@
+"""
+Index of the local and remote-tracking branches of a repository.
+Built from `git for-each-ref` and cached on disk between invocations.
+The cache is invalidated when packed-refs or any loose ref directory changes.
+A running daemon (see daemon.py) keeps the index in memory instead.
+"""
+
+import bisect
+import fnmatch
+import hashlib
+import json
+import os
+
+from cli_utils import daemon, utils
+
+INDEX_VERSION = 1
+REMOTE = "origin"
+
+
+class RefIndex:
+    """Sorted local and remote-tracking (origin) branch names"""
+
+    def __init__(self, local_branches: list[str], remote_branches: list[str]):
+        self.local_branches = sorted(local_branches)
+        self.remote_branches = sorted(remote_branches)
+        self._all_branches = sorted(set(self.local_branches + self.remote_branches))
+        self._all_branches_set = set(self._all_branches)
+
+    def __contains__(self, branch: str) -> bool:
+        return branch in self._all_branches_set
+
+    def __len__(self) -> int:
+        return len(self._all_branches)
+
+    def branch_names(self) -> set[str]:
+        """All local and remote branch names"""
+        return set(self._all_branches_set)
+
+    def is_local(self, branch: str) -> bool:
+        index = bisect.bisect_left(self.local_branches, branch)
+        return index < len(self.local_branches) and self.local_branches[index] == branch
+
+    def is_remote(self, branch: str) -> bool:
+        index = bisect.bisect_left(self.remote_branches, branch)
+        return (
+            index < len(self.remote_branches) and self.remote_branches[index] == branch
+        )
+
+    def with_prefix(self, prefix: str) -> list[str]:
+        """All branch names starting with prefix, sorted"""
+        start = bisect.bisect_left(self._all_branches, prefix)
+        end = bisect.bisect_left(self._all_branches, prefix + "\U0010ffff")
+        return self._all_branches[start:end]
+
+    def match(self, pattern: str) -> list[str]:
+        """
+        All branch names matching a glob pattern such as `release/*`, sorted.
+        Only the names sharing the pattern's literal prefix are compared.
+        """
+        literal_end = min(
+            (pattern.find(c) for c in utils.GLOB_CHARACTERS if c in pattern),
+            default=len(pattern),
+        )
+        candidates = self.with_prefix(pattern[:literal_end])
+        return [name for name in candidates if fnmatch.fnmatchcase(name, pattern)]
+
+    def to_dict(self) -> dict:
+        return {"local": self.local_branches, "remote": self.remote_branches}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RefIndex":
+        return cls(data["local"], data["remote"])
+
+
+def build_ref_index(git_dir: str | None = None) -> RefIndex:
+    """
+    Read all branches with a single `git for-each-ref`, in the current
+    repository or the one of git_dir.
+    """
+    git_options = [f"--git-dir={git_dir}"] if git_dir else []
+    _, output, _ = utils.run_git_command(
+        [
+            "git",
+            *git_options,
+            "for-each-ref",
+            "--format=%(refname)",
+            "refs/heads",
+            f"refs/remotes/{REMOTE}",
+        ]
+    )
+    local_branches = []
+    remote_branches = []
+    remote_prefix = f"refs/remotes/{REMOTE}/"
+    for refname in output.splitlines():
+        if refname.startswith("refs/heads/"):
+            local_branches.append(refname[len("refs/heads/") :])
+        elif refname.startswith(remote_prefix) and refname != f"{remote_prefix}HEAD":
+            remote_branches.append(refname[len(remote_prefix) :])
+    return RefIndex(local_branches, remote_branches)
+
+
+def refs_signature(git_dir: str) -> list:
+    """
+    mtimes that change whenever a branch is created, updated or deleted:
+    packed-refs and every directory holding loose refs (git writes loose refs
+    through a lock file that is renamed into place).
+    """
+    signature = []
+    packed_refs = os.path.join(git_dir, "packed-refs")
+    try:
+        stat = os.stat(packed_refs)
+        signature.append(["packed-refs", stat.st_mtime_ns, stat.st_size])
+    except OSError:
+        signature.append(["packed-refs", None, None])
+    for refs_root in ("refs/heads", f"refs/remotes/{REMOTE}"):
+        for dir_path, _, _ in os.walk(os.path.join(git_dir, refs_root)):
+            try:
+                mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+            signature.append([os.path.relpath(dir_path, git_dir), mtime])
+    return signature
+
+
+def _cache_path(git_dir: str) -> str:
+    digest = hashlib.sha1(git_dir.encode("utf-8")).hexdigest()
+    return os.path.join(utils.get_cache_dir("ref-index"), f"{digest}.json")
+
+
+def load_ref_index(use_cache: bool = True) -> RefIndex:
+    """
+    The RefIndex of the current repository, from the daemon when one is
+    running, else from the on-disk cache when no ref has changed since it was
+    written, otherwise rebuilt and cached again.
+    """
+    if use_cache:
+        served = daemon.request("ref_index", cwd=os.getcwd())
+        if served is not None:
+            return RefIndex.from_dict(served)
+    return_code, output, _ = utils.run_git_command(
+        ["git", "rev-parse", "--path-format=absolute", "--git-common-dir"]
+    )
+    if return_code != 0 or not use_cache:
+        return build_ref_index()
+
+    git_dir = output.strip()
+    signature = refs_signature(git_dir)
+    cache_path = _cache_path(git_dir)
+    try:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            cached = json.load(cache_file)
+        if (
+            cached.get("version") == INDEX_VERSION
+            and cached.get("git_dir") == git_dir
+            and cached.get("signature") == signature
+        ):
+            return RefIndex.from_dict(cached["index"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = build_ref_index()
+    utils.write_json_atomically(
+        cache_path,
+        {
+            "version": INDEX_VERSION,
+            "git_dir": git_dir,
+            "signature": signature,
+            "index": index.to_dict(),
+        },
+    )
+    return index
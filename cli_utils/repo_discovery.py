@@ -0,0 +1,147 @@
+"""Recursive discovery of git repositories, backed by an on-disk index"""
+
+import fnmatch
+import hashlib
+import json
+import os
+
+from cli_utils import daemon, utils
+
+DEFAULT_IGNORE_PATTERNS = (
+    "node_modules",
+    ".venv",
+    "venv",
+    "__pycache__",
+    ".tox",
+    ".mypy_cache",
+    ".pytest_cache",
+)
+
+INDEX_VERSION = 1
+
+
+def _is_ignored(name: str, ignore_patterns: tuple[str, ...]) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in ignore_patterns)
+
+
+def _scan_directory(
+    path: str, mtime: int, ignore_patterns: tuple[str, ...]
+) -> dict | None:
+    """
+    List a single directory.
+    Returns its index entry: mtime, whether it holds a `.git` and its child directories.
+    """
+    is_repo = False
+    children = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name == ".git":
+                    # `.git` is a file for worktrees and submodules
+                    is_repo = True
+                elif entry.is_dir(follow_symlinks=False) and not _is_ignored(
+                    entry.name, ignore_patterns
+                ):
+                    children.append(entry.name)
+    except OSError:
+        return None
+    return {"mtime": mtime, "repo": is_repo, "children": sorted(children)}
+
+
+def _index_path(root: str) -> str:
+    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()
+    return os.path.join(utils.get_cache_dir("repo-index"), f"{digest}.json")
+
+
+def _load_index(root: str, ignore_patterns: tuple[str, ...]) -> dict:
+    """Load the cached directory entries for root, or nothing if they don't apply."""
+    try:
+        with open(_index_path(root), encoding="utf-8") as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+    if (
+        index.get("version") != INDEX_VERSION
+        or index.get("root") != root
+        or index.get("ignore") != list(ignore_patterns)
+    ):
+        return {}
+    return index.get("dirs", {})
+
+
+def _save_index(root: str, ignore_patterns: tuple[str, ...], dirs: dict) -> None:
+    index = {
+        "version": INDEX_VERSION,
+        "root": root,
+        "ignore": list(ignore_patterns),
+        "dirs": dirs,
+    }
+    utils.write_json_atomically(_index_path(root), index)
+
+
+def walk_repositories(
+    abs_root: str, ignore_patterns: tuple[str, ...], cached_dirs: dict
+) -> tuple[list[str], dict]:
+    """
+    The sorted paths of the git repositories below abs_root, relative to it,
+    and the directory entries of the walk. Only the directories whose mtime
+    differs from their entry in cached_dirs are listed again.
+    """
+    dirs = {}
+    repos = []
+    stack = ["."]
+    while stack:
+        rel_path = stack.pop()
+        abs_path = os.path.join(abs_root, rel_path)
+        try:
+            mtime = os.stat(abs_path).st_mtime_ns
+        except OSError:
+            continue
+
+        entry = cached_dirs.get(rel_path)
+        if entry is None or entry["mtime"] != mtime:
+            entry = _scan_directory(abs_path, mtime, ignore_patterns)
+            if entry is None:
+                continue
+        dirs[rel_path] = entry
+
+        # The root itself is never treated as a repository; only what's below it
+        if entry["repo"] and rel_path != ".":
+            repos.append(rel_path)
+            continue
+        stack.extend(
+            os.path.normpath(os.path.join(rel_path, child))
+            for child in entry["children"]
+        )
+    return sorted(repos), dirs
+
+
+def discover_repositories(
+    root: str = ".",
+    ignore_patterns: tuple[str, ...] = DEFAULT_IGNORE_PATTERNS,
+    use_index: bool = True,
+) -> list[str]:
+    """
+    Walk root recursively and return the paths of all git repositories below it,
+    sorted and prefixed with root (e.g. `./team-a/service`).
+
+    The walk stops descending at each repository and skips directories matching
+    ignore_patterns. Every directory visited is recorded in an on-disk index
+    together with its mtime, so a later run only lists the directories whose
+    contents changed and otherwise just stats the known ones. A running daemon
+    keeps that index in memory instead.
+    """
+    abs_root = os.path.abspath(root)
+    ignore_patterns = tuple(ignore_patterns)
+    repos = None
+    if use_index:
+        repos = daemon.request(
+            "repositories", root=abs_root, ignore=list(ignore_patterns)
+        )
+    if repos is None:
+        cached_dirs = _load_index(abs_root, ignore_patterns) if use_index else {}
+        repos, dirs = walk_repositories(abs_root, ignore_patterns, cached_dirs)
+        if use_index and dirs != cached_dirs:
+            _save_index(abs_root, ignore_patterns, dirs)
+
+    return [os.path.join(root, rel_path) for rel_path in repos]
@@ -0,0 +1,94 @@
+"""
+One-shot probe of a repository's state: whether it is a repository at all, its
+checked out branch, the branch's upstream, how far ahead and behind it is and
+whether tracked files have changes. All of it comes from a single
+`git status --porcelain=v2 --branch --untracked-files=no`.
+"""
+
+from dataclasses import dataclass
+
+from cli_utils import utils
+
+
+@dataclass
+class RepoStatus:
+    # None when HEAD is detached
+    branch: str | None
+    # The remote-tracking branch, e.g. origin/main
+    upstream: str | None = None
+    # Commits relative to upstream as of the last fetch
+    ahead: int = 0
+    behind: int = 0
+    # Staged or unstaged changes to tracked files
+    dirty: bool = False
+
+
+def probe_command(path: str) -> list[str]:
+    # Untracked files are what makes status slow on big repositories, and
+    # optional locks would make the probe write the index
+    return [
+        "git",
+        "--no-optional-locks",
+        "-C",
+        path,
+        "status",
+        "--porcelain=v2",
+        "--branch",
+        "--untracked-files=no",
+    ]
+
+
+def parse_status(output: str) -> RepoStatus:
+    status = RepoStatus(branch=None)
+    for line in output.splitlines():
+        if not line.startswith("# "):
+            status.dirty = True
+            continue
+        key, _, value = line[2:].partition(" ")
+        if key == "branch.head" and value != "(detached)":
+            status.branch = value
+        elif key == "branch.upstream":
+            status.upstream = value
+        elif key == "branch.ab":
+            ahead, behind = value.split()
+            status.ahead, status.behind = int(ahead), -int(behind)
+    return status
+
+
+def probe_repository(path: str) -> RepoStatus | None:
+    """The state of the repository at path, or nothing if it isn't one"""
+    return_code, output, _ = utils.run_git_command(probe_command(path))
+    return parse_status(output) if return_code == 0 else None
+
+
+def probe_repositories(paths: list[str]) -> dict[str, RepoStatus | None]:
+    """probe_repository for all the paths at once, on the shared git runner"""
+    results = utils.run_git_commands([probe_command(path) for path in paths])
+    return {
+        path: parse_status(output) if return_code == 0 else None
+        for path, (return_code, output, _) in zip(paths, results)
+    }
+
+
+def print_status_table(statuses: dict[str, RepoStatus | None], actions: dict) -> None:
+    """Table of the probed state of each repository and what is done with it"""
+    rows = [("repository", "branch", "upstream", "ahead/behind", "changes", "action")]
+    for path, status in statuses.items():
+        if status is None:
+            rows.append((path, "-", "-", "-", "-", actions[path]))
+            continue
+        rows.append(
+            (
+                path,
+                status.branch or "(detached)",
+                status.upstream or "-",
+                f"+{status.ahead} -{status.behind}" if status.upstream else "-",
+                "yes" if status.dirty else "no",
+                actions[path],
+            )
+        )
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    for row in rows:
+        print(
+            "  ".join(f"{cell:<{width}}" for cell, width in zip(row, widths)).rstrip()
+        )
@@ -0,0 +1,170 @@
+"""
+Timing trace of every git invocation.
+run_git_command records each command with the phase and branch it ran for
+(set with the `phase` context manager). A run can be exported in Chrome
+trace-event format (chrome://tracing, Perfetto) and summarised per phase
+and per branch.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterator
+
+DEFAULT_PHASE = "setup"
+
+_context = threading.local()
+
+
+@dataclass
+class TraceEvent:
+    """One git invocation"""
+
+    command: list[str]
+    phase: str
+    branch: str | None
+    started: float
+    duration: float
+    returncode: int
+    thread_id: int
+
+
+class Tracer:
+    """Collects TraceEvents of one run. Thread safe."""
+
+    def __init__(self):
+        self.events: list[TraceEvent] = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(
+        self, command: list[str], started: float, duration: float, returncode: int
+    ) -> None:
+        event = TraceEvent(
+            command=list(command),
+            phase=getattr(_context, "phase", DEFAULT_PHASE),
+            branch=getattr(_context, "branch", None),
+            started=started,
+            duration=duration,
+            returncode=returncode,
+            thread_id=threading.get_ident(),
+        )
+        with self._lock:
+            self.events.append(event)
+
+    def to_chrome_trace(self) -> dict:
+        """Complete ("X") events with microsecond timestamps relative to the start"""
+        thread_numbers = {}
+        trace_events = []
+        for event in self.events:
+            tid = thread_numbers.setdefault(event.thread_id, len(thread_numbers) + 1)
+            trace_events.append(
+                {
+                    "name": " ".join(event.command[:3]),
+                    "cat": event.phase,
+                    "ph": "X",
+                    "ts": round((event.started - self.started) * 1_000_000),
+                    "dur": round(event.duration * 1_000_000),
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {
+                        "command": event.command,
+                        "phase": event.phase,
+                        "branch": event.branch,
+                        "exit_code": event.returncode,
+                    },
+                }
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as trace_file:
+            json.dump(self.to_chrome_trace(), trace_file, indent=1)
+
+    def print_summary(self) -> None:
+        """Table of git time per phase and per branch"""
+        wall_seconds = time.perf_counter() - self.started
+        git_seconds = sum(event.duration for event in self.events)
+        print(
+            f"\nTrace: {len(self.events)} git commands, {git_seconds:.2f}s in git, "
+            f"{wall_seconds:.2f}s wall time"
+        )
+        for title, key in (
+            ("phase", lambda event: event.phase),
+            ("branch", lambda event: event.branch or "-"),
+        ):
+            totals = defaultdict(lambda: [0, 0.0])
+            for event in self.events:
+                totals[key(event)][0] += 1
+                totals[key(event)][1] += event.duration
+            width = max([len(title)] + [len(name) for name in totals])
+            print(f"{title:<{width}}  {'commands':>8}  {'seconds':>8}  {'share':>6}")
+            for name, (count, seconds) in sorted(
+                totals.items(), key=lambda item: -item[1][1]
+            ):
+                share = seconds / git_seconds * 100 if git_seconds else 0.0
+                print(f"{name:<{width}}  {count:>8}  {seconds:>8.2f}  {share:>5.1f}%")
+
+
+_tracer: Tracer | None = None
+
+
+def start_tracing() -> Tracer:
+    """Start recording git commands for this process"""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing() -> Tracer | None:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def record(command: list[str], started: float, duration: float, returncode: int):
+    """Record a git command, if tracing is on"""
+    if _tracer is not None:
+        _tracer.record(command, started, duration, returncode)
+
+
+@contextlib.contextmanager
+def phase(name: str, branch: str | None = None) -> Iterator[None]:
+    """
+    Attribute the git commands run inside this block (on this thread)
+    to a phase such as checkout, pull, merge, push or cleanup, and a branch.
+    """
+    previous = (
+        getattr(_context, "phase", DEFAULT_PHASE),
+        getattr(_context, "branch", None),
+    )
+    _context.phase = name
+    if branch is not None:
+        _context.branch = branch
+    try:
+        yield
+    finally:
+        _context.phase, _context.branch = previous
+
+
+@contextlib.contextmanager
+def tracing(path: str | None) -> Iterator[None]:
+    """
+    Trace the block if path is given: writes the Chrome trace to path
+    and prints the summary table when the block ends.
+    """
+    if not path:
+        yield
+        return
+    tracer = start_tracing()
+    try:
+        yield
+    finally:
+        stop_tracing()
+        tracer.write_chrome_trace(path)
+        tracer.print_summary()
+        print(f"Trace written to {path}")
@@ -1,6 +1,21 @@
 """Utility functions"""
 
-import subprocess
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+from cli_utils import fetching, git_process, trace
+
+if TYPE_CHECKING:
+    from cli_utils.ref_index import RefIndex
+
+GLOB_CHARACTERS = "*?["
+# Commands that can run for long or print a lot
+STREAMED_COMMANDS = {"fetch", "pull", "merge", "rebase", "cherry-pick", "push"}
 
 
 class ConflictHandleScenario:
@@ -13,37 +28,198 @@ class PullConfigChoice:
     RebaseLocalToRemote = "RebaseLocalToRemote"
 
 
-def run_git_command(cmd: str) -> tuple[int, str]:
-    """Run a GIT subprocess command in a users terminal"""
-    result = subprocess.run(
-        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+def _live_output_writer():
+    """
+    Echoes streamed git output to the terminal, progress meters included.
+    Only from the main thread, where the output can't interleave with
+    concurrent jobs, and only to a terminal.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return None
+    if not sys.stderr.isatty():
+        return None
+    return git_process.write_to_terminal
+
+
+def _print_git_errors(stderr: str) -> None:
+    """Print a failed streamed command's errors, unless the terminal showed them live"""
+    if _live_output_writer() is None:
+        print(stderr.strip())
+
+
+def run_git_command(
+    args: list[str],
+    cwd: str | None = None,
+    env: dict[str, str] | None = None,
+    input: str | None = None,
+    on_output: Callable[[str, str], None] | None = None,
+) -> git_process.GitResult:
+    """
+    Run a GIT subprocess command, given as an argument vector (no shell).
+    Returns (returncode, stdout, stderr).
+    cwd runs it in another directory, e.g. a temporary worktree.
+    env adds environment variables on top of the current environment.
+    input is written to the command's stdin.
+    Every call is timed and recorded when tracing is on.
+    Long-running commands (see STREAMED_COMMANDS) are streamed: their output
+    is shown live in a terminal, or handed to on_output, and only its tail
+    is returned. Streaming leaves stdin alone, so a command given input is
+    run to completion and returned whole instead.
+    """
+    started = time.perf_counter()
+    if input is None and git_process.subcommand(args) in STREAMED_COMMANDS:
+        result = git_process.stream_git(
+            args, cwd=cwd, env=env, on_output=on_output or _live_output_writer()
+        )
+    else:
+        result = git_process.run_git(args, cwd=cwd, env=env, input=input)
+    trace.record(args, started, time.perf_counter() - started, result.returncode)
+    return result
+
+
+def run_git_commands(
+    commands: list[list[str] | git_process.GitCommand], timeout: float | None = None
+) -> list[git_process.GitResult]:
+    """
+    Run independent GIT commands concurrently on the shared asyncio runner
+    (see git_process.run_git_concurrently) and return their results in order.
+    Commands are given as for run_git_command, or as git_process.GitCommand
+    for a cwd, env or input. Nothing is streamed. A command running longer
+    than timeout seconds is killed. Every command is timed and recorded
+    when tracing is on, in the phase of the calling thread.
+    """
+
+    def record(args, started, seconds, result):
+        trace.record(args, started, seconds, result.returncode)
+
+    return git_process.run_git_concurrently(
+        commands, timeout=timeout, on_finished=record
     )
-    # result.stderr.decode("utf-8"),
-    return (result.returncode, result.stdout.decode("utf-8"))
+
+
+def object_exists(rev: str) -> bool:
+    """Checks that a revision (commit, ref, ...) exists, without spawning a process"""
+    return git_process.get_object_reader().exists(rev)
+
+
+def resolve_object(rev: str) -> str | None:
+    """The SHA a revision points to, or None if it doesn't exist, without spawning a process"""
+    resolved = git_process.get_object_reader().resolve(rev)
+    return resolved[0] if resolved else None
+
+
+def has_remote_branch(branch: str) -> bool:
+    """Whether branch has a remote-tracking ref (origin/<branch>)"""
+    return object_exists(f"refs/remotes/origin/{branch}")
+
+
+def resolve_commit(spec: str) -> str | None:
+    """
+    The full SHA of the commit a spec such as HEAD, a branch or @~1 names, or
+    None if it doesn't name a commit. Resolved once, so that running the
+    cherry-pick later (on another branch, in a worktree) can't change it.
+    """
+    return resolve_object(f"{spec}^{{commit}}")
+
+
+def get_cache_dir(*parts: str) -> str:
+    """
+    Return the gitutils cache directory (or a sub-directory of it),
+    creating it if needed. Honours XDG_CACHE_HOME.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    path = os.path.join(cache_home, "gitutils-cli", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_json_atomically(path: str, data, indent: int | None = None) -> bool:
+    """
+    Write data as JSON to path through a temporary file renamed into place, so
+    a concurrent or interrupted run never reads half a file. Returns False,
+    leaving any previous file as it was, if it couldn't be written.
+    """
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(data, tmp_file, indent=indent)
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        return False
 
 
 def get_current_branch() -> str:
-    return run_git_command("git branch --show-current")[1].strip()
+    return run_git_command(["git", "branch", "--show-current"])[1].strip()
 
 
-def get_all_remote_branches_set() -> set[str]:
-    """Return a set of all remote branches that are available in this repo"""
-    all_branches_raw = run_git_command("git branch -a")[1].split("\n")
-    # The raw branches look like: remotes/origin/actual-branch-name
-    all_branches = [
-        branch.replace("remotes/origin/", "").strip() for branch in all_branches_raw
-    ]
-    return set(all_branches)
+def is_pattern(branch: str) -> bool:
+    """Whether a branch name entered by the user is a glob pattern"""
+    return any(character in branch for character in GLOB_CHARACTERS)
 
 
-def get_input_commit_from_user() -> str | None:
-    """Gets a commit from a user and verifies it"""
-    commit = input("Please enter the commit id you would like to batch cherry-pick: ")
-    return_code, _ = run_git_command(f"git rev-parse {commit}")
-    if return_code != 0:
-        print(f"Commit {commit} does not exist. Stopping program.")
+def resolve_commits(specs: list[str]) -> list[str]:
+    """
+    Turn commits and A..B ranges into the full SHAs of the commits to apply,
+    in the order given. A range is expanded like `git cherry-pick A..B` would:
+    the commits reachable from B but not from A, oldest first. Raises
+    ValueError naming the first invalid entry.
+    """
+    commits = []
+    for spec in specs:
+        if ".." not in spec:
+            commit = resolve_commit(spec)
+            if commit is None:
+                raise ValueError(f"Commit {spec} does not exist.")
+            commits.append(commit)
+            continue
+        return_code, stdout, _ = run_git_command(
+            ["git", "rev-list", "--reverse", "--parents", spec]
+        )
+        if return_code != 0:
+            raise ValueError(f"Range {spec} is not valid.")
+        revisions = [line.split() for line in stdout.splitlines() if line.strip()]
+        if not revisions:
+            raise ValueError(f"Range {spec} has no commits.")
+        merges = [revision[0] for revision in revisions if len(revision) > 2]
+        if merges:
+            raise ValueError(
+                f"Range {spec} contains merge commits, which can't be cherry-picked: "
+                f"{', '.join(merges)}"
+            )
+        commits.extend(revision[0] for revision in revisions)
+    return commits
+
+
+def get_input_commits_from_user() -> list[str] | None:
+    """Gets commits and commit ranges (A..B) from a user and verifies them"""
+    specs = input(
+        "Please enter the commit id you would like to batch cherry-pick "
+        "(or several ids and A..B ranges, separated by spaces): "
+    ).split()
+    if not specs:
+        print("No commit entered. Stopping program.")
         return None
-    return commit
+    try:
+        commits = resolve_commits(specs)
+    except ValueError as e:
+        print(f"{e} Stopping program.")
+        return None
+    if len(commits) > 1:
+        # Only a single range is sorted, anything else keeps the order given
+        order = "oldest first" if len(specs) == 1 else "in this order"
+        print(f"Cherry-picking {len(commits)} commits, {order}:")
+        for commit in commits:
+            print(commit)
+    return commits
 
 
 def get_input_pull_config_from_user() -> PullConfigChoice:
@@ -70,10 +246,13 @@ def get_input_pull_config_from_user() -> PullConfigChoice:
 
 
 def get_input_branches_from_user(
-    remote_branches: set[str],
+    remote_branches: "RefIndex",
     allow_only_one_input_branch: bool = False,
 ) -> list[str] | None:
-    """Gets branches from user and checks that those branches are legit."""
+    """
+    Gets branches from user and checks that those branches are legit.
+    Glob patterns such as `release/*` are expanded to all matching branches.
+    """
     branches = []
     first_branch = input(
         "Please enter the first branch name or press ENTER for default of current branch: "
@@ -81,10 +260,19 @@ def get_input_branches_from_user(
     if not first_branch:
         first_branch = get_current_branch()
         print(f"Using the current branch as the first branch: {first_branch}")
+        branches.append(first_branch)
+    elif is_pattern(first_branch):
+        matches = remote_branches.match(first_branch)
+        if not matches:
+            print(f"No branches match {first_branch}. Stopping program.")
+            return None
+        print(f"Pattern {first_branch} matched: {', '.join(matches)}")
+        branches.extend(matches)
     elif first_branch not in remote_branches:
         print(f"Branch {first_branch} does not exist. Stopping program.")
         return None
-    branches.append(first_branch)
+    else:
+        branches.append(first_branch)
 
     while True:
         branch = input(
@@ -94,6 +282,15 @@ def get_input_branches_from_user(
         if not branch:
             break
 
+        if is_pattern(branch):
+            matches = remote_branches.match(branch)
+            if not matches:
+                print(f"No branches match {branch}. Skipping...")
+                continue
+            print(f"Pattern {branch} matched: {', '.join(matches)}")
+            branches.extend(matches)
+            continue
+
         if branch not in remote_branches:
             print(f"Branch {branch} does not exist. Skipping...")
             continue
@@ -111,60 +308,177 @@ def get_input_branches_from_user(
     return branches
 
 
-def checkout_and_pull_branch(branch: str, pull_choice: PullConfigChoice) -> None:
-    """Git checkout and pull branch from remote"""
+def prefetch_branches(branches: list[str]) -> bool:
+    """
+    Fetch all the given branches from remote in a single round trip,
+    updating their remote-tracking refs (origin/<branch>).
+    Branches that only exist locally have nothing to fetch and are left out.
+    Returns False if the fetch failed.
+    """
+    # Imported here: ref_index is built on this module
+    from cli_utils import ref_index
+
+    refs = ref_index.load_ref_index()
+    remote_branches = [branch for branch in branches if refs.is_remote(branch)]
+    local_only = [branch for branch in branches if branch not in remote_branches]
+    if local_only:
+        print(f"Only local, nothing to fetch: {', '.join(local_only)}")
+    if not remote_branches:
+        return True
+    refspecs = [
+        f"+refs/heads/{branch}:refs/remotes/origin/{branch}"
+        for branch in remote_branches
+    ]
+    print(f"Fetching {len(remote_branches)} branches from remote...")
+    with trace.phase("fetch"):
+        return_code, _, stderr = run_git_command(
+            fetching.fetch_command("origin", *refspecs)
+        )
+    if return_code != 0:
+        _print_git_errors(stderr)
+        print("...Fetch failed. Each branch will be pulled separately instead.")
+        return False
+    print(f"...Fetched all branches ({fetching.parse_transfer_stats(stderr)})")
+    return True
+
+
+def checkout_and_pull_branch(
+    branch: str, pull_choice: PullConfigChoice, prefetched: bool = False
+) -> None:
+    """
+    Git checkout and pull branch from remote.
+    If the branch was already fetched with prefetch_branches, only the local
+    remote-tracking ref is used and no round trip to the remote is made.
+    Otherwise only this branch is fetched.
+    """
     print(f"Checking out branch: {branch}...")
-    run_git_command(f"git checkout {branch}")
+    with trace.phase("checkout", branch):
+        run_git_command(["git", "checkout", branch])
     print(f"...Checked out {branch}")
-
-    if pull_choice == PullConfigChoice.RebaseLocalToRemote:
-        print(f"Pulling branch with --rebase: {branch}...")
-        run_git_command(f"git pull --rebase origin {branch}")
-    elif pull_choice == PullConfigChoice.ResetToRemote:
-        print(f"Resetting local to remote branch: {branch} before applying changes.")
-        run_git_command("git fetch origin")
-        run_git_command(f"git reset --hard origin/{branch}")
+    if prefetched and not has_remote_branch(branch):
+        print(f"...{branch} only exists locally, nothing to pull")
+        return
+
+    with trace.phase("pull", branch):
+        if pull_choice == PullConfigChoice.RebaseLocalToRemote:
+            print(f"Pulling branch with --rebase: {branch}...")
+            if prefetched:
+                run_git_command(["git", "rebase", f"origin/{branch}"])
+            else:
+                _, _, stderr = run_git_command(
+                    fetching.pull_command("--rebase", "origin", branch)
+                )
+                print(f"...Transferred {fetching.parse_transfer_stats(stderr)}")
+        elif pull_choice == PullConfigChoice.ResetToRemote:
+            print(
+                f"Resetting local to remote branch: {branch} before applying changes."
+            )
+            if not prefetched:
+                _, _, stderr = run_git_command(
+                    fetching.fetch_command(
+                        "origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}"
+                    )
+                )
+                print(f"...Transferred {fetching.parse_transfer_stats(stderr)}")
+            run_git_command(["git", "reset", "--hard", f"origin/{branch}"])
     print(f"...Pulled {branch}")
 
 
-def push_branch_to_remote(branch: str) -> None:
-    """Git push branch to remote"""
+def push_branch_to_remote(branch: str, refspec: str | None = None) -> bool:
+    """
+    Git push branch to remote. Returns False if the push failed.
+    refspec pushes something else than the local branch, e.g. <sha>:refs/heads/<branch>.
+    """
     print(f"Pushing branch to remote: {branch}...")
-    run_git_command(f"git push origin {branch}")
+    with trace.phase("push", branch):
+        return_code, _, stderr = run_git_command(
+            ["git", "push", "origin", refspec or branch]
+        )
+    if return_code != 0:
+        _print_git_errors(stderr)
+        print(f"...Failed to push to remote: {branch}")
+        return False
     print(f"...Pushed to remote: {branch}")
+    return True
+
+
+def push_branches_atomically(refspecs: list[str]) -> bool:
+    """
+    Push several branches to remote over a single connection with --atomic:
+    either every branch is updated on remote or none of them is.
+    refspecs are branch names or <sha>:refs/heads/<branch>.
+    """
+    print(f"Pushing {len(refspecs)} branches to remote atomically...")
+    with trace.phase("push"):
+        return_code, _, stderr = run_git_command(
+            ["git", "push", "--atomic", "origin", *refspecs]
+        )
+    if return_code != 0:
+        _print_git_errors(stderr)
+        print("...Atomic push was rejected")
+        return False
+    print("...Pushed all branches to remote")
+    return True
+
+
+def report_atomic_push(branches: list[str], succeeded: bool) -> None:
+    """Prints the outcome of push_branches_atomically for the end of run summary"""
+    if not branches:
+        print("Atomic push: nothing to push.")
+    elif succeeded:
+        print(f"Atomic push succeeded for all {len(branches)} branches:")
+        for branch in branches:
+            print(branch)
+    else:
+        print(
+            f"Atomic push was rejected as a whole. None of these {len(branches)} "
+            "branches were updated on remote:"
+        )
+        for branch in branches:
+            print(branch)
 
 
 def handle_conflicts(
-    prior_branch: str, current_branch: str, conflict_branches: list[str]
+    prior_branch: str,
+    current_branch: str,
+    conflict_branches: list[str],
+    decision: str | None = None,
 ) -> ConflictHandleScenario:
     """
     Git conflict handler. Mutates a list of conflict_branches
-    and returns ConflictHandleScenario decision
+    and returns ConflictHandleScenario decision.
+    decision answers the prompt up front ('yes' or ''), e.g. from a plan file.
     """
     print(f"Conflict detected: {current_branch}")
 
-    decision = input(
-        f"Do you want to override changes from the current branch: {current_branch} with changes from prior branch {prior_branch}? \nType 'yes' if you are sure. \nENTER to safely ignore this conflict. \nor CTRL+C to stop program: "
-    )
+    if decision is None:
+        decision = input(
+            f"Do you want to override changes from the current branch: {current_branch} with changes from prior branch {prior_branch}? \nType 'yes' if you are sure. \nENTER to safely ignore this conflict. \nor CTRL+C to stop program: "
+        )
 
     conflict_decision = None
 
     if decision.strip().lower() == "yes":
         print("...Handling conflicts using the --theirs strategy.")
-        run_git_command("git checkout --theirs .")
+        run_git_command(["git", "checkout", "--theirs", "."])
         print("...adding prior branch changes.")
-        run_git_command("git add .")
+        run_git_command(["git", "add", "."])
         print(
             "...commiting changes. This might take a while if you have pre-commit running."
         )
         run_git_command(
-            f"git commit -m 'Resolved merge conflicts by accepting all changes from {prior_branch}'"
+            [
+                "git",
+                "commit",
+                "-m",
+                f"Resolved merge conflicts by accepting all changes from {prior_branch}",
+            ]
         )
         print("...changes commited!")
         conflict_decision = ConflictHandleScenario.Theirs
     else:
         conflict_branches.append(current_branch)
-        run_git_command("git merge --abort")
+        run_git_command(["git", "merge", "--abort"])
         conflict_decision = ConflictHandleScenario.Abort
 
     assert conflict_decision
@@ -173,7 +487,8 @@ def handle_conflicts(
 
 def perform_clean_up(original_branch: str, conflict_branches: list[str]) -> None:
     """Checks out the original branch and prints any conflicting branches to user"""
-    run_git_command(f"git checkout {original_branch}")
+    with trace.phase("cleanup", original_branch):
+        run_git_command(["git", "checkout", original_branch])
     print(f"Back to original branch: {original_branch}")
 
     if conflict_branches:
@@ -0,0 +1,51 @@
+"""Temporary git worktrees, so branches can be changed without touching the user's checkout"""
+
+import contextlib
+import shutil
+import tempfile
+import threading
+from typing import Iterator
+
+from cli_utils import trace, utils
+
+# `git worktree add/remove` edit shared metadata under .git/worktrees,
+# so they are serialised. Everything run inside a worktree can go in parallel.
+_WORKTREE_LOCK = threading.Lock()
+
+
+class WorktreeError(Exception):
+    """Raised when a temporary worktree can't be created"""
+
+
+@contextlib.contextmanager
+def worktree_root() -> Iterator[str]:
+    """Temporary directory holding all worktrees of one run. Prunes leftovers on exit."""
+    root = tempfile.mkdtemp(prefix="gitutils-worktrees-")
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        with trace.phase("cleanup"), _WORKTREE_LOCK:
+            utils.run_git_command(["git", "worktree", "prune"])
+
+
+@contextlib.contextmanager
+def temporary_worktree(commitish: str, root: str) -> Iterator[str]:
+    """
+    Check out commitish with a detached HEAD in a new worktree below root.
+    Yields the worktree path and removes the worktree afterwards.
+    """
+    path = tempfile.mkdtemp(prefix="wt-", dir=root)
+    with trace.phase("checkout"), _WORKTREE_LOCK:
+        return_code, _, _ = utils.run_git_command(
+            ["git", "worktree", "add", "--detach", path, commitish]
+        )
+    if return_code != 0:
+        shutil.rmtree(path, ignore_errors=True)
+        raise WorktreeError(f"Could not create a worktree for {commitish}")
+    try:
+        yield path
+    finally:
+        with trace.phase("cleanup"), _WORKTREE_LOCK:
+            utils.run_git_command(["git", "worktree", "remove", "--force", path])
+        shutil.rmtree(path, ignore_errors=True)
@@ -10,9 +10,11 @@ setup(
     packages=find_packages(),
     entry_points={
         "console_scripts": [
-            "gitutils-merge=cli.git_batch_merger:git_batch_merger",
-            "gitutils-cherry-pick=cli.git_batch_cherry_picker:git_batch_cherry_picker",
-            "gitutils-batch-pull=cli.git_batch_puller:git_batch_puller",
+            "gitutils-merge=cli.entry_points:merge",
+            "gitutils-cherry-pick=cli.entry_points:cherry_pick",
+            "gitutils-batch-pull=cli.entry_points:batch_pull",
+            "gitutils-plan=cli.entry_points:plan",
+            "gitutils-daemon=cli.entry_points:daemon",
         ],
     },
 )